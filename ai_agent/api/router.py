@@ -1,6 +1,29 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException
-from pydantic import BaseModel  # Pydantic 用于数据验证和序列化
-from services.pipeline import process_voice_record
+import asyncio
+import os
+import secrets
+import shutil
+from datetime import datetime, timedelta
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field  # Pydantic 用于数据验证和序列化
+from starlette.background import BackgroundTask
+from starlette.datastructures import UploadFile
+from core.config import settings
+from services import events, job_queue, profiling, streaming
+from services.admission import admission
+from core.database import (
+    async_pool_stats,
+    async_session_scope,
+    get_record_timings_async,
+    pool_stats,
+    timing_percentiles_async,
+)
+from core.profile_cache import profile_cache
+
+# asr_whisper / tts_cosy 导入时向模型注册表登记 whisper / cosyvoice (不加载模型)
+from core import asr_whisper, models, tts_cosy, tracing  # noqa: F401
 
 router = APIRouter()
 
@@ -11,6 +34,8 @@ class ProcessRequest(BaseModel):
     record_id: int
     user_id: int
     minio_key: str
+    # interactive: 患者实时录音; retry: Go 后端重试; batch: 批量重跑/数据集任务
+    priority: Literal["interactive", "retry", "batch"] = "interactive"
 
 
 class ProcessResponse(BaseModel):
@@ -18,26 +43,409 @@ class ProcessResponse(BaseModel):
 
     message: str
     record_id: int
+    job_id: int | None = None
+    deduplicated: bool = False  # 命中已有任务或记录已完成, 未新建任务
+
+
+class BatchItem(BaseModel):
+    """批量请求中的一条记录"""
+
+    record_id: int
+    user_id: int
+    minio_key: str
+
+
+class BatchProcessRequest(BaseModel):
+    """批量处理请求: 重跑脚本/数据集任务一次提交多条记录"""
+
+    items: list[BatchItem] = Field(min_length=1, max_length=settings.BATCH_MAX_SIZE)
+    priority: Literal["interactive", "retry", "batch"] = "batch"
+
+
+class BatchProcessResponse(BaseModel):
+    """批量处理响应"""
+
+    message: str
+    batch_id: str
+    accepted: int
+    job_ids: list[int]
+    skipped: list[int] = []  # 记录不存在, 未入队
+    completed: list[int] = []  # 记录已完成, 未入队
+    deduplicated: list[int] = []  # 已有未结束的任务, 挂到该任务上 (不计入本批次进度)
+    failed: list[int] = []  # 入队失败, 记录状态未改动, 可重新提交
+
 
 # 下面函数运行完后，把结果转换成processresponse返回给调用方
 @router.post("/process", response_model=ProcessResponse)
-async def process_voice(request: ProcessRequest, background_tasks: BackgroundTasks):
+async def process_voice(request: ProcessRequest, http_request: Request):
     """
     接收 Go 后端语音处理请求, 异步处理语音记录
 
     - Go 后端上传语音文件到 MinIO 后, 调用此接口
-    - 返回后立即开始后台处理
+    - 任务写入持久化队列后立即返回, 由 worker 池执行; agent 重启不会丢任务
+    - 队列饱和返回 429, worker 未就绪返回 503, 均带 Retry-After
+    - priority 决定调度顺序: interactive 先执行, retry/batch 排队越久越靠前 (老化)
+    - 幂等: 同一记录+音频已有未结束的任务时返回该任务, 记录已完成时直接返回, 均不重复处理
     - 前端 SSE 轮询 Go 后端获取处理状态和结果
+    - 请求头中的 traceparent 随任务保存, 处理链路的 span 接在 Go 的调用之下
+    """
+    await admission.admit()
+    job = await job_queue.submit(
+        request.record_id,
+        request.user_id,
+        request.minio_key,
+        request.priority,
+        http_request.headers.get("traceparent"),
+    )
+
+    if job is None:
+        return ProcessResponse(
+            message="记录已处理完成", record_id=request.record_id, deduplicated=True
+        )
+    return ProcessResponse(
+        message="任务已在处理中" if job.deduplicated else "处理任务已提交",
+        record_id=request.record_id,
+        job_id=job.id,
+        deduplicated=job.deduplicated,
+    )
+
+
+@router.post("/process/stream")
+async def process_stream(
+    request: Request, record_id: int, user_id: int, minio_key: str
+):
+    """
+    同步流式处理: 请求体直接携带音频, 响应 (NDJSON) 依次返回 ASR 文本、LLM 决策与 TTS 音频
+
+    - 音频可用 multipart (file 字段) 或原始请求体 (可 chunked) 上传; record_id/user_id/
+      minio_key 放在查询参数里, 含义与 /process 相同, 记录需由 Go 后端预先创建
+    - 事件: asr -> llm -> tts_audio (base64 分片) -> done, 失败时为 error
+    - 不进任务队列; 没有空闲执行槽位时返回 429 + Retry-After, 由调用方退回 /process
+    - MinIO 上传与数据库写入在后台完成, 完成后照常发布 completed 进度事件
     """
-    # 添加到后台任务队列
-    background_tasks.add_task(
-        process_voice_record, request.record_id, request.minio_key, request.user_id
+    admission.require_free_slot()
+    # Content-Length 只用于提前拒绝; 实际大小由 save_upload 边读边计数限制
+    content_length = request.headers.get("content-length")
+    if content_length:
+        try:
+            declared = int(content_length)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Content-Length 无效")
+        if declared > settings.STREAM_MAX_AUDIO_BYTES:
+            raise HTTPException(status_code=413, detail="音频超过大小上限")
+
+    suffix = os.path.splitext(minio_key)[1] or ".wav"
+    try:
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            if not isinstance(upload, UploadFile):
+                raise HTTPException(status_code=400, detail="缺少 file 字段")
+            audio_path = await streaming.save_upload(
+                streaming.iter_upload(upload), suffix
+            )
+        else:
+            audio_path = await streaming.save_upload(request.stream(), suffix)
+    except streaming.AudioTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(
+        streaming.stream_process(audio_path, record_id, user_id, minio_key),
+        media_type=streaming.MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/process/batch", response_model=BatchProcessResponse)
+async def process_batch(request: BatchProcessRequest, http_request: Request):
+    """
+    批量提交语音处理任务
+
+    - 一次 IN 查询预取用户画像, 一条 INSERT 整批入队, 同一事务里一条 UPDATE 标记新任务的记录
+    - 同一批次内重复的 record_id 只处理一次, 不存在的记录跳过并在 skipped 中返回
+    - 已完成的记录 (completed) 与已有未结束任务的记录 (deduplicated) 不重复处理
+    - 返回 batch_id, 用 GET /batches/{batch_id} 一次查询整批进度
+    """
+    items = list(
+        {
+            item.record_id: (item.record_id, item.user_id, item.minio_key)
+            for item in request.items
+        }.values()
+    )
+    await admission.admit(len(items))
+    submission = await job_queue.submit_batch(
+        items, request.priority, http_request.headers.get("traceparent")
+    )
+    if len(submission.skipped) == len(items):
+        raise HTTPException(status_code=404, detail="批次中的记录均不存在")
+
+    new_jobs = [job for job in submission.jobs if not job.deduplicated]
+    return BatchProcessResponse(
+        message="批量任务已提交",
+        batch_id=submission.batch_id,
+        accepted=len(new_jobs),
+        job_ids=[job.id for job in new_jobs],
+        skipped=submission.skipped,
+        completed=submission.completed,
+        deduplicated=[job.record_id for job in submission.jobs if job.deduplicated],
+        failed=submission.failed,
+    )
+
+
+@router.get("/batches/{batch_id}")
+async def batch_progress(batch_id: str):
+    """批次进度: 各状态任务数 (queued/running/done/failed) 与失败记录的错误信息"""
+    progress = await job_queue.broker.batch_progress(batch_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="批次不存在")
+    return progress
+
+
+@router.get("/records/{record_id}/events")
+async def record_events(record_id: int, request: Request):
+    """
+    SSE 推送单条记录的处理进度, 由流水线直接发布, 不轮询数据库
+
+    - 连接后先推当前状态 (最近事件或数据库快照), 之后推 asr_started / asr_done /
+      llm_done / tts_ready / completed / error, 终态事件后关闭
+    """
+    return StreamingResponse(
+        events.sse_stream(record_id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
-    return ProcessResponse(message="处理任务已提交", record_id=request.record_id)
+
+@router.get("/records/{record_id}/timings")
+async def record_timings(record_id: int):
+    """
+    单条记录每次处理的分阶段耗时 (秒): queue_wait / download / asr / llm (含重试) /
+    tts / upload / db / total, 以及音频时长与实时率 rtf
+    """
+    async with async_session_scope() as db:
+        timings = await get_record_timings_async(db, record_id)
+    if not timings:
+        raise HTTPException(status_code=404, detail="没有该记录的耗时数据")
+    return {"record_id": record_id, "runs": timings}
+
+
+@router.get("/stats/timings")
+async def timing_percentiles(
+    group_by: Literal["day", "user"] = "day",
+    days: int = Query(7, ge=1, le=90),
+    user_id: int | None = None,
+):
+    """最近 days 天各阶段耗时的 p50/p90/p99, 按天或按用户分组, 用于跟踪实时率回归"""
+    since = datetime.utcnow() - timedelta(days=days)
+    async with async_session_scope() as db:
+        groups = await timing_percentiles_async(db, group_by, since, user_id)
+    return {"group_by": group_by, "since": since.isoformat(), "groups": groups}
+
+
+@router.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """按 trace_id 查询 span (TRACE_EXPORTER=memory 时可用, 只保留最近的 span)"""
+    if not isinstance(tracing.exporter, tracing.InMemoryExporter):
+        raise HTTPException(status_code=404, detail="未启用内存追踪导出")
+    spans = tracing.exporter.get_trace(trace_id.lower())
+    if not spans:
+        raise HTTPException(status_code=404, detail="trace 不存在或已被淘汰")
+    return {"trace_id": trace_id, "spans": spans}
+
+
+def require_profiling(request: Request):
+    """剖析接口开关与鉴权: 未开启或未配置口令时返回 404, 否则校验 X-Admin-Token"""
+    if not settings.PROFILING_ENABLED or not settings.PROFILING_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(
+        request.headers.get("X-Admin-Token", ""), settings.PROFILING_TOKEN
+    ):
+        raise HTTPException(status_code=403, detail="口令错误")
+    if profiling.busy():
+        raise HTTPException(status_code=409, detail="已有剖析任务在运行")
+
+
+class TorchProfileRequest(BaseModel):
+    """单次推理剖析请求: asr 需提供 minio_key, tts 需提供 text"""
+
+    target: Literal["asr", "tts"]
+    minio_key: str | None = None
+    text: str | None = None
+    format: Literal["table", "chrome"] = "table"
+
+
+@router.get("/admin/profile", dependencies=[Depends(require_profiling)])
+async def sampling_profile(
+    seconds: float = Query(10, gt=0, le=300),
+    interval_ms: float = Query(10, ge=5, le=1000),
+    mode: Literal["wall", "cpu"] = "wall",
+):
+    """
+    对 agent 进程采样 seconds 秒, 返回折叠栈 (flamegraph.pl / speedscope 可直接打开)
+
+    - wall: 所有线程, 包括等锁/等 IO; cpu: 只计正在 CPU 上运行的线程 (仅 Linux)
+    - 时长上限 PROFILING_MAX_SECONDS, 采样在独立线程中进行, 不阻塞事件循环
+    """
+    if mode == "cpu" and not profiling.cpu_mode_supported():
+        raise HTTPException(status_code=400, detail="cpu 模式需要 /proc (Linux)")
+    try:
+        folded, meta = await asyncio.to_thread(
+            profiling.sample, seconds, interval_ms / 1000, mode
+        )
+    except profiling.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    filename = f"agent-{mode}-{datetime.utcnow():%Y%m%d-%H%M%S}.folded"
+    return PlainTextResponse(
+        folded,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Profile-Samples": str(meta["samples"]),
+            "X-Profile-Duration": str(meta["duration_s"]),
+        },
+    )
+
+
+@router.post("/admin/profile/torch", dependencies=[Depends(require_profiling)])
+async def torch_profile(request: TorchProfileRequest):
+    """
+    用 torch.profiler 记录一次 ASR 或 TTS 推理 (模型加载不计入)
+
+    - format=table 返回按 self CPU 时间排序的算子表; chrome 返回 chrome://tracing 可打开的 trace
+    """
+    source = request.text
+    audio_path = None
+    if request.target == "asr":
+        if not request.minio_key:
+            raise HTTPException(status_code=400, detail="asr 剖析需要 minio_key")
+        from core import storage
+
+        audio_path = await asyncio.to_thread(storage.download_file, request.minio_key)
+        source = audio_path
+    elif not request.text:
+        raise HTTPException(status_code=400, detail="tts 剖析需要 text")
+    try:
+        result = await asyncio.to_thread(
+            profiling.torch_profile,
+            request.target,
+            source,
+            trace=request.format == "chrome",
+        )
+    except profiling.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    finally:
+        if audio_path is not None:
+            shutil.rmtree(os.path.dirname(audio_path), ignore_errors=True)
+    if request.format == "chrome":
+        # 发送完成后删除, 不在 PROFILING_DIR 里越积越多
+        return FileResponse(
+            result["trace_file"],
+            media_type="application/json",
+            filename=os.path.basename(result["trace_file"]),
+            background=BackgroundTask(os.remove, result["trace_file"]),
+        )
+    return result
+
+
+def require_model_admin(request: Request):
+    """模型管理接口开关与鉴权: 未开启或未配置口令时返回 404, 否则校验 X-Admin-Token"""
+    if not settings.MODEL_ADMIN_ENABLED or not settings.MODEL_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(
+        request.headers.get("X-Admin-Token", ""), settings.MODEL_ADMIN_TOKEN
+    ):
+        raise HTTPException(status_code=403, detail="口令错误")
+
+
+def _model_name(name: str) -> str:
+    if name not in models.registry.names():
+        raise HTTPException(status_code=404, detail=f"未知模型: {name}")
+    return name
+
+
+def _allowed_versions(name: str) -> set[str]:
+    """MODEL_ADMIN_VERSIONS 中列给该模型的版本 (模型名:版本), 加上它的默认版本"""
+    allowed = {models.registry.default_version(name)}
+    for entry in settings.MODEL_ADMIN_VERSIONS.split(","):
+        model, _, version = entry.strip().partition(":")
+        if model == name and version:
+            allowed.add(version)
+    return allowed
+
+
+class ModelLoadRequest(BaseModel):
+    """加载/切换模型: version 为空时加载当前目标版本 (whisper 如 small, cosyvoice 为 ModelScope 模型 ID)"""
+
+    version: str | None = None
+
+
+@router.post("/admin/models/{name}/load", dependencies=[Depends(require_model_admin)])
+async def load_model(name: str, request: ModelLoadRequest):
+    """
+    加载模型, 指定 version 时热切换: 新版本加载完成后替换当前版本,
+    正在执行的任务继续使用旧版本, 结束后旧版本被释放 (只作用于处理本请求的进程)
+    """
+    name = _model_name(name)
+    if request.version is not None and request.version not in _allowed_versions(name):
+        raise HTTPException(
+            status_code=400,
+            detail=f"{name} 的版本 {request.version} 不在 MODEL_ADMIN_VERSIONS 允许列表中",
+        )
+    try:
+        handle = await asyncio.to_thread(models.registry.load, name, request.version)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"加载 {name} 失败: {e}")
+    return {"model": name, **handle.info()}
+
+
+@router.post("/admin/models/{name}/unload", dependencies=[Depends(require_model_admin)])
+async def unload_model(name: str):
+    """卸载模型释放内存, 正在执行的任务结束后才真正释放; 下次请求时按需重新加载"""
+    name = _model_name(name)
+    unloaded = await asyncio.to_thread(models.registry.unload, name)
+    return {"model": name, "unloaded": unloaded}
+
+
+@router.get("/stats/models")
+async def model_stats():
+    """模型注册表: 各模型的当前版本、空闲时间、使用中的任务数、等待释放的旧版本及进程内存 (MB)"""
+    return models.registry.stats()
+
+
+@router.get("/stats/events")
+async def event_bus_stats():
+    """进度事件总线: 订阅数、已发布/被丢弃的事件数"""
+    return events.bus.stats()
 
 
 @router.get("/health")
 async def health_check():
     """健康检查,存活检查,后续可以改为就绪检查,docker(agent)会发起健康检查,这个接口会被调用让容器(target)报告自己是健康的"""
     return {"status": "ok", "service": "ai_agent"}
+
+
+@router.get("/stats")
+async def agent_stats():
+    """准入控制状态: 执行中/排队中的任务数及上限, 被拒绝的请求数"""
+    return await admission.stats()
+
+
+@router.get("/stats/pipeline")
+async def pipeline_stats():
+    """分阶段流水线: 各阶段利用率、排队延迟 (avg/max)、被下游阻塞的时间占比"""
+    from services.pipeline import staged_pipeline
+
+    return staged_pipeline.stats()
+
+
+@router.get("/stats/db")
+async def db_pool_stats():
+    """数据库连接池状态: 取连接等待时间 (avg/max/last) 与当前借出连接数"""
+    return {"async": async_pool_stats.snapshot(), "sync": pool_stats.snapshot()}
+
+
+@router.get("/stats/profile_cache")
+async def profile_cache_stats():
+    """用户画像缓存命中情况"""
+    return profile_cache.stats()
@@ -0,0 +1,54 @@
+"""
+把 Whisper / CosyVoice 的权重转换为可内存映射的格式, 写入 MODEL_MMAP_DIR
+转换后设置同样的 MODEL_MMAP_DIR 启动服务, 加载时自动改走映射 (见 core/weights.py)
+
+用法 (在 ai_agent 目录):
+    MODEL_MMAP_DIR=/app/models/mmap python convert_weights.py --whisper base
+    MODEL_MMAP_DIR=/app/models/mmap python convert_weights.py --whisper base small \\
+        --cosyvoice /app/models/iic/CosyVoice-300M-SFT
+"""
+
+import argparse
+import sys
+import time
+
+from core import tts_cosy, weights
+from core.config import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="转换模型权重为可内存映射格式")
+    parser.add_argument(
+        "--whisper",
+        nargs="*",
+        default=[],
+        help="Whisper 模型名 (tiny/base/small...) 或本地 checkpoint 路径",
+    )
+    parser.add_argument(
+        "--cosyvoice",
+        nargs="?",
+        const=tts_cosy.MODEL_DIR,
+        default=None,
+        help=f"CosyVoice 模型目录, 不带值时为 {tts_cosy.MODEL_DIR}",
+    )
+    args = parser.parse_args()
+
+    if not settings.MODEL_MMAP_DIR:
+        sys.exit("请先设置 MODEL_MMAP_DIR")
+    if not args.whisper and args.cosyvoice is None:
+        parser.error("至少指定 --whisper 或 --cosyvoice")
+
+    for name in args.whisper:
+        started = time.perf_counter()
+        output = weights.convert_whisper(name)
+        print(
+            f"[Convert] whisper:{name} -> {output} ({time.perf_counter() - started:.1f}s)"
+        )
+    if args.cosyvoice is not None:
+        started = time.perf_counter()
+        output = weights.convert_cosyvoice(args.cosyvoice)
+        print(f"[Convert] cosyvoice -> {output} ({time.perf_counter() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,191 @@
-import whisper
+import os
+import wave
+
+# whisper 会连带导入 torch (数秒), 放到首次转录时再导入, 导入本模块不加载任何 ML 库
+from . import metrics, models, tracing, weights
 from .config import settings
 
-# 懒加载，内部变量，避免import时加载模型，让第一次调用的时候再加载
-_model = None
-# 后续改进可用FastAPI 启动事件中加载模型（或者利用 Docker 的健康检查来预热）
+# ASR_MODE=routed / speculative 时的两档模型 (注册表中的名字),
+# 版本分别为 ASR_FAST_MODEL / ASR_ACCURATE_MODEL
+TIERED_MODES = ("routed", "speculative")
+TIER_FAST = "whisper-fast"
+TIER_ACCURATE = "whisper-accurate"
+
+
+def _load(name: str):
+    """加载指定版本 (如 base / small) 的 Whisper, 由模型注册表在首次使用或热切换时调用"""
+    import whisper
+
+    if settings.MODEL_MMAP_DIR and os.path.isfile(weights.whisper_path(name)):
+        # 已转换为可映射格式: 参数直接指向文件页, 多进程共享页缓存
+        return weights.timed_load(f"whisper:{name} (mmap)", weights.load_whisper, name)
+    return whisper.load_model(name)
+
+
+# 模型由注册表持有: 首次转录时加载, 可空闲卸载, 可通过管理接口切换版本 (默认 WHISPER_MODEL)
+models.registry.register("whisper", _load, lambda: settings.WHISPER_MODEL)
+models.registry.register(TIER_FAST, _load, lambda: settings.ASR_FAST_MODEL)
+models.registry.register(TIER_ACCURATE, _load, lambda: settings.ASR_ACCURATE_MODEL)
+
+
+def _model_names() -> list[str]:
+    """当前 ASR_MODE 会用到的模型"""
+    if settings.ASR_MODE in TIERED_MODES:
+        return [TIER_FAST, TIER_ACCURATE]
+    return ["whisper"]
+
 
 def get_model():
-    global _model
-    if _model is None:
-        print(f"[ASR] 正在加载 Whisper 模型:{settings.WHISPER_MODEL} ...")
-        _model = whisper.load_model(settings.WHISPER_MODEL)
-    return _model
+    """加载当前 ASR_MODE 用到的全部 Whisper 模型 (仅供预加载), 返回最先使用的那个"""
+    loaded = [models.registry.get(name) for name in _model_names()]
+    return loaded[0]
+
+
+def audio_duration(file_path: str) -> float | None:
+    """只读文件头得到音频时长 (秒), 不解码; 无法识别的格式返回 None"""
+    try:
+        with wave.open(file_path, "rb") as f:
+            return f.getnframes() / f.getframerate()
+    except (wave.Error, EOFError, OSError, ZeroDivisionError):
+        pass
+    try:
+        # WAVE_FORMAT_EXTENSIBLE / flac / ogg 等, libsndfile 同样只读文件头
+        import soundfile
+
+        return soundfile.info(file_path).duration
+    except Exception:
+        return None
+
+
+def choose_tier(duration: float, condition: str | None = None) -> tuple[str, str]:
+    """
+    按时长与用户病情选择模型档位, 返回 (档位, 原因)
+    - 病情命中 ASR_ACCURATE_CONDITIONS (发音含糊、认知障碍等): 直接用大模型
+    - 时长不超过 ASR_FAST_MAX_SECONDS 的短指令: 小模型, 置信度低时再升级
+    - 其余 (长对话): 大模型
+    """
+    if condition:
+        lowered = condition.lower()
+        for keyword in settings.ASR_ACCURATE_CONDITIONS.split(","):
+            if keyword.strip() and keyword.strip().lower() in lowered:
+                return TIER_ACCURATE, "condition"
+    if duration <= settings.ASR_FAST_MAX_SECONDS:
+        return TIER_FAST, "short"
+    return TIER_ACCURATE, "long"
+
+
+def avg_logprob(result: dict) -> float | None:
+    """按 token 数加权的各段平均 log 概率, 没有识别出任何段时返回 None"""
+    segments = result.get("segments") or []
+    tokens = sum(len(segment["tokens"]) for segment in segments)
+    if not tokens:
+        return None
+    return (
+        sum(segment["avg_logprob"] * len(segment["tokens"]) for segment in segments)
+        / tokens
+    )
+
+
+def confidence(result: dict) -> dict:
+    """transcribe 输出中的置信度信息: 段数、加权平均/最低 avg_logprob、最高 no_speech_prob"""
+    segments = result.get("segments") or []
+    return {
+        "segments": len(segments),
+        "avg_logprob": avg_logprob(result),
+        "min_avg_logprob": min((s["avg_logprob"] for s in segments), default=None),
+        "max_no_speech_prob": max(
+            (s["no_speech_prob"] for s in segments), default=None
+        ),
+    }
+
+
+def is_confident(result: dict) -> bool:
+    """
+    段级置信度门限: 每一段 avg_logprob 不低于 ASR_ESCALATE_LOGPROB,
+    且 no_speech_prob 不高于 ASR_ESCALATE_NO_SPEECH (小模型在噪声上容易编出句子);
+    没有识别出任何段也视为不可信: 小模型对含糊短语音常直接输出空
+    """
+    segments = result.get("segments") or []
+    return bool(segments) and all(
+        segment["avg_logprob"] >= settings.ASR_ESCALATE_LOGPROB
+        and segment["no_speech_prob"] <= settings.ASR_ESCALATE_NO_SPEECH
+        for segment in segments
+    )
+
+
+def _decode(name: str, audio) -> tuple[dict, str]:
+    """用注册表中的模型解码, 持有模型直到解码结束, 期间切换版本不影响本次解码"""
+    with models.registry.use(name) as handle:
+        # fp16=false 避免显存不足,兼容cpu推理, 强制使用 FP32 (全精度)
+        return handle.model.transcribe(audio, fp16=False), handle.version
+
+
+def _route(duration: float | None, condition: str | None) -> tuple[str, str]:
+    """ASR_MODE=routed: 按时长/病情选档; speculative: 一律先用小模型"""
+    if settings.ASR_MODE == "speculative":
+        return TIER_FAST, "speculative"
+    return choose_tier(duration, condition)
+
+
+def _tiered(audio, tier: str, reason: str) -> tuple[dict, list[str]]:
+    """
+    用选定的档位解码; 小模型的结果未通过 is_confident 时用大模型重新解码, 通过则直接交给 LLM
+    两档模型都由 registry.use 按需加载, 没有升级的请求不会加载大模型
+    """
+    metrics.asr_routes.labels(tier, reason).inc()
+    result, version = _decode(tier, audio)
+    used = [version]
+    if tier == TIER_FAST and not is_confident(result):
+        stats = confidence(result)
+        shown = (
+            f"最低 avg_logprob {stats['min_avg_logprob']:.2f}, "
+            f"最高 no_speech_prob {stats['max_no_speech_prob']:.2f}"
+            if stats["segments"]
+            else "无识别结果"
+        )
+        print(f"[ASR] {version} 置信度低 ({shown}), 升级到大模型重新解码")
+        metrics.asr_escalations.inc()
+        result, version = _decode(TIER_ACCURATE, audio)
+        used.append(version)
+    tracing.set_attribute("asr_route", reason)
+    return result, used
+
 
 # 转录音频文件，返回文本
-def transcribe(file_path: str) -> str:
+def transcribe(file_path: str, condition: str | None = None) -> str:
+    """condition 为用户病情, ASR_MODE=routed 时参与选档"""
     try:
-        model = get_model()
-        # fp16=false 避免显存不足,兼容cpu推理
-        # 需要传一个字符串类型的路径。，强制使用 FP32 (全精度)
-        result = model.transcribe(file_path, fp16=False)
+        import whisper
+
+        # 文件头里的时长 (不解码), 非 WAV 等读不出时用解码后的长度
+        header_duration = audio_duration(file_path)
+        route = None
+        if settings.ASR_MODE == "speculative" or (
+            settings.ASR_MODE in TIERED_MODES and header_duration is not None
+        ):
+            route = _route(header_duration, condition)
+        # 只预热本次选中的模型, 加载 (首次或空闲卸载后) 不计入 asr 耗时;
+        # routed 模式读不出文件头时解码后才能选档, 升级用的大模型也在需要时才加载
+        if settings.ASR_MODE not in TIERED_MODES:
+            models.registry.load("whisper")
+        elif route is not None:
+            models.registry.load(route[0])
+        with metrics.timed("asr"):
+            # 先解码一次 (16kHz 单声道), 顺带得到音频时长, 再把数组交给 transcribe
+            audio = whisper.load_audio(file_path)
+            duration = len(audio) / whisper.audio.SAMPLE_RATE
+            metrics.set_record_value("audio_duration", duration)
+            tracing.set_attribute("audio_duration", duration)
+            if settings.ASR_MODE in TIERED_MODES:
+                if route is None:
+                    route = _route(duration, condition)
+                result, used = _tiered(audio, *route)
+            else:
+                result, version = _decode("whisper", audio)
+                used = [version]
+            # 升级时记为 "base>small"
+            tracing.set_attribute("model", ">".join(used))
+            metrics.set_record_value("asr_model", ">".join(used))
         # 去掉文字首尾的空格或换行符，让结果更干净
         return result["text"].strip()
     except Exception as e:
@@ -13,6 +13,11 @@ class Settings(BaseSettings):
     DB_USER: str = os.getenv("DB_USER", "")
     DB_PASSWORD: str = os.getenv("DB_PASSWORD", "")
     DB_NAME: str = os.getenv("DB_NAME", "voicebridge")
+    # 连接池: 常驻连接数 / 突发时额外连接数 / 连接最长存活秒数 / 取连接最长等待秒数
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 10))
 
     # MinIO
     MINIO_ENDPOINT: str = os.getenv("MINIO_ENDPOINT", "localhost:9000")
@@ -20,9 +25,105 @@ class Settings(BaseSettings):
     MINIO_ROOT_PASSWORD: str = os.getenv("MINIO_ROOT_PASSWORD", "")
     MINIO_BUCKET_NAME: str = os.getenv("MINIO_BUCKET_NAME", "voicebridge")
     MINIO_SECURE: bool = os.getenv("MINIO_SECURE", "false").lower() == "true"
+    # 对象存储实现: minio / local (本地目录, 单机部署) / memory (进程内, 仅测试和压测)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "minio")
+    STORAGE_LOCAL_DIR: str = os.getenv("STORAGE_LOCAL_DIR", "./data/storage")
+    # 对象 URL 前缀 (Nginx 代理路径); local 实现需要 Nginx 把该路径指向 STORAGE_LOCAL_DIR
+    STORAGE_URL_PREFIX: str = os.getenv("STORAGE_URL_PREFIX", "/minio-api")
+
+    # 任务队列: postgres (持久化, SKIP LOCKED) / memory (进程内, 仅开发和压测)
+    JOB_BROKER: str = os.getenv("JOB_BROKER", "postgres")
+    # 每个进程的 worker 数, 即同时在流水线中的记录数; 需不少于阶段数, 各阶段才能重叠
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", 4))
+    JOB_VISIBILITY_TIMEOUT: float = float(os.getenv("JOB_VISIBILITY_TIMEOUT", 300))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    JOB_RETRY_BASE_DELAY: float = float(os.getenv("JOB_RETRY_BASE_DELAY", 5))
+    JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", 1))
+    BATCH_MAX_SIZE: int = int(os.getenv("BATCH_MAX_SIZE", 200))  # 单次批量提交上限
+    # 优先级老化: 每差一个优先级等价于多排队多少秒 (interactive < retry < batch)
+    JOB_PRIORITY_AGING: float = float(os.getenv("JOB_PRIORITY_AGING", 30))
+    # 每个用户同时执行的任务数上限, 防止单个设备占满 worker; 0 表示不限
+    JOB_MAX_RUNNING_PER_USER: int = int(os.getenv("JOB_MAX_RUNNING_PER_USER", 2))
+
+    # 准入控制: 同时执行的流水线上限 / 排队上限 / 429、503 的 Retry-After 秒数 / 队列长度缓存秒数
+    ADMISSION_MAX_IN_FLIGHT: int = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 4))
+    ADMISSION_MAX_QUEUED: int = int(os.getenv("ADMISSION_MAX_QUEUED", 200))
+    ADMISSION_RETRY_AFTER: int = int(os.getenv("ADMISSION_RETRY_AFTER", 5))
+    ADMISSION_DEPTH_TTL: float = float(os.getenv("ADMISSION_DEPTH_TTL", 1))
+    # 分阶段流水线: 各阶段 worker 数与阶段间队列长度
+    PIPELINE_ASR_WORKERS: int = int(os.getenv("PIPELINE_ASR_WORKERS", 1))
+    PIPELINE_LLM_WORKERS: int = int(os.getenv("PIPELINE_LLM_WORKERS", 4))
+    PIPELINE_TTS_WORKERS: int = int(os.getenv("PIPELINE_TTS_WORKERS", 1))
+    PIPELINE_QUEUE_SIZE: int = int(os.getenv("PIPELINE_QUEUE_SIZE", 4))
+
+    # 进度事件: 状态更新时 pg_notify / 订阅其他实例的通知 / SSE 保活间隔 (秒)
+    EVENTS_NOTIFY: bool = os.getenv("EVENTS_NOTIFY", "true").lower() == "true"
+    EVENTS_LISTEN: bool = os.getenv("EVENTS_LISTEN", "true").lower() == "true"
+    EVENTS_HEARTBEAT: float = float(os.getenv("EVENTS_HEARTBEAT", 15))
+    # 流式同步接口: 上传音频大小上限 (字节) / 回传 TTS 音频时每个分片的字节数
+    STREAM_MAX_AUDIO_BYTES: int = int(
+        os.getenv("STREAM_MAX_AUDIO_BYTES", 20 * 1024 * 1024)
+    )
+    STREAM_CHUNK_BYTES: int = int(os.getenv("STREAM_CHUNK_BYTES", 32 * 1024))
+
+    # 追踪导出: memory (进程内, /traces/{trace_id} 查询) / file (JSON Lines) / none
+    TRACE_EXPORTER: str = os.getenv("TRACE_EXPORTER", "memory")
+    TRACE_FILE: str = os.getenv("TRACE_FILE", "traces.jsonl")
+    TRACE_MEMORY_SPANS: int = int(os.getenv("TRACE_MEMORY_SPANS", 10000))
+
+    # 剖析管理接口: 默认关闭; 开启时必须设置 PROFILING_TOKEN (否则拒绝启动),
+    # 请求需带 X-Admin-Token 请求头
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILING_TOKEN: str = os.getenv("PROFILING_TOKEN", "")
+    PROFILING_MAX_SECONDS: float = float(os.getenv("PROFILING_MAX_SECONDS", 60))
+    # torch trace 的临时输出目录 (返回后即删除), 空则用系统临时目录
+    PROFILING_DIR: str = os.getenv("PROFILING_DIR", "")
 
     # AI Models
     WHISPER_MODEL: str = os.getenv("WHISPER_MODEL", "base")
+    # ASR 模式: single 全部用 WHISPER_MODEL; routed 按时长/用户病情在两档模型间选择;
+    # speculative 一律先用小模型. 后两种模式下小模型任一段的 avg_logprob 低于 ASR_ESCALATE_LOGPROB
+    # 或 no_speech_prob 高于 ASR_ESCALATE_NO_SPEECH 时, 用大模型重新解码
+    ASR_MODE: str = os.getenv("ASR_MODE", "single")
+    ASR_FAST_MODEL: str = os.getenv("ASR_FAST_MODEL", "base")
+    ASR_ACCURATE_MODEL: str = os.getenv("ASR_ACCURATE_MODEL", "small")
+    ASR_FAST_MAX_SECONDS: float = float(os.getenv("ASR_FAST_MAX_SECONDS", 5))
+    # 与 whisper transcribe 的 logprob_threshold / no_speech_threshold 默认值一致
+    ASR_ESCALATE_LOGPROB: float = float(os.getenv("ASR_ESCALATE_LOGPROB", -1.0))
+    ASR_ESCALATE_NO_SPEECH: float = float(os.getenv("ASR_ESCALATE_NO_SPEECH", 0.6))
+    # 病情含这些关键词 (逗号分隔, 不区分大小写) 的用户直接用大模型
+    ASR_ACCURATE_CONDITIONS: str = os.getenv(
+        "ASR_ACCURATE_CONDITIONS",
+        "dysarthria,aphasia,stroke,cerebral palsy,Parkinson,NCD,dementia,"
+        "构音障碍,失语,脑卒中,中风,脑瘫,帕金森,认知障碍,痴呆",
+    )
+    # 可内存映射的权重目录 (convert_weights.py 生成), 空则按原方式整体读入内存
+    MODEL_MMAP_DIR: str = os.getenv("MODEL_MMAP_DIR", "")
+    # 模型空闲多少秒后卸载以释放内存 (0 = 常驻不卸载), 卸载后下次请求时重新加载
+    MODEL_IDLE_UNLOAD_SECONDS: float = float(os.getenv("MODEL_IDLE_UNLOAD_SECONDS", 0))
+    # 模型加载/卸载/热切换管理接口: 默认关闭; 开启时必须设置 MODEL_ADMIN_TOKEN (否则拒绝启动),
+    # 请求需带 X-Admin-Token 请求头
+    MODEL_ADMIN_ENABLED: bool = (
+        os.getenv("MODEL_ADMIN_ENABLED", "false").lower() == "true"
+    )
+    MODEL_ADMIN_TOKEN: str = os.getenv("MODEL_ADMIN_TOKEN", "")
+    # 管理接口可切换到的版本, 按模型分别列出 (逗号分隔的 模型名:版本); 各模型的默认版本总是允许.
+    # 版本会传给 whisper.load_model / snapshot_download, 不能放开为任意字符串 (本地路径会被反序列化)
+    MODEL_ADMIN_VERSIONS: str = os.getenv(
+        "MODEL_ADMIN_VERSIONS",
+        "whisper:tiny,whisper:base,whisper:small,whisper:medium,whisper:turbo",
+    )
+    # 启动时 (lifespan) 预加载 Whisper/CosyVoice, 否则首次请求时加载
+    PRELOAD_MODELS: bool = os.getenv("PRELOAD_MODELS", "false").lower() == "true"
+    # prefork.py: worker 进程数 / 每个 worker 的 torch 线程数 (0 = CPU 核数 / worker 数)
+    SERVER_WORKERS: int = int(os.getenv("SERVER_WORKERS", 1))
+    PREFORK_TORCH_THREADS: int = int(os.getenv("PREFORK_TORCH_THREADS", 0))
+    # 用户画像缓存: 过期秒数 / 最大条数 / 是否订阅 Postgres NOTIFY 失效
+    PROFILE_CACHE_TTL: float = float(os.getenv("PROFILE_CACHE_TTL", 300))
+    PROFILE_CACHE_MAX_SIZE: int = int(os.getenv("PROFILE_CACHE_MAX_SIZE", 1024))
+    PROFILE_CACHE_LISTEN: bool = (
+        os.getenv("PROFILE_CACHE_LISTEN", "true").lower() == "true"
+    )
     # llm api
     AI_AGENT_LLM_API_URL: str = os.getenv("AI_AGENT_LLM_API_URL", "")
     AI_AGENT_LLM_API_KEY: str = os.getenv("AI_AGENT_LLM_API_KEY", "")
@@ -33,6 +134,11 @@ class Settings(BaseSettings):
         """构建数据库连接 URL,把用户名、密码、主机拼接成了一个长长的数据库连接串"""
         return f"postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        """异步引擎 (asyncpg 驱动) 的连接 URL"""
+        return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+
     class Config:
         env_file = "../.env"  # 自动读取根目录 .env
         extra = "ignore"
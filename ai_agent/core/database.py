@@ -1,15 +1,55 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Text, DateTime
+from sqlalchemy import (
+    create_engine,
+    func,
+    select,
+    text,
+    update,
+    Column,
+    Integer,
+    String,
+    Float,
+    Text,
+    DateTime,
+    Index,
+)
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
+from . import metrics, tracing
 from .config import settings
+from .profile_cache import UserProfile, profile_cache
 
 DATABASE_URL = settings.DATABASE_URL
 
-# 建立连接池，先ping一下连接
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# 建立连接池，先ping一下连接; 池大小等参数显式来自 Settings
+engine = create_engine(
+    DATABASE_URL,
+    pool_pre_ping=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+)
 # 创建会话类，防止误删数据
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# 异步引擎 (asyncpg): 流水线在事件循环里写库时不再阻塞; 同步引擎保留给脚本使用
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
 Base = declarative_base()
 
 
@@ -55,8 +95,12 @@ class VoiceRecord(Base):
 # 对应go:model.AnalysisResult
 class AnalysisResult(Base):
     __tablename__ = "analysis_results"
+    # 与 gorm 的 uniqueIndex 同名, upsert 的 ON CONFLICT (voice_record_id) 依赖它
+    __table_args__ = (
+        Index("idx_analysis_results_voice_record_id", "voice_record_id", unique=True),
+    )
     id = Column(Integer, primary_key=True)
-    voice_record_id = Column(Integer)
+    voice_record_id = Column(Integer, nullable=False)
     asr_text = Column(Text)
     refined_text = Column(Text)
     response_text = Column(Text, nullable=True)  # 新增: 根据 decision 生成的响应文本
@@ -67,6 +111,205 @@ class AnalysisResult(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     deleted_at = Column(DateTime, nullable=True)
 
+
+# 未结束的任务状态; 同一 (record_id, minio_key_hash) 在这些状态下只能有一个任务
+ACTIVE_JOB_STATUSES = ("queued", "running")
+ACTIVE_JOB_WHERE = text("status IN ('queued', 'running')")
+
+
+# agent 自己的任务队列表 (Go 后端不感知), 由 init_db 创建
+class AgentJob(Base):
+    __tablename__ = "agent_jobs"
+    __table_args__ = (
+        Index("idx_agent_jobs_claim_order", "status", "sort_at"),
+        # 部分唯一索引: 重复提交时 INSERT ... ON CONFLICT DO NOTHING, 挂到已有任务上
+        Index(
+            "uq_agent_jobs_active_record",
+            "record_id",
+            "minio_key_hash",
+            unique=True,
+            postgresql_where=ACTIVE_JOB_WHERE,
+            sqlite_where=ACTIVE_JOB_WHERE,
+        ),
+    )
+    id = Column(Integer, primary_key=True)
+    record_id = Column(Integer, nullable=False, index=True)
+    user_id = Column(Integer, nullable=False)
+    minio_key = Column(String(255), nullable=False)
+    minio_key_hash = Column(String(64), nullable=True)  # sha256(minio_key), 去重键的一部分
+    # 状态流转: queued->running->done, running 失败后回到 queued (退避) 或 failed
+    status = Column(String(20), nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # 优先级等级 (0=interactive, 1=retry, 2=batch); sort_at = available_at + 等级 * 老化秒数,
+    # 按 sort_at 抢任务: 高优先级先执行, 低优先级排得够久后也会轮到
+    priority = Column(Integer, nullable=False, default=0)
+    sort_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    batch_id = Column(String(36), nullable=True, index=True)  # 批量提交时的批次号
+    traceparent = Column(String(55), nullable=True)  # 入队请求的 W3C traceparent
+    locked_until = Column(DateTime, nullable=True)  # 可见性超时, 过期视为 worker 崩溃
+    locked_by = Column(String(100), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# 每条记录每处理一次追加一行分阶段耗时 (秒), agent 自己的表, 由 init_db 创建
+class RecordTiming(Base):
+    __tablename__ = "agent_record_timings"
+    id = Column(Integer, primary_key=True)
+    record_id = Column(Integer, nullable=False, index=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    status = Column(String(20), nullable=False)  # completed / error
+    audio_duration = Column(Float)  # 音频时长, ASR 解码得到
+    queue_wait = Column(Float)  # 入队到开始执行, 含各阶段队列中的等待
+    download = Column(Float)
+    asr = Column(Float)
+    llm = Column(Float)  # 含重试与退避
+    llm_attempts = Column(Integer)
+    tts = Column(Float)
+    upload = Column(Float)
+    db = Column(Float)  # 流水线中数据库会话的总耗时 (含取连接)
+    total = Column(Float)  # 开始执行到结束, 不含 queue_wait
+    rtf = Column(Float)  # 实时率 = asr / audio_duration
+    asr_model = Column(String(40))  # 解码所用的 Whisper 模型, 升级重解码时如 "base>small"
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+# 可以求分位数的耗时字段
+TIMING_FIELDS = (
+    "queue_wait",
+    "download",
+    "asr",
+    "llm",
+    "tts",
+    "upload",
+    "db",
+    "total",
+    "audio_duration",
+    "rtf",
+)
+
+# 由 agent 负责建表的表
+AGENT_TABLES = [AgentJob.__table__, RecordTiming.__table__]
+
+# 已存在的 agent_jobs / agent_record_timings 表补列 (Postgres), create_all 不会修改已有的表
+AGENT_JOB_MIGRATIONS = [
+    "ALTER TABLE agent_jobs ADD COLUMN IF NOT EXISTS priority INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE agent_jobs ADD COLUMN IF NOT EXISTS sort_at TIMESTAMP NOT NULL DEFAULT now()",
+    "DROP INDEX IF EXISTS idx_agent_jobs_claim",
+    "ALTER TABLE agent_jobs ADD COLUMN IF NOT EXISTS batch_id VARCHAR(36)",
+    "ALTER TABLE agent_jobs ADD COLUMN IF NOT EXISTS minio_key_hash VARCHAR(64)",
+    "ALTER TABLE agent_jobs ADD COLUMN IF NOT EXISTS traceparent VARCHAR(55)",
+    "ALTER TABLE agent_record_timings ADD COLUMN IF NOT EXISTS asr_model VARCHAR(40)",
+]
+
+
+def init_db():
+    """
+    启动时确保 agent 依赖的表和索引存在
+    业务表结构由 Go 后端 AutoMigrate 维护, 这里只补 upsert 需要的唯一索引和 agent 自己的表
+    """
+    try:
+        Base.metadata.create_all(bind=engine, tables=AGENT_TABLES, checkfirst=True)
+        if engine.dialect.name == "postgresql":
+            with engine.begin() as conn:
+                for statement in AGENT_JOB_MIGRATIONS:
+                    conn.exec_driver_sql(statement)
+        for index in AgentJob.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+    except Exception as e:
+        print(f"[DB] 创建 agent 表失败: {e}")
+    try:
+        for index in AnalysisResult.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+    except Exception as e:
+        print(f"[DB] 创建索引失败 (表可能尚未由后端迁移): {e}")
+
+
+class PoolCheckoutStats:
+    """连接池取连接等待时间统计 (秒), 池打满时这里会先涨"""
+
+    def __init__(self, pool_engine):
+        self._engine = pool_engine
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_seconds = 0.0
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self.last_seconds = seconds
+
+    def snapshot(self) -> dict:
+        pool = self._engine.pool
+        with self._lock:
+            return {
+                "checkouts": self.count,
+                "wait_avg_ms": (
+                    round(self.total_seconds / self.count * 1000, 3)
+                    if self.count
+                    else 0.0
+                ),
+                "wait_max_ms": round(self.max_seconds * 1000, 3),
+                "wait_last_ms": round(self.last_seconds * 1000, 3),
+                "pool_size": settings.DB_POOL_SIZE,
+                "max_overflow": settings.DB_MAX_OVERFLOW,
+                "checked_out": (
+                    pool.checkedout() if hasattr(pool, "checkedout") else None
+                ),
+            }
+
+
+pool_stats = PoolCheckoutStats(engine)
+async_pool_stats = PoolCheckoutStats(async_engine.sync_engine)
+
+
+@contextmanager
+def session_scope():
+    """
+    短事务会话: 每个阶段单独开关, 用完立即把连接还给连接池
+    不要跨越 ASR/LLM/TTS 等耗时操作持有会话
+    """
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        db.connection()  # 立即从池中取连接, 统计等待时间
+        pool_stats.observe(time.perf_counter() - start)
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+@asynccontextmanager
+async def async_session_scope():
+    """
+    session_scope 的异步版本, 流水线中使用
+    整个会话的耗时记入当前记录的 db 耗时, 处于 trace 中时记为一个 db span
+    """
+    db = AsyncSessionLocal()
+    start = time.perf_counter()
+    try:
+        with tracing.span("db"):
+            await db.connection()
+            async_pool_stats.observe(time.perf_counter() - start)
+            yield db
+    except Exception:
+        await db.rollback()
+        raise
+    finally:
+        await db.close()
+        metrics.add_timing("db", time.perf_counter() - start)
+
+
 # 获取数据库会话
 def get_db():
     db = SessionLocal()
@@ -76,42 +319,102 @@ def get_db():
         db.close()
 
 
-def update_record_status(db, record_id: int, status: str, **kwargs):
+# 流水线允许顺带写入的 voice_records 列 (白名单), status/updated_at 由函数自己写
+STATUS_UPDATE_COLUMNS = frozenset(
+    {
+        "raw_text",
+        "refined_text",
+        "confidence",
+        "decision",
+        "reason",
+        "tts_url",
+        "audio_url",
+        "duration",
+    }
+)
+
+
+def build_status_update(
+    record_id: int, status: str, notify: tuple[str, str] | None = None, **kwargs
+):
+    """
+    构造单条 UPDATE voice_records ... WHERE id = :id RETURNING status 语句
+    不在白名单里的字段直接丢弃, 避免误改 id/user_id/minio_key 等列
+    notify 为 (channel, payload) 时在 RETURNING 里顺带 pg_notify, 随事务提交送达 (仅 Postgres)
+    """
+    values = {"status": status, "updated_at": datetime.utcnow()}
+    for key, value in kwargs.items():
+        if key in STATUS_UPDATE_COLUMNS:
+            values[key] = value
+        else:
+            print(f"[DB] 忽略非白名单字段: {key}")
+    stmt = update(VoiceRecord).where(VoiceRecord.id == record_id).values(**values)
+    if notify is not None:
+        return stmt.returning(VoiceRecord.status, func.pg_notify(*notify))
+    return stmt.returning(VoiceRecord.status)
+
+
+def _notify_for(db, notify: tuple[str, str] | None) -> tuple[str, str] | None:
+    """pg_notify 只在 Postgres 上可用, 其他方言 (SQLite 脚本) 忽略"""
+    if notify is None or db.get_bind().dialect.name != "postgresql":
+        return None
+    return notify
+
+
+def build_bulk_status_update(record_ids: list[int], status: str):
+    """构造 UPDATE voice_records SET status ... WHERE id IN (...) RETURNING id, 批量提交时使用"""
+    return (
+        update(VoiceRecord)
+        .where(VoiceRecord.id.in_(record_ids))
+        .values(status=status, updated_at=datetime.utcnow())
+        .returning(VoiceRecord.id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def update_record_status(
+    db, record_id: int, status: str, notify: tuple[str, str] | None = None, **kwargs
+) -> str | None:
     """
-    更新语音记录
+    更新语音记录 (一条 UPDATE ... RETURNING, 不再先 SELECT 整行)
     Args:
         db: 数据库会话
         record_id: 记录ID
         status: 新状态pending/processing_asr/processing_llm/processing_tts/completed/failed/error
-        kwargs: 其他字段更新
+        notify: (channel, payload), 同一条语句里 pg_notify
+        kwargs: 其他字段更新, 只接受 STATUS_UPDATE_COLUMNS 中的列
+    Returns:
+        更新后的状态, 记录不存在时返回 None
     """
-    record = db.query(VoiceRecord).filter(VoiceRecord.id == record_id).first()
-    if record:
-        record.status = status
-        record.updated_at = datetime.utcnow()
-        for key, value in kwargs.items():
-            if hasattr(record, key):
-                setattr(record, key, value)
-        db.commit()
-        print(f"记录 {record_id} 状态更新为 {status}")
-        return record
-    return None
+    stmt = build_status_update(record_id, status, _notify_for(db, notify), **kwargs)
+    new_status = db.execute(stmt).scalar()
+    db.commit()
+    if new_status is None:
+        print(f"[DB] 记录 {record_id} 不存在, 状态未更新")
+        return None
+    print(f"记录 {record_id} 状态更新为 {new_status}")
+    return new_status
 
 
-def get_user_profile(db, user_id: int) -> dict:
+def get_user_profile(db, user_id: int) -> UserProfile:
     """
-    获取用户画像
+    获取用户画像 (带进程内缓存)
+    TTL 内直接命中; 过期后只查 updated_at 做版本校验, 未变更则续期
     """
+    cached, fresh = profile_cache.get(user_id)
+    if fresh:
+        return cached
+    if cached is not None:
+        version = db.execute(
+            select(User.updated_at).where(User.id == user_id)
+        ).scalar_one_or_none()
+        if version is not None and version == cached.version:
+            profile_cache.touch(user_id)
+            return cached
     user = db.query(User).filter(User.id == user_id).first()
-    if user:
-        return {
-            "name": user.name or user.username,
-            "age": user.age or "未知",
-            "condition": user.condition or "未知",
-            "habits": user.habits or "未知",
-            "common_needs": user.common_needs.split(",") if user.common_needs else [],
-        }
-    return {}
+    profile = UserProfile.from_user(user_id, user)
+    profile_cache.put(profile)
+    return profile
 
 
 def get_record(db, record_id: int) -> VoiceRecord | None:
@@ -121,6 +424,23 @@ def get_record(db, record_id: int) -> VoiceRecord | None:
     return db.query(VoiceRecord).filter(VoiceRecord.id == record_id).first()
 
 
+def build_analysis_upsert(dialect_name: str, voice_record_id: int, **fields):
+    """
+    构造 INSERT ... ON CONFLICT (voice_record_id) DO UPDATE 语句
+    Postgres 为线上路径, SQLite 供离线脚本/基准测试使用, 两者语法一致
+    """
+    dialect_insert = sqlite.insert if dialect_name == "sqlite" else postgresql.insert
+    now = datetime.utcnow()
+    stmt = dialect_insert(AnalysisResult).values(
+        voice_record_id=voice_record_id, created_at=now, updated_at=now, **fields
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[AnalysisResult.voice_record_id],
+        # 被 gorm 软删除过的旧结果重新生效
+        set_={**fields, "updated_at": now, "deleted_at": None},
+    )
+
+
 def save_analysis_result(
     db,
     voice_record_id: int,
@@ -132,7 +452,7 @@ def save_analysis_result(
     tts_audio_url: str,
 ) -> AnalysisResult:
     """
-    保存分析结果到数据库 (如果已存在则更新)
+    保存分析结果到数据库 (如果已存在则更新), 单条 upsert, 并发写同一记录不会冲突
 
     Args:
         db: 数据库会话
@@ -147,36 +467,347 @@ def save_analysis_result(
     Returns:
         保存的分析结果对象
     """
-    # 检查是否已存在
-    result = (
-        db.query(AnalysisResult)
-        .filter(AnalysisResult.voice_record_id == voice_record_id)
-        .first()
+    stmt = build_analysis_upsert(
+        db.get_bind().dialect.name,
+        voice_record_id,
+        asr_text=asr_text,
+        refined_text=refined_text,
+        response_text=response_text,
+        confidence=confidence,
+        decision=decision,
+        tts_audio_url=tts_audio_url,
+    ).returning(AnalysisResult)
+    result = db.scalars(stmt, execution_options={"populate_existing": True}).one()
+    db.commit()
+    print(f"[DB] 保存分析结果 voice_record_id={voice_record_id}")
+    return result
+
+
+def build_finish_statements(
+    dialect_name: str,
+    record_id: int,
+    asr_text: str,
+    refined_text: str,
+    response_text: str,
+    confidence: float,
+    decision: str,
+    tts_url: str,
+    notify: tuple[str, str] | None = None,
+) -> list:
+    """
+    构造完成一条记录所需的语句, 最后一条 RETURNING status (可顺带 pg_notify)
+    Postgres 下用可写 CTE 合成一条语句 (WITH upserted AS (INSERT ...) UPDATE ...)
+    SQLite 不支持 CTE 中的写语句, 退化为同一事务内两条语句
+    """
+    upsert = build_analysis_upsert(
+        dialect_name,
+        record_id,
+        asr_text=asr_text,
+        refined_text=refined_text,
+        response_text=response_text,
+        confidence=confidence,
+        decision=decision,
+        tts_audio_url=tts_url,
     )
+    status_stmt = build_status_update(record_id, "completed", notify, tts_url=tts_url)
+    if dialect_name == "postgresql":
+        upserted = upsert.returning(AnalysisResult.id).cte("upserted")
+        return [status_stmt.add_cte(upserted)]
+    return [upsert, status_stmt]
 
-    if result:
-        # 更新已有记录
-        result.asr_text = asr_text
-        result.refined_text = refined_text
-        result.response_text = response_text
-        result.confidence = confidence
-        result.decision = decision
-        result.tts_audio_url = tts_audio_url
-        print(f"[DB] 更新分析结果 voice_record_id={voice_record_id}")
-    else:
-        # 创建新记录
-        result = AnalysisResult(
-            voice_record_id=voice_record_id,
-            asr_text=asr_text,
-            refined_text=refined_text,
-            response_text=response_text,
-            confidence=confidence,
-            decision=decision,
-            tts_audio_url=tts_audio_url,
-        )
-        db.add(result)
-        print(f"[DB] 保存分析结果 voice_record_id={voice_record_id}")
 
+def _log_finished(record_id: int, new_status: str | None) -> str | None:
+    if new_status is None:
+        print(f"[DB] 记录 {record_id} 不存在, 分析结果已保存但状态未更新")
+        return None
+    print(f"[DB] 记录 {record_id} 处理完成, 分析结果与状态一次提交")
+    return new_status
+
+
+def finish_record(
+    db, record_id: int, notify: tuple[str, str] | None = None, **analysis
+) -> str | None:
+    """
+    完成一条记录: 保存分析结果 + 状态置为 completed, 同一事务一次提交
+
+    Args:
+        db: 数据库会话
+        record_id: 语音记录 ID
+        notify: (channel, payload), 随状态更新一起 pg_notify
+        analysis: asr_text/refined_text/response_text/confidence/decision/tts_url
+
+    Returns:
+        更新后的状态, 记录不存在时返回 None
+    """
+    *leading, last = build_finish_statements(
+        db.get_bind().dialect.name, record_id, notify=_notify_for(db, notify), **analysis
+    )
+    for stmt in leading:
+        db.execute(stmt)
+    new_status = db.execute(last).scalar()
     db.commit()
-    db.refresh(result)
+    return _log_finished(record_id, new_status)
+
+
+# ==================== 异步版本 (流水线使用) ====================
+
+
+async def update_record_status_async(
+    db, record_id: int, status: str, notify: tuple[str, str] | None = None, **kwargs
+) -> str | None:
+    """update_record_status 的异步版本"""
+    stmt = build_status_update(record_id, status, _notify_for(db, notify), **kwargs)
+    result = await db.execute(stmt)
+    new_status = result.scalar()
+    await db.commit()
+    if new_status is None:
+        print(f"[DB] 记录 {record_id} 不存在, 状态未更新")
+        return None
+    print(f"记录 {record_id} 状态更新为 {new_status}")
+    return new_status
+
+
+async def update_records_status_async(
+    db, record_ids: list[int], status: str
+) -> list[int]:
+    """一条语句批量更新状态, 返回实际存在并被更新的记录 ID"""
+    result = await db.execute(build_bulk_status_update(record_ids, status))
+    updated = list(result.scalars())
+    await db.commit()
+    missing = set(record_ids) - set(updated)
+    if missing:
+        print(f"[DB] 记录 {sorted(missing)} 不存在, 状态未更新")
+    print(f"{len(updated)} 条记录状态更新为 {status}")
+    return updated
+
+
+async def get_user_profiles_async(db, user_ids: list[int]) -> dict[int, UserProfile]:
+    """
+    批量获取用户画像: TTL 内的直接用缓存, 其余 (含过期) 一次 IN 查询重新加载并写回缓存
+    """
+    profiles = {}
+    to_load = []
+    for user_id in dict.fromkeys(user_ids):
+        cached, fresh = profile_cache.get(user_id)
+        if fresh:
+            profiles[user_id] = cached
+        else:
+            to_load.append(user_id)
+    if to_load:
+        result = await db.execute(select(User).where(User.id.in_(to_load)))
+        users = {user.id: user for user in result.scalars()}
+        for user_id in to_load:
+            profile = UserProfile.from_user(user_id, users.get(user_id))
+            profile_cache.put(profile)
+            profiles[user_id] = profile
+    return profiles
+
+
+async def get_user_profile_async(db, user_id: int) -> UserProfile:
+    """get_user_profile 的异步版本"""
+    cached, fresh = profile_cache.get(user_id)
+    if fresh:
+        return cached
+    if cached is not None:
+        version = (
+            await db.execute(select(User.updated_at).where(User.id == user_id))
+        ).scalar_one_or_none()
+        if version is not None and version == cached.version:
+            profile_cache.touch(user_id)
+            return cached
+    result = await db.execute(select(User).where(User.id == user_id))
+    profile = UserProfile.from_user(user_id, result.scalar_one_or_none())
+    profile_cache.put(profile)
+    return profile
+
+
+async def get_record_states_async(db, record_ids: list[int]) -> dict[int, tuple]:
+    """一条 IN 查询读取多条记录的 (status, minio_key), 不存在的记录不在结果中"""
+    result = await db.execute(
+        select(VoiceRecord.id, VoiceRecord.status, VoiceRecord.minio_key).where(
+            VoiceRecord.id.in_(record_ids)
+        )
+    )
+    return {row.id: (row.status, row.minio_key) for row in result}
+
+
+async def get_record_async(db, record_id: int) -> VoiceRecord | None:
+    """get_record 的异步版本"""
+    result = await db.execute(select(VoiceRecord).where(VoiceRecord.id == record_id))
+    return result.scalar_one_or_none()
+
+
+async def save_analysis_result_async(
+    db,
+    voice_record_id: int,
+    asr_text: str,
+    refined_text: str,
+    response_text: str,
+    confidence: float,
+    decision: str,
+    tts_audio_url: str,
+) -> AnalysisResult:
+    """save_analysis_result 的异步版本"""
+    stmt = build_analysis_upsert(
+        db.get_bind().dialect.name,
+        voice_record_id,
+        asr_text=asr_text,
+        refined_text=refined_text,
+        response_text=response_text,
+        confidence=confidence,
+        decision=decision,
+        tts_audio_url=tts_audio_url,
+    ).returning(AnalysisResult)
+    result = (
+        await db.scalars(stmt, execution_options={"populate_existing": True})
+    ).one()
+    await db.commit()
+    print(f"[DB] 保存分析结果 voice_record_id={voice_record_id}")
     return result
+
+
+async def finish_record_async(
+    db, record_id: int, notify: tuple[str, str] | None = None, **analysis
+) -> str | None:
+    """finish_record 的异步版本"""
+    *leading, last = build_finish_statements(
+        db.get_bind().dialect.name, record_id, notify=_notify_for(db, notify), **analysis
+    )
+    for stmt in leading:
+        await db.execute(stmt)
+    new_status = (await db.execute(last)).scalar()
+    await db.commit()
+    return _log_finished(record_id, new_status)
+
+
+async def save_record_timing_async(
+    db, record_id: int, user_id: int, status: str, timings: dict
+):
+    """追加一行分阶段耗时, 未出现的阶段 (如 ASR 前就失败) 留空"""
+    values = {key: timings.get(key) for key in TIMING_FIELDS if key != "rtf"}
+    if timings.get("asr") is not None and timings.get("audio_duration"):
+        values["rtf"] = timings["asr"] / timings["audio_duration"]
+    db.add(
+        RecordTiming(
+            record_id=record_id,
+            user_id=user_id,
+            status=status,
+            llm_attempts=timings.get("llm_attempts"),
+            asr_model=timings.get("asr_model"),
+            **values,
+        )
+    )
+    await db.commit()
+
+
+async def get_record_timings_async(db, record_id: int) -> list[dict]:
+    """一条记录每次处理的分阶段耗时, 按时间先后"""
+    result = await db.execute(
+        select(RecordTiming)
+        .where(RecordTiming.record_id == record_id)
+        .order_by(RecordTiming.id)
+    )
+    return [
+        {
+            column.name: getattr(row, column.name)
+            for column in RecordTiming.__table__.columns
+        }
+        for row in result.scalars()
+    ]
+
+
+def _percentile(values: list[float], q: float) -> float | None:
+    """线性插值分位数, 与 Postgres percentile_cont 一致"""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+async def timing_percentiles_async(
+    db,
+    group_by: str,
+    since: datetime,
+    user_id: int | None = None,
+    quantiles: tuple = (0.5, 0.9, 0.99),
+) -> list[dict]:
+    """
+    按天 (group_by="day") 或用户 (group_by="user") 汇总各阶段耗时的分位数
+    Postgres 用 percentile_cont 在库内计算; 其他方言 (SQLite 脚本) 取出后在 Python 里算
+
+    Returns:
+        [{"group": ..., "count": n, "asr": {"p50": .., "p90": .., "p99": ..}, ...}]
+    """
+    group = (
+        func.date(RecordTiming.created_at)
+        if group_by == "day"
+        else RecordTiming.user_id
+    ).label("group")
+    conditions = [RecordTiming.created_at >= since]
+    if user_id is not None:
+        conditions.append(RecordTiming.user_id == user_id)
+    labels = {q: f"p{round(q * 100)}" for q in quantiles}
+
+    if db.get_bind().dialect.name == "postgresql":
+        columns = [group, func.count().label("count")]
+        for name in TIMING_FIELDS:
+            for q in quantiles:
+                columns.append(
+                    func.percentile_cont(q)
+                    .within_group(getattr(RecordTiming, name))
+                    .label(f"{name}_{labels[q]}")
+                )
+        rows = (
+            await db.execute(
+                select(*columns).where(*conditions).group_by(group).order_by(group)
+            )
+        ).all()
+        return [
+            {
+                "group": str(row.group),
+                "count": row.count,
+                **{
+                    name: {
+                        labels[q]: getattr(row, f"{name}_{labels[q]}")
+                        for q in quantiles
+                    }
+                    for name in TIMING_FIELDS
+                },
+            }
+            for row in rows
+        ]
+
+    rows = (
+        await db.execute(
+            select(group, *(getattr(RecordTiming, n) for n in TIMING_FIELDS)).where(
+                *conditions
+            )
+        )
+    ).all()
+    grouped: dict = {}
+    for row in rows:
+        grouped.setdefault(row.group, []).append(row)
+    return [
+        {
+            "group": str(key),
+            "count": len(members),
+            **{
+                name: {
+                    labels[q]: _percentile(
+                        [
+                            getattr(m, name)
+                            for m in members
+                            if getattr(m, name) is not None
+                        ],
+                        q,
+                    )
+                    for q in quantiles
+                }
+                for name in TIMING_FIELDS
+            },
+        }
+        for key, members in sorted(grouped.items())
+    ]
@@ -1,6 +1,6 @@
-import requests
 import json
 import time
+from . import metrics, tracing
 from .config import settings
 
 
@@ -64,10 +64,27 @@ Output: {{"refined_text": "Did I take my morning medicine?", "confidence": 0.75,
 - reason: string, 推理理由"""
 
 
+def _finish(result: dict, started: float, attempts: int, failed: bool = False) -> dict:
+    """记录 LLM 耗时 (含重试与退避)、请求次数与决策分布"""
+    elapsed = time.perf_counter() - started
+    metrics.stage_duration.labels("llm").observe(elapsed)
+    metrics.llm_attempts.observe(attempts)
+    metrics.add_timing("llm", elapsed)
+    metrics.set_record_value("llm_attempts", attempts)
+    metrics.decisions.labels(result.get("decision", "reject")).inc()
+    if failed:
+        metrics.errors.labels("llm").inc()
+    return result
+
+
 def infer_intent(asr_text: str, user_profile: dict) -> dict:
     """
     Combine user profile for intent inference (with retry)
     """
+    # requests (连同 urllib3/charset_normalizer) 在首次推理时才导入, 不计入进程启动
+    import requests
+
+    started = time.perf_counter()
     system_prompt = _build_system_prompt(user_profile)
 
     headers = {
@@ -87,11 +104,19 @@ def infer_intent(asr_text: str, user_profile: dict) -> dict:
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            resp = requests.post(
-                settings.AI_AGENT_LLM_API_URL, headers=headers, json=payload, timeout=30
-            )
-            # 如果响应状态码不是200, 抛出异常
-            resp.raise_for_status()
+            with tracing.span(
+                "llm.request", model=settings.LLM_MODEL_NAME, attempt=attempt + 1
+            ) as request_span:
+                resp = requests.post(
+                    settings.AI_AGENT_LLM_API_URL,
+                    headers=headers,
+                    json=payload,
+                    timeout=30,
+                )
+                if request_span is not None:
+                    request_span.set_attribute("http_status", resp.status_code)
+                # 如果响应状态码不是200, 抛出异常
+                resp.raise_for_status()
 
             content = resp.json()["choices"][0]["message"]["content"]
             result = json.loads(content)
@@ -116,7 +141,7 @@ def infer_intent(asr_text: str, user_profile: dict) -> dict:
                 # 未知决策类型
                 result["response_text"] = refined_text
 
-            return result
+            return _finish(result, started, attempt + 1)
 
         except (
             requests.exceptions.RequestException,
@@ -132,21 +157,31 @@ def infer_intent(asr_text: str, user_profile: dict) -> dict:
                 continue
             else:
                 print(f"[LLM推理] 最终失败: {e}")
-                return {
-                    "refined_text": asr_text,
-                    "confidence": 0.0,
-                    "decision": "reject",
-                    "reason": f"推理服务不可用(重试{max_retries}次后失败): {e}",
-                    "response_text": "抱歉，语音服务暂时不可用，请稍后再试。",
-                }
+                return _finish(
+                    {
+                        "refined_text": asr_text,
+                        "confidence": 0.0,
+                        "decision": "reject",
+                        "reason": f"推理服务不可用(重试{max_retries}次后失败): {e}",
+                        "response_text": "抱歉，语音服务暂时不可用，请稍后再试。",
+                    },
+                    started,
+                    attempt + 1,
+                    failed=True,
+                )
 
         except Exception as e:
             # 其他错误(如JSON解析), 不重试
             print(f"[LLM推理] 处理失败: {e}")
-            return {
-                "refined_text": asr_text,
-                "confidence": 0.0,
-                "decision": "reject",
-                "reason": f"推理处理失败: {e}",
-                "response_text": "抱歉，处理您的请求时出现错误。",
-            }
+            return _finish(
+                {
+                    "refined_text": asr_text,
+                    "confidence": 0.0,
+                    "decision": "reject",
+                    "reason": f"推理处理失败: {e}",
+                    "response_text": "抱歉，处理您的请求时出现错误。",
+                },
+                started,
+                attempt + 1,
+                failed=True,
+            )
@@ -0,0 +1,126 @@
+"""
+Prometheus 指标, 由 main.py 的 GET /metrics 导出
+- agent_stage_duration_seconds{stage}: download / asr / llm (含重试) / tts / upload 耗时直方图
+- agent_llm_attempts: 每次 LLM 推理发出的请求数 (1 表示没有重试)
+- agent_decisions_total{decision}: accept / boundary / reject 分布
+- agent_errors_total{stage}: 各阶段出错次数 (含被吞掉后降级返回的错误)
+- agent_model_loaded{model}: whisper / cosyvoice 是否已加载到内存
+- agent_asr_routes_total{tier, reason}: ASR 分档路由结果 (ASR_MODE=routed)
+- agent_asr_escalations_total: 小模型置信度低, 改用大模型重新解码的次数
+- agent_in_flight / agent_queue_depth: 抓取时从准入控制读取
+- agent_profile_cache_*: 抓取时从画像缓存读取
+- 进程 RSS/CPU/文件句柄由 prometheus_client 自带的 process collector 导出
+  (process_resident_memory_bytes 等)
+
+流水线用 record_timings() 为当前记录绑定一个字典, 绑定期间 timed() 与 add_timing()
+同时把耗时累加到这条记录上 (contextvar, asyncio.to_thread 的线程里同样可见)
+timed() 同时是一个追踪 span (见 tracing), 处于 trace 中时记录下来
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from . import tracing
+from .profile_cache import profile_cache
+
+# 短音频 ASR/TTS 在秒级, LLM 重试退避可达十几秒, 上限覆盖到两分钟
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+stage_duration = Histogram(
+    "agent_stage_duration_seconds",
+    "各阶段耗时 (秒)",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+llm_attempts = Histogram(
+    "agent_llm_attempts", "每次 LLM 推理的请求次数", buckets=(1, 2, 3, 4, 5)
+)
+decisions = Counter("agent_decisions_total", "LLM 决策分布", ["decision"])
+errors = Counter("agent_errors_total", "各阶段出错次数", ["stage"])
+model_loaded = Gauge("agent_model_loaded", "模型是否已加载 (1/0)", ["model"])
+asr_routes = Counter("agent_asr_routes_total", "ASR 分档路由结果", ["tier", "reason"])
+asr_escalations = Counter(
+    "agent_asr_escalations_total", "ASR 低置信度升级到大模型重新解码的次数"
+)
+in_flight = Gauge("agent_in_flight", "正在执行的记录数")
+queue_depth = Gauge("agent_queue_depth", "排队中的任务数")
+
+for _model in ("whisper", "cosyvoice"):
+    model_loaded.labels(_model).set(0)
+
+_record_timings: ContextVar[dict | None] = ContextVar("record_timings", default=None)
+
+
+@contextmanager
+def record_timings(timings: dict):
+    """在 with 块内把耗时记到 timings 上 (字段 -> 秒)"""
+    token = _record_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _record_timings.reset(token)
+
+
+def add_timing(name: str, seconds: float):
+    """累加到当前记录的 timings; 未绑定记录时忽略"""
+    timings = _record_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def set_record_value(name: str, value):
+    """为当前记录设置一个非累加的值 (音频时长、LLM 请求次数)"""
+    timings = _record_timings.get()
+    if timings is not None:
+        timings[name] = value
+
+
+@contextmanager
+def timed(stage: str, **attributes):
+    """记录一段代码的耗时与 span; 抛出异常时同时计入该阶段的错误数"""
+    start = time.perf_counter()
+    try:
+        with tracing.span(stage, **attributes):
+            yield
+    except Exception:
+        errors.labels(stage).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration.labels(stage).observe(elapsed)
+        add_timing(stage, elapsed)
+
+
+class _ProfileCacheCollector:
+    """抓取时读取 profile_cache 的计数, 查询路径上不额外打点"""
+
+    def collect(self):
+        stats = profile_cache.stats()
+        lookups = CounterMetricFamily(
+            "agent_profile_cache_lookups", "画像缓存查询结果", labels=["result"]
+        )
+        for result in ("hits", "misses", "revalidations"):
+            lookups.add_metric([result], stats[result])
+        yield lookups
+        yield GaugeMetricFamily(
+            "agent_profile_cache_size", "画像缓存条目数", value=stats["size"]
+        )
+
+
+REGISTRY.register(_ProfileCacheCollector())
+
+
+def render() -> tuple[bytes, str]:
+    """返回 (文本格式的指标, Content-Type)"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
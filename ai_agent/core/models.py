@@ -0,0 +1,266 @@
+"""
+模型生命周期管理: 按需加载、空闲卸载、原子热切换
+Whisper 与 CosyVoice 原先分别由模块级 _model 与 TTSService 单例持有, 加载后常驻到进程退出,
+切换 WHISPER_MODEL 只能重启; 这里统一由 ModelRegistry 管理:
+- use(name): 推理期间持有模型的引用计数, 未加载时按需加载 (同一模型只加载一次)
+- load(name, version): 加载新版本后在锁内替换当前版本, 之后的请求用新模型;
+  正在推理的任务继续用旧模型, 最后一个引用释放时旧模型才被卸载
+- unload(name): 立即卸载 (有任务在用时等任务结束); 下次 use 时按最近一次 load 的版本重新加载
+- MODEL_IDLE_UNLOAD_SECONDS > 0 时, lifespan 中的 run_idle_reaper 定期卸载空闲超时的模型
+
+注意:
+- 热切换只影响当前进程; prefork 多 worker 时管理接口只落到其中一个 worker,
+  需要对每个 worker 调用 (或改配置后重启)
+- prefork 主进程预加载的权重是各 worker 共享的写时复制页, worker 卸载只减少自身的引用,
+  物理内存要等所有 worker 都卸载后才释放
+"""
+
+import asyncio
+import gc
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable
+
+from . import metrics, weights
+from .config import settings
+
+
+class ModelHandle:
+    """某个版本的已加载模型, refs 为正在使用它的任务数"""
+
+    __slots__ = (
+        "name",
+        "version",
+        "model",
+        "loaded_at",
+        "load_s",
+        "last_used",
+        "refs",
+        "retired",
+    )
+
+    def __init__(self, name: str, version: str, model: Any, load_s: float):
+        self.name = name
+        self.version = version
+        self.model = model
+        self.loaded_at = time.time()
+        self.load_s = load_s
+        self.last_used = time.monotonic()
+        self.refs = 0
+        self.retired = False  # 已被替换/卸载, 等引用归零后释放
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "load_s": round(self.load_s, 2),
+            "idle_s": round(time.monotonic() - self.last_used, 1),
+            "in_use": self.refs,
+        }
+
+
+class _Entry:
+    """注册的模型: 加载函数、目标版本、当前版本与等待释放的旧版本"""
+
+    def __init__(
+        self, loader: Callable[[str], Any], default_version: Callable[[], str]
+    ):
+        self.loader = loader
+        self.default_version = default_version
+        self.version: str | None = None  # 最近一次 load 指定的版本, None 时用默认版本
+        self.current: ModelHandle | None = None
+        self.retired: list[ModelHandle] = []
+        self.load_lock = threading.Lock()  # 同一模型同时只有一个加载过程
+        self.loads = 0
+        self.unloads = 0
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: dict[str, _Entry] = {}
+
+    def register(
+        self,
+        name: str,
+        loader: Callable[[str], Any],
+        default_version: Callable[[], str],
+    ):
+        """loader(version) 返回加载好的模型; default_version() 为未指定版本时加载的版本"""
+        with self._lock:
+            self._entries.setdefault(name, _Entry(loader, default_version))
+
+    def names(self) -> list[str]:
+        return list(self._entries)
+
+    def default_version(self, name: str) -> str:
+        return self._entry(name).default_version()
+
+    def _entry(self, name: str) -> _Entry:
+        try:
+            return self._entries[name]
+        except KeyError:
+            raise KeyError(f"未注册的模型: {name}") from None
+
+    def load(self, name: str, version: str | None = None) -> ModelHandle:
+        """
+        加载 version (默认为目标版本) 并设为当前版本, 已是当前版本时直接返回
+        加载在注册表锁外进行, 期间请求继续使用旧版本
+        """
+        entry = self._entry(name)
+        with entry.load_lock:
+            with self._lock:
+                if version is not None:
+                    entry.version = version
+                target = entry.version or entry.default_version()
+                current = entry.current
+                if current is not None and current.version == target:
+                    return current
+
+            print(f"[Models] 正在加载 {name}:{target} ...")
+            # 不同模型的加载也串行: CosyVoice 的映射加载会临时替换全局的 torch 函数
+            with weights.LOAD_LOCK:
+                started = time.perf_counter()
+                model = entry.loader(target)
+            handle = ModelHandle(name, target, model, time.perf_counter() - started)
+            print(f"[Models] {name}:{target} 加载完成 ({handle.load_s:.1f}s)")
+
+            with self._lock:
+                previous, entry.current = entry.current, handle
+                entry.loads += 1
+                self._retire(entry, previous)
+            metrics.model_loaded.labels(name).set(1)
+            return handle
+
+    def unload(self, name: str) -> bool:
+        """卸载当前版本, 返回是否有模型被卸载; 正在使用的任务结束后才真正释放"""
+        entry = self._entry(name)
+        with entry.load_lock:
+            with self._lock:
+                previous, entry.current = entry.current, None
+                if previous is None:
+                    return False
+                entry.unloads += 1
+                self._retire(entry, previous)
+        metrics.model_loaded.labels(name).set(0)
+        print(f"[Models] 已卸载 {name}:{previous.version}")
+        return True
+
+    def _retire(self, entry: _Entry, handle: ModelHandle | None):
+        """调用方持有 self._lock; 无人使用的旧模型立即释放, 否则等最后一个引用"""
+        if handle is None:
+            return
+        handle.retired = True
+        if handle.refs == 0:
+            self._release(handle)
+        else:
+            entry.retired.append(handle)
+
+    def _release(self, handle: ModelHandle):
+        handle.model = None
+        # 真正的回收 (gc / 归还显存与堆内存) 放到锁外的线程里, 不阻塞获取模型的请求
+        threading.Thread(target=_free_memory, name="model-release", daemon=True).start()
+
+    @contextmanager
+    def use(self, name: str):
+        """推理期间持有模型 (yield ModelHandle), 未加载时按需加载"""
+        entry = self._entry(name)
+        while True:
+            with self._lock:
+                handle = entry.current
+                if handle is not None:
+                    handle.refs += 1
+                    break
+            self.load(name)
+        try:
+            yield handle
+        finally:
+            with self._lock:
+                handle.refs -= 1
+                handle.last_used = time.monotonic()
+                if handle.retired and handle.refs == 0 and handle in entry.retired:
+                    entry.retired.remove(handle)
+                    self._release(handle)
+
+    def get(self, name: str) -> Any:
+        """返回当前模型 (按需加载), 不持有引用, 仅供预加载等不需要防止热切换的场景"""
+        with self.use(name) as handle:
+            return handle.model
+
+    def unload_idle(self, idle_seconds: float) -> list[str]:
+        """卸载空闲超过 idle_seconds 且无任务在用的模型, 返回被卸载的模型名"""
+        now = time.monotonic()
+        idle = []
+        with self._lock:
+            for name, entry in self._entries.items():
+                handle = entry.current
+                if handle is not None and handle.refs == 0:
+                    if now - handle.last_used >= idle_seconds:
+                        idle.append(name)
+        return [name for name in idle if self.unload(name)]
+
+    async def run_idle_reaper(self):
+        """后台任务: 定期卸载空闲超时的模型 (MODEL_IDLE_UNLOAD_SECONDS <= 0 时不启动)"""
+        idle_seconds = settings.MODEL_IDLE_UNLOAD_SECONDS
+        interval = min(60.0, max(1.0, idle_seconds / 4))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                unloaded = await asyncio.to_thread(self.unload_idle, idle_seconds)
+            except Exception as e:
+                print(f"[Models] 空闲卸载失败: {e}")
+                continue
+            if unloaded:
+                print(
+                    f"[Models] 空闲超过 {idle_seconds:.0f}s, 已卸载: {', '.join(unloaded)}"
+                )
+
+    def stats(self) -> dict:
+        """各模型的当前版本、使用情况与进程内存 (MB)"""
+        with self._lock:
+            models = {
+                name: {
+                    "target_version": entry.version or entry.default_version(),
+                    "current": entry.current.info() if entry.current else None,
+                    "draining": [h.info() for h in entry.retired],
+                    "loads": entry.loads,
+                    "unloads": entry.unloads,
+                }
+                for name, entry in self._entries.items()
+            }
+        return {
+            "models": models,
+            "idle_unload_seconds": settings.MODEL_IDLE_UNLOAD_SECONDS,
+            "memory": _memory(),
+        }
+
+
+def _free_memory():
+    import sys
+
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    try:
+        # glibc 不会主动把释放的大块堆内存还给系统
+        import ctypes
+
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def _memory() -> dict:
+    import sys
+
+    memory = weights.memory_stats()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        memory["cuda_allocated"] = round(torch.cuda.memory_allocated() / 2**20, 1)
+        memory["cuda_reserved"] = round(torch.cuda.memory_reserved() / 2**20, 1)
+    return memory
+
+
+registry = ModelRegistry()
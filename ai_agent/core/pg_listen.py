@@ -0,0 +1,37 @@
+"""
+Postgres LISTEN 公共循环: 独立的 asyncpg 连接, 断线后指数退避重连
+重连期间可能错过通知, 调用方在 on_connect 里做补偿 (如清空缓存)
+"""
+
+import asyncio
+
+from .config import settings
+
+
+async def listen(channel: str, callback, on_connect=None, name: str = "PG"):
+    """
+    订阅 channel 直到任务被取消
+    callback(connection, pid, channel, payload) 为 asyncpg 的监听回调
+    """
+    import asyncpg
+
+    backoff = 1
+    while True:
+        try:
+            conn = await asyncpg.connect(settings.DATABASE_URL)
+            try:
+                await conn.add_listener(channel, callback)
+                if on_connect is not None:
+                    on_connect()
+                backoff = 1
+                print(f"[{name}] 已订阅频道 {channel}")
+                while not conn.is_closed():
+                    await asyncio.sleep(5)
+            finally:
+                await conn.close()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[{name}] 订阅失败, {backoff}秒后重试: {e}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60)
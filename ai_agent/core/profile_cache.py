@@ -0,0 +1,207 @@
+"""
+用户画像进程内缓存
+- UserProfile: 不可变、__slots__ 的画像对象, 替代每次新建的 dict
+- ProfileCache: TTL + 最大条数 (LRU 淘汰), 过期后由调用方用 updated_at 做版本校验
+- listen_profile_changes: 订阅 Postgres NOTIFY, Go 后端更新用户后立即失效对应缓存
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from .config import settings
+from .pg_listen import listen
+
+# Go 后端 UserRepo.Update 成功后 pg_notify 的频道, payload 为 user_id
+PROFILE_CHANNEL = "user_profile_changed"
+
+
+class UserProfile:
+    """用户画像 (只读), 兼容原来 dict 的 .get() / [] 访问方式"""
+
+    __slots__ = (
+        "user_id",
+        "name",
+        "age",
+        "condition",
+        "habits",
+        "common_needs",
+        "version",
+    )
+
+    def __init__(
+        self,
+        user_id: int,
+        name: str | None = None,
+        age: int | None = None,
+        condition: str | None = None,
+        habits: str | None = None,
+        common_needs: tuple = (),
+        version: datetime | None = None,
+    ):
+        for key, value in (
+            ("user_id", user_id),
+            ("name", name),
+            ("age", age),
+            ("condition", condition),
+            ("habits", habits),
+            ("common_needs", tuple(common_needs)),
+            ("version", version),
+        ):
+            object.__setattr__(self, key, value)
+
+    @classmethod
+    def from_user(cls, user_id: int, user) -> "UserProfile":
+        """由 ORM User 行构建, 用户不存在时返回空画像"""
+        if user is None:
+            return cls(user_id)
+        return cls(
+            user_id=user.id,
+            name=user.name or user.username,
+            age=user.age,
+            condition=user.condition,
+            habits=user.habits,
+            common_needs=(
+                tuple(
+                    need.strip()
+                    for need in user.common_needs.split(",")
+                    if need.strip()
+                )
+                if user.common_needs
+                else ()
+            ),
+            version=user.updated_at,
+        )
+
+    def __setattr__(self, key, value):
+        raise AttributeError("UserProfile 是只读对象")
+
+    def __delattr__(self, key):
+        raise AttributeError("UserProfile 是只读对象")
+
+    def __bool__(self) -> bool:
+        # 与原来的空 dict 语义一致: 用户不存在时为假
+        return self.name is not None
+
+    def get(self, key: str, default=None):
+        """字段为空时返回 default, 与原 dict 的 "未知" 默认值行为一致"""
+        if key not in self.__slots__:
+            return default
+        value = getattr(self, key)
+        return default if value is None or value == () else value
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.get("name", "未知"),
+            "age": self.get("age", "未知"),
+            "condition": self.get("condition", "未知"),
+            "habits": self.get("habits", "未知"),
+            "common_needs": list(self.common_needs),
+        }
+
+    def __repr__(self) -> str:
+        return f"UserProfile(user_id={self.user_id}, name={self.name!r})"
+
+
+class ProfileCache:
+    """线程安全的 TTL + LRU 画像缓存"""
+
+    def __init__(self, ttl_seconds: float, max_size: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[int, tuple[UserProfile, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int) -> tuple[UserProfile | None, bool]:
+        """
+        Returns:
+            (画像, 是否仍在 TTL 内); 过期条目仍返回画像, 供调用方做 updated_at 校验
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None, False
+            self._entries.move_to_end(user_id)
+            profile, expires_at = entry
+            fresh = time.monotonic() < expires_at
+            if fresh:
+                self.hits += 1
+            return profile, fresh
+
+    def put(self, profile: UserProfile):
+        with self._lock:
+            self._entries[profile.user_id] = (
+                profile,
+                time.monotonic() + self.ttl_seconds,
+            )
+            self._entries.move_to_end(profile.user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def touch(self, user_id: int):
+        """版本校验通过: 续期, 不重建画像"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self.revalidations += 1
+                self._entries[user_id] = (entry[0], time.monotonic() + self.ttl_seconds)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "invalidations": self.invalidations,
+            }
+
+
+profile_cache = ProfileCache(
+    ttl_seconds=settings.PROFILE_CACHE_TTL,
+    max_size=settings.PROFILE_CACHE_MAX_SIZE,
+)
+
+
+def _on_profile_notify(connection, pid, channel, payload):
+    try:
+        profile_cache.invalidate(int(payload))
+        print(f"[ProfileCache] 用户 {payload} 画像已变更, 缓存失效")
+    except ValueError:
+        # payload 不是 user_id 时保守处理: 全部失效
+        profile_cache.clear()
+
+
+async def listen_profile_changes():
+    """
+    订阅 Postgres NOTIFY (频道 user_profile_changed), 断线后重连
+    重连期间可能错过通知, 所以每次 (重新) 连接成功后清空缓存
+    """
+    await listen(
+        PROFILE_CHANNEL,
+        _on_profile_notify,
+        on_connect=profile_cache.clear,
+        name="ProfileCache",
+    )
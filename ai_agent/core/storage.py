@@ -1,35 +1,278 @@
+"""
+对象存储, 按 Settings.STORAGE_BACKEND 选择实现, 首次使用时才创建 (导入本模块不连接 MinIO)
+- minio: MinIO / S3 (默认, 与 Go 后端共用同一个 bucket)
+- local: 本地目录 STORAGE_LOCAL_DIR/<bucket>/<key>, 单机部署与离线压测;
+  读写文件优先 os.link (同一文件系统时零拷贝), 否则 shutil.copyfile (Linux 上走 sendfile)
+- memory: 进程内字典, 进程退出即丢失, 仅测试和压测
+
+download_file / upload_file / delete_file 保持原有接口, 调用方不关心具体实现
+"""
+
+import io
 import os
+import shutil
 import tempfile
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from minio import Minio
-from minio.error import S3Error
-from .config import settings
 
-# 初始化 MinIO 客户端
-client = Minio(
-    settings.MINIO_ENDPOINT.replace("http://", "").replace("https://", ""),
-    access_key=settings.MINIO_ROOT_USER,
-    secret_key=settings.MINIO_ROOT_PASSWORD,
-    secure=settings.MINIO_SECURE,
-)
+from . import metrics
+from .config import settings
 
 BUCKET_NAME = settings.MINIO_BUCKET_NAME
 
+# put_stream 未知长度时 MinIO 分片上传的分片大小 (下限 5MB)
+STREAM_PART_SIZE = 10 * 1024 * 1024
 
-def ensure_bucket():
-    """确保 MinIO 存储桶存在"""
+
+class StorageBackend:
+    """对象存储接口, key 为 bucket 内的对象名"""
+
+    def __init__(self, bucket: str):
+        self.bucket = bucket
+
+    def ensure_bucket(self):
+        """确保 bucket 存在"""
+
+    def get_file(self, key: str, local_path: str):
+        """下载对象到本地文件; 对象不存在抛 FileNotFoundError 或后端自己的异常"""
+        raise NotImplementedError
+
+    def put_file(self, local_path: str, key: str):
+        """上传本地文件; 调用方之后可以删除 local_path"""
+        raise NotImplementedError
+
+    def open(self, key: str):
+        """以二进制流读取对象, 返回上下文管理器 (with 块内有效)"""
+        raise NotImplementedError
+
+    def put_stream(self, key: str, stream, length: int = -1):
+        """从二进制流写入对象, length 未知时传 -1"""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        """删除对象, 不存在时忽略"""
+        raise NotImplementedError
+
+    def url(self, key: str) -> str:
+        """前端可访问的地址 (通过 Nginx 代理, STORAGE_URL_PREFIX/<bucket>/<key>)"""
+        return f"{settings.STORAGE_URL_PREFIX}/{self.bucket}/{key}"
+
+
+class MinioStorage(StorageBackend):
+    def __init__(self, bucket: str):
+        from minio import Minio
+
+        super().__init__(bucket)
+        self.client = Minio(
+            settings.MINIO_ENDPOINT.replace("http://", "").replace("https://", ""),
+            access_key=settings.MINIO_ROOT_USER,
+            secret_key=settings.MINIO_ROOT_PASSWORD,
+            secure=settings.MINIO_SECURE,
+        )
+        self._bucket_ready = False
+
+    def ensure_bucket(self):
+        # 每次上传都检查会多一次往返, 确认存在后不再检查
+        if self._bucket_ready:
+            return
+        from minio.error import S3Error
+
+        try:
+            if not self.client.bucket_exists(self.bucket):
+                self.client.make_bucket(self.bucket)
+                print(f"[MinIO] 创建存储桶: {self.bucket}")
+            self._bucket_ready = True
+        except S3Error as e:
+            print(f"[MinIO] 检查存储桶失败: {e}")
+
+    def get_file(self, key: str, local_path: str):
+        self.client.fget_object(self.bucket, key, local_path)
+
+    def put_file(self, local_path: str, key: str):
+        self.client.fput_object(self.bucket, key, local_path)
+
+    @contextmanager
+    def open(self, key: str):
+        response = self.client.get_object(self.bucket, key)
+        try:
+            yield response
+        finally:
+            response.close()
+            response.release_conn()
+
+    def put_stream(self, key: str, stream, length: int = -1):
+        self.client.put_object(
+            self.bucket,
+            key,
+            stream,
+            length,
+            part_size=STREAM_PART_SIZE if length < 0 else 0,
+        )
+
+    def exists(self, key: str) -> bool:
+        from minio.error import S3Error
+
+        try:
+            self.client.stat_object(self.bucket, key)
+            return True
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchBucket"):
+                return False
+            raise
+
+    def delete(self, key: str):
+        self.client.remove_object(self.bucket, key)
+
+
+def _link_or_copy(src: str, dst: str):
+    """dst 指向 src 的内容: 同一文件系统时硬链接, 否则复制; dst 已存在时原子替换"""
+    tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
     try:
-        if not client.bucket_exists(BUCKET_NAME):
-            client.make_bucket(BUCKET_NAME)
-            print(f"[MinIO] 创建存储桶: {BUCKET_NAME}")
-    except S3Error as e:
-        print(f"[MinIO] 检查存储桶失败: {e}")
+        try:
+            os.link(src, tmp)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            # 跨文件系统 (EXDEV) 或文件系统不支持硬链接
+            shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+class LocalStorage(StorageBackend):
+    """
+    对象存为 <root>/<bucket>/<key>; 写入先落到同目录临时文件再 os.replace, 读者不会看到半个文件
+    硬链接让下载得到的文件与存储中的对象共享 inode, 流水线只读取下载的音频, 不会改写它
+    """
+
+    def __init__(self, bucket: str, root: str):
+        super().__init__(bucket)
+        self.root = os.path.abspath(root)
+
+    def _path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, self.bucket, key))
+        if not path.startswith(os.path.join(self.root, self.bucket) + os.sep):
+            raise ValueError(f"非法的对象名: {key}")
+        return path
+
+    def ensure_bucket(self):
+        os.makedirs(os.path.join(self.root, self.bucket), exist_ok=True)
+
+    def get_file(self, key: str, local_path: str):
+        _link_or_copy(self._path(key), local_path)
+
+    def put_file(self, local_path: str, key: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _link_or_copy(local_path, path)
+
+    @contextmanager
+    def open(self, key: str):
+        with open(self._path(key), "rb") as f:
+            yield f
+
+    def put_stream(self, key: str, stream, length: int = -1):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(stream, f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self._path(key))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class MemoryStorage(StorageBackend):
+    def __init__(self, bucket: str):
+        super().__init__(bucket)
+        self._objects: dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> bytes:
+        with self._lock:
+            if key not in self._objects:
+                raise FileNotFoundError(f"对象不存在: {key}")
+            return self._objects[key]
+
+    def _put(self, key: str, data: bytes):
+        with self._lock:
+            self._objects[key] = data
+
+    def get_file(self, key: str, local_path: str):
+        Path(local_path).write_bytes(self._get(key))
+
+    def put_file(self, local_path: str, key: str):
+        self._put(key, Path(local_path).read_bytes())
+
+    @contextmanager
+    def open(self, key: str):
+        yield io.BytesIO(self._get(key))
+
+    def put_stream(self, key: str, stream, length: int = -1):
+        self._put(key, stream.read())
+
+    def exists(self, key: str) -> bool:
+        with self._lock:
+            return key in self._objects
+
+    def delete(self, key: str):
+        with self._lock:
+            self._objects.pop(key, None)
+
+
+def create_backend(kind: str | None = None) -> StorageBackend:
+    """按 Settings.STORAGE_BACKEND 创建存储实现"""
+    kind = (kind or settings.STORAGE_BACKEND).lower()
+    if kind == "minio":
+        return MinioStorage(BUCKET_NAME)
+    if kind == "local":
+        return LocalStorage(BUCKET_NAME, settings.STORAGE_LOCAL_DIR)
+    if kind == "memory":
+        return MemoryStorage(BUCKET_NAME)
+    raise ValueError(f"未知的 STORAGE_BACKEND: {kind}")
+
+
+_backend: StorageBackend | None = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> StorageBackend:
+    """进程内共享的存储实现, 首次调用时创建 (下载/上传在线程池里并发调用)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+
+def ensure_bucket():
+    """确保存储桶存在"""
+    get_backend().ensure_bucket()
 
 
 def download_file(object_name: str, local_path: str = None) -> str:
-    """从 MinIO 下载文件
+    """从对象存储下载文件
     Args:
-        object_name: MinIO 对象名称
+        object_name: 对象名称
         local_path: 本地保存路径, 空则使用临时目录
     Returns:
         本地文件路径
@@ -45,42 +288,44 @@ def download_file(object_name: str, local_path: str = None) -> str:
 
     try:
         # 下载文件到文件夹里
-        client.fget_object(BUCKET_NAME, object_name, local_path)
-        print(f"[MinIO] 下载文件: {object_name} -> {local_path}")
+        with metrics.timed("download", object=object_name):
+            get_backend().get_file(object_name, local_path)
+        print(f"[Storage] 下载文件: {object_name} -> {local_path}")
         return local_path
-    except S3Error as e:
-        print(f"[MinIO] 下载文件失败: {e}")
+    except Exception as e:
+        print(f"[Storage] 下载文件失败: {e}")
         raise
 
 
 def upload_file(local_path: str, object_name: str = None) -> str:
-    """上传文件到 MinIO
+    """上传文件到对象存储
     Args:
         local_path: 本地文件路径
-        object_name: MinIO 对象名称, 空则使用文件名
+        object_name: 对象名称, 空则使用文件名
     Returns:
-        MinIO 对象 URL (前端可访问的代理地址)
+        对象 URL (前端可访问的代理地址)
     """
-    ensure_bucket()
+    backend = get_backend()
+    backend.ensure_bucket()
 
     if object_name is None:
         object_name = Path(local_path).name
 
     try:
-        client.fput_object(BUCKET_NAME, object_name, local_path)
-        # 返回前端可访问的 URL (通过 Nginx /minio-api/ 代理)，给前端的相对路径
-        object_url = f"/minio-api/{BUCKET_NAME}/{object_name}"
-        print(f"[MinIO] 上传文件: {local_path} -> {object_url}")
+        with metrics.timed("upload", object=object_name):
+            backend.put_file(local_path, object_name)
+        object_url = backend.url(object_name)
+        print(f"[Storage] 上传文件: {local_path} -> {object_url}")
         return object_url
-    except S3Error as e:
-        print(f"[MinIO] 上传文件失败: {e}")
+    except Exception as e:
+        print(f"[Storage] 上传文件失败: {e}")
         raise
 
 
 def delete_file(object_name: str):
-    """删除 MinIO 中的文件"""
+    """删除对象存储中的文件"""
     try:
-        client.remove_object(BUCKET_NAME, object_name)
-        print(f"[MinIO] 删除成功: {object_name}")
-    except S3Error as e:
-        print(f"[MinIO] 删除失败: {e}")
+        get_backend().delete(object_name)
+        print(f"[Storage] 删除成功: {object_name}")
+    except Exception as e:
+        print(f"[Storage] 删除失败: {e}")
@@ -0,0 +1,211 @@
+"""
+轻量追踪: OpenTelemetry 风格的 span 模型, 上下文格式兼容 W3C traceparent
+- start_trace(): 入口 (任务执行) 开启一条 trace 的根 span; traceparent 来自 Go agent_client
+  的请求头, 经任务队列持久化后在 worker 中接上
+- span(): 子 span, 挂在当前 span (contextvar) 或显式传入的 parent 下; 当前没有 trace 时
+  不做任何事, core 模块可以随处打点而不产生孤立的 trace (如队列轮询的数据库会话)
+- record_id / user_id 属性自动从父 span 继承
+- 导出器 (TRACE_EXPORTER): memory 进程内环形缓冲, GET /traces/{trace_id} 查询, 测试用;
+  file 以 JSON Lines 追加写入 TRACE_FILE; none 不导出
+"""
+
+import json
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from .config import settings
+
+INHERITED_ATTRIBUTES = ("record_id", "user_id")
+
+
+@dataclass(eq=False)
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None = None
+    attributes: dict = field(default_factory=dict)
+    sampled: bool = True
+    start: float = field(default_factory=time.time)
+    end: float | None = None
+    status: str = "ok"  # ok / error / cancelled
+    error: str | None = None
+
+    @property
+    def traceparent(self) -> str:
+        """以本 span 为父的 W3C traceparent"""
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": (
+                round((self.end - self.start) * 1000, 3) if self.end else None
+            ),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+def parse_traceparent(header: str | None) -> tuple[str, str, bool] | None:
+    """
+    解析 traceparent: <version>-<32 位 trace_id>-<16 位 parent_id>-<flags>
+    格式不合法时返回 None, 由调用方开启新的 trace
+    """
+    if not header:
+        return None
+    parts = header.strip().lower().split("-")
+    if len(parts) < 4 or parts[0] == "ff":
+        return None
+    version, trace_id, parent_id, flags = parts[:4]
+    if version == "00" and len(parts) != 4:
+        return None
+    if len(version) != 2 or len(trace_id) != 32 or len(parent_id) != 16:
+        return None
+    if len(flags) != 2:
+        return None
+    try:
+        int(trace_id, 16)
+        int(parent_id, 16)
+        sampled = bool(int(flags, 16) & 1)
+    except ValueError:
+        return None
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, sampled
+
+
+class InMemoryExporter:
+    """保留最近 max_spans 个 span, 按 trace_id 查询"""
+
+    def __init__(self, max_spans: int):
+        self._spans: deque[Span] = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+
+    def get_trace(self, trace_id: str) -> list[dict]:
+        with self._lock:
+            spans = [s for s in self._spans if s.trace_id == trace_id]
+        return [s.to_dict() for s in sorted(spans, key=lambda s: s.start)]
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+
+class FileExporter:
+    """每个结束的 span 追加一行 JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+
+def _create_exporter():
+    if settings.TRACE_EXPORTER == "memory":
+        return InMemoryExporter(settings.TRACE_MEMORY_SPANS)
+    if settings.TRACE_EXPORTER == "file":
+        return FileExporter(settings.TRACE_FILE)
+    return None
+
+
+exporter = _create_exporter()
+
+_current: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+def set_attribute(key: str, value):
+    """给当前 span 设置属性, 没有 trace 时忽略"""
+    span = _current.get()
+    if span is not None:
+        span.attributes[key] = value
+
+
+@contextmanager
+def _activate(span: Span):
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.status = "error" if isinstance(e, Exception) else "cancelled"
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        span.end = time.time()
+        _current.reset(token)
+        if exporter is not None and span.sampled:
+            exporter.export(span)
+
+
+@contextmanager
+def start_trace(name: str, traceparent: str | None = None, **attributes):
+    """开启根 span; traceparent 合法时接在上游 (Go) 的 span 下, 否则新开一条 trace"""
+    parsed = parse_traceparent(traceparent)
+    if parsed is not None:
+        trace_id, parent_id, sampled = parsed
+    else:
+        trace_id, parent_id, sampled = secrets.token_hex(16), None, True
+    root = Span(
+        name,
+        trace_id,
+        secrets.token_hex(8),
+        parent_id,
+        attributes,
+        sampled=sampled,
+    )
+    with _activate(root):
+        yield root
+
+
+@contextmanager
+def span(name: str, parent: Span | None = None, **attributes):
+    """子 span; parent 为空时挂在当前 span 下, 当前也没有 span 时不记录 (yield None)"""
+    parent = parent or _current.get()
+    if parent is None:
+        yield None
+        return
+    inherited = {
+        key: parent.attributes[key]
+        for key in INHERITED_ATTRIBUTES
+        if key in parent.attributes
+    }
+    child = Span(
+        name,
+        parent.trace_id,
+        secrets.token_hex(8),
+        parent.span_id,
+        {**inherited, **attributes},
+        sampled=parent.sampled,
+    )
+    with _activate(child):
+        yield child
@@ -2,16 +2,69 @@
 CosyVoice TTS Service - 基于阿里 ModelScope
 使用离线模型，无需代理，支持中英文合成
 采用延迟加载策略，避免启动时导入问题
+torch / torchaudio 同样在首次加载模型、合成时才导入, 不拖慢进程启动
 """
 
 import os
 import uuid
-import torch
-import torchaudio
+
+from . import metrics, models, weights
+from .config import settings
+
+# 模型保存目录 (convert_weights.py 默认从这里转换)
+MODEL_CACHE_DIR = "/app/models"
+MODEL_ID = "iic/CosyVoice-300M-SFT"
+MODEL_DIR = os.path.join(MODEL_CACHE_DIR, MODEL_ID)
+
+
+def _load(model_id: str):
+    """加载指定 ModelScope 模型 (默认 MODEL_ID), 由模型注册表在首次合成或热切换时调用"""
+    print("[TTS] 正在初始化 CosyVoice (首次运行会自动下载模型，约3-5GB)...")
+
+    model_dir = os.path.join(MODEL_CACHE_DIR, model_id)
+
+    try:
+        # 运行时动态导入，避免启动时就报错
+        import torch
+        from cosyvoice.cli.cosyvoice import CosyVoice
+
+        # 检查模型是否已下载
+        if not os.path.exists(model_dir):
+            print("[TTS] 模型不存在，正在从 ModelScope 下载...")
+            from modelscope import snapshot_download
+
+            model_dir = snapshot_download(model_id, cache_dir=MODEL_CACHE_DIR)
+        else:
+            print(f"[TTS] 使用已下载的模型: {model_dir}")
+
+        # 初始化 CosyVoice
+        print(f"[TTS] 正在加载 CosyVoice 模型...")
+        if settings.MODEL_MMAP_DIR and weights.has_cosyvoice(model_dir):
+            # 已转换为可映射格式 (convert_weights.py), 权重按需缺页读取
+            inference = weights.timed_load(
+                "cosyvoice (mmap)", weights.load_cosyvoice, model_dir
+            )
+        else:
+            inference = CosyVoice(model_dir)
+
+        device_info = "GPU" if torch.cuda.is_available() else "CPU"
+        print(f"[TTS] ✅ CosyVoice 加载成功！运行设备: {device_info}")
+        return inference
+
+    except Exception as e:
+        print(f"[TTS] ❌ CosyVoice 初始化失败: {e}")
+        import traceback
+
+        traceback.print_exc()
+        raise e
+
+
+# 模型由注册表持有 (core/models.py): 首次合成时加载, 可空闲卸载, 可切换版本
+models.registry.register("cosyvoice", _load, lambda: MODEL_ID)
 
 
 class TTSService:
-    """CosyVoice 语音合成服务 - 延迟加载版本"""
+    """CosyVoice 语音合成服务 - 模型由注册表按需加载"""
 
     _instance = None
     _initialized = False
@@ -28,50 +81,11 @@ class TTSService:
             return
 
         print("[TTS] CosyVoice 服务已就绪 (模型将在首次调用时加载)")
-        self.model_dir = None
-        self.inference = None
         TTSService._initialized = True
 
     def _ensure_loaded(self):
-        """确保模型已加载 - 延迟初始化，首次调用时才加载"""
-        if self.inference is not None:
-            return  # 已加载
-
-        print("[TTS] 正在初始化 CosyVoice (首次运行会自动下载模型，约3-5GB)...")
-
-        # 指定模型保存目录
-        cache_dir = "/app/models"
-        model_dir = os.path.join(cache_dir, "iic/CosyVoice-300M-SFT")
-
-        try:
-            # 运行时动态导入，避免启动时就报错
-            from cosyvoice.cli.cosyvoice import CosyVoice
-
-            # 检查模型是否已下载
-            if not os.path.exists(model_dir):
-                print("[TTS] 模型不存在，正在从 ModelScope 下载...")
-                from modelscope import snapshot_download
-
-                model_dir = snapshot_download(
-                    "iic/CosyVoice-300M-SFT", cache_dir=cache_dir
-                )
-            else:
-                print(f"[TTS] 使用已下载的模型: {model_dir}")
-
-            # 初始化 CosyVoice
-            print(f"[TTS] 正在加载 CosyVoice 模型...")
-            self.inference = CosyVoice(model_dir)
-            self.model_dir = model_dir
-
-            device_info = "GPU" if torch.cuda.is_available() else "CPU"
-            print(f"[TTS] ✅ CosyVoice 加载成功！运行设备: {device_info}")
-
-        except Exception as e:
-            print(f"[TTS] ❌ CosyVoice 初始化失败: {e}")
-            import traceback
-
-            traceback.print_exc()
-            raise e
+        """确保模型已加载 (预加载用), 返回当前的 CosyVoice 实例"""
+        return models.registry.get("cosyvoice")
 
     def _detect_language(self, text: str) -> str:
         """
@@ -118,25 +132,29 @@ class TTSService:
         Returns:
             生成的音频文件路径
         """
-        # 确保模型已加载
-        self._ensure_loaded()
-
         # 自动检测语言并选择音色
         speaker = self._detect_language(text)
         print(f"[TTS] 正在合成 ({speaker}): {text[:50]}...")
 
         try:
             # 定义同步函数来执行推理（避免阻塞主循环）
+            # 模型在线程里获取 (首次调用时加载), 持有到合成结束, 期间切换版本不影响本次合成
             def run_inference():
-                output = self.inference.inference_sft(text, speaker)
-                audio_data = []
-                for audio_chunk in output:
-                    audio_data.append(audio_chunk["tts_speech"])
-                return audio_data
+                with models.registry.use("cosyvoice") as handle:
+                    model_name = os.path.basename(handle.version)
+                    with metrics.timed("tts", model=model_name, speaker=speaker):
+                        output = handle.model.inference_sft(text, speaker)
+                        audio_data = []
+                        for audio_chunk in output:
+                            audio_data.append(audio_chunk["tts_speech"])
+                        return audio_data
 
             # 使用线程池执行推理
             import asyncio
 
+            import torch
+            import torchaudio
+
             audio_data = await asyncio.to_thread(run_inference)
 
             # 合并音频数据
@@ -0,0 +1,220 @@
+"""
+模型权重的内存映射加载 (MODEL_MMAP_DIR 非空时启用)
+原始 checkpoint (Whisper 的 fp16 .pt, CosyVoice 的 llm/flow/hift.pt) 用 torch.load 整体读入匿名内存,
+冷启动要读完几个 GB, 每个副本各持一份; 这里分两步:
+1. convert_whisper / convert_cosyvoice (convert_weights.py 调用): 浮点张量统一转成推理用的 fp32,
+   以 torch zip 格式另存到 MODEL_MMAP_DIR; CosyVoice 的其他文件 (yaml/onnx/spk2info) 软链接到原目录
+2. 加载时 torch.load(mmap=True) + load_state_dict(assign=True): 参数直接指向文件映射页, 不再复制;
+   冷启动变为按需缺页读取, 同一节点的多个进程 (prefork worker、多个容器) 共享页缓存
+
+权重页以 MAP_PRIVATE 映射, 推理只读不写, 页面保持 clean、可共享; 放到 GPU 或 .half() 之后会产生新的
+张量, 此时只省去加载阶段的一次复制
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from .config import settings
+
+COSYVOICE_CHECKPOINTS = ("llm.pt", "flow.pt", "hift.pt")
+
+# 进程内的模型加载互斥: mmap_loading 替换的是全局的 torch.load / load_state_dict,
+# 替换期间其他线程的加载 (管理接口、分档模型的按需加载) 也会被改成 mmap + assign;
+# 模型注册表的每次加载都持有此锁, mmap_loading 也持有, 两者不会交叠
+LOAD_LOCK = threading.RLock()
+
+
+def _to_fp32(state_dict: dict) -> dict:
+    return {
+        key: value.float() if value.is_floating_point() else value
+        for key, value in state_dict.items()
+    }
+
+
+def _save(obj, path: str):
+    import torch
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    torch.save(obj, tmp)
+    os.replace(tmp, path)
+
+
+# ---------------------------------------------------------------- Whisper
+
+
+def whisper_path(name: str) -> str:
+    return os.path.join(settings.MODEL_MMAP_DIR, "whisper", f"{name}.pt")
+
+
+def convert_whisper(name: str, download_root: str | None = None) -> str:
+    """把官方 Whisper checkpoint (必要时先下载) 转成可映射的 fp32 checkpoint, 返回输出路径"""
+    import torch
+    import whisper
+
+    if name in whisper._MODELS:
+        root = download_root or os.path.join(
+            os.path.expanduser("~"), ".cache", "whisper"
+        )
+        source = whisper._download(whisper._MODELS[name], root, False)
+    else:
+        source = name  # 本地 checkpoint 路径
+    checkpoint = torch.load(source, map_location="cpu")
+    output = whisper_path(os.path.splitext(os.path.basename(name))[0])
+    _save(
+        {
+            "dims": checkpoint["dims"],
+            "model_state_dict": _to_fp32(checkpoint["model_state_dict"]),
+        },
+        output,
+    )
+    return output
+
+
+def load_whisper(name: str):
+    """从 MODEL_MMAP_DIR 映射加载 Whisper, 与 whisper.load_model 得到的模型等价"""
+    import torch
+    import whisper
+    from whisper.model import AudioEncoder, ModelDimensions, TextDecoder, Whisper
+
+    checkpoint = torch.load(whisper_path(name), map_location="cpu", mmap=True)
+    dims = ModelDimensions(**checkpoint["dims"])
+    # 按 Whisper.__init__ 在 meta 设备上构建, 不为随机初始化的参数分配内存、不做初始化计算
+    # (Whisper.__init__ 末尾的 to_sparse 不支持 meta, 所以拆开构建)
+    model = Whisper.__new__(Whisper)
+    torch.nn.Module.__init__(model)
+    model.dims = dims
+    with torch.device("meta"):
+        model.encoder = AudioEncoder(
+            dims.n_mels,
+            dims.n_audio_ctx,
+            dims.n_audio_state,
+            dims.n_audio_head,
+            dims.n_audio_layer,
+        )
+        model.decoder = TextDecoder(
+            dims.n_vocab,
+            dims.n_text_ctx,
+            dims.n_text_state,
+            dims.n_text_head,
+            dims.n_text_layer,
+        )
+    model.load_state_dict(checkpoint["model_state_dict"], assign=True)
+
+    # 非持久化 buffer 不在 checkpoint 里, 按 whisper.model 的定义在 CPU 上重建
+    mask = torch.empty(dims.n_text_ctx, dims.n_text_ctx).fill_(-float("inf")).triu_(1)
+    model.decoder.register_buffer("mask", mask, persistent=False)
+    heads = torch.zeros(dims.n_text_layer, dims.n_text_head, dtype=torch.bool)
+    heads[dims.n_text_layer // 2 :] = True
+    model.register_buffer("alignment_heads", heads.to_sparse(), persistent=False)
+    if name in whisper._ALIGNMENT_HEADS:
+        model.set_alignment_heads(whisper._ALIGNMENT_HEADS[name])
+
+    leftover = [key for key, t in model.state_dict(keep_vars=True).items() if t.is_meta]
+    leftover += [key for key, t in model.named_buffers() if t.is_meta]
+    if leftover:
+        raise RuntimeError(f"Whisper 映射加载后仍有未初始化的张量: {leftover[:5]}")
+    if torch.cuda.is_available():
+        model = model.to("cuda")
+    return model
+
+
+# ---------------------------------------------------------------- CosyVoice
+
+
+def cosyvoice_dir(model_dir: str) -> str:
+    return os.path.join(
+        settings.MODEL_MMAP_DIR, "cosyvoice", os.path.basename(model_dir.rstrip("/"))
+    )
+
+
+def convert_cosyvoice(model_dir: str) -> str:
+    """生成 CosyVoice 的映射目录: 三个 checkpoint 转换, 其余文件软链接, 返回目录路径"""
+    import torch
+
+    output = cosyvoice_dir(model_dir)
+    os.makedirs(output, exist_ok=True)
+    for entry in os.listdir(model_dir):
+        source = os.path.join(os.path.abspath(model_dir), entry)
+        target = os.path.join(output, entry)
+        if entry in COSYVOICE_CHECKPOINTS:
+            _save(_to_fp32(torch.load(source, map_location="cpu")), target)
+        elif not os.path.lexists(target):
+            os.symlink(source, target)
+    return output
+
+
+def has_cosyvoice(model_dir: str) -> bool:
+    converted = cosyvoice_dir(model_dir)
+    return all(
+        os.path.isfile(os.path.join(converted, name)) for name in COSYVOICE_CHECKPOINTS
+    )
+
+
+@contextmanager
+def mmap_loading(model_dir: str):
+    """
+    CosyVoice 在构造函数里用 torch.load + load_state_dict 加载, 不暴露加载参数;
+    with 块内对 model_dir 下的文件改用 mmap 读取, load_state_dict 改为 assign
+    替换是进程全局的, 整个 with 块持有 LOAD_LOCK (块内只应构造这一个模型)
+    """
+    import torch
+
+    original_load = torch.load
+    original_load_state_dict = torch.nn.Module.load_state_dict
+    root = os.path.abspath(model_dir)
+
+    def load(f, *args, **kwargs):
+        if isinstance(f, (str, os.PathLike)) and os.path.abspath(f).startswith(root):
+            kwargs["mmap"] = True
+        return original_load(f, *args, **kwargs)
+
+    def load_state_dict(self, state_dict, strict=True, assign=False):
+        return original_load_state_dict(self, state_dict, strict=strict, assign=True)
+
+    with LOAD_LOCK:
+        torch.load = load
+        torch.nn.Module.load_state_dict = load_state_dict
+        try:
+            yield
+        finally:
+            torch.load = original_load
+            torch.nn.Module.load_state_dict = original_load_state_dict
+
+
+def load_cosyvoice(model_dir: str):
+    from cosyvoice.cli.cosyvoice import CosyVoice
+
+    converted = cosyvoice_dir(model_dir)
+    with mmap_loading(converted):
+        return CosyVoice(converted)
+
+
+def memory_stats() -> dict:
+    """当前进程的内存构成 (MB): 匿名页为私有内存, 文件页 (含映射的权重) 可与其他进程共享"""
+    stats = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM", "RssAnon", "RssFile", "RssShmem"):
+                    stats[key] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return stats
+
+
+def timed_load(label: str, loader, *args):
+    """加载并打印耗时与 RSS 变化"""
+    before = memory_stats().get("VmRSS", 0)
+    started = time.perf_counter()
+    model = loader(*args)
+    after = memory_stats()
+    print(
+        f"[Weights] {label} 加载完成 {time.perf_counter() - started:.2f}s, "
+        f"RSS +{after.get('VmRSS', 0) - before:.0f}MB "
+        f"(匿名 {after.get('RssAnon', 0):.0f}MB / 文件映射 {after.get('RssFile', 0):.0f}MB)"
+    )
+    return model
@@ -1,7 +1,61 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
 from api.router import router
+from core import metrics, models
+from core.config import settings
+from core.database import init_db
+from core.profile_cache import listen_profile_changes
+from services.admission import admission
+from services.events import listen_progress_events
+from services.job_queue import worker_pool
+
+
+def preload_models():
+    """加载 Whisper 与 CosyVoice; 已加载 (如 prefork.py 的主进程已加载) 时直接返回"""
+    from core import asr_whisper, tts_cosy
+
+    asr_whisper.get_model()
+    tts_cosy.get_tts_service()._ensure_loaded()
+
 
-app = FastAPI(title="VoiceBridge AI Agent")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    启动时补齐 agent 依赖的表和索引, 订阅用户画像变更与其他实例的进度通知,
+    启动分阶段流水线和任务 worker 池; PRELOAD_MODELS 时先加载模型再开始服务,
+    MODEL_IDLE_UNLOAD_SECONDS > 0 时定期卸载空闲的模型
+    """
+    from services.pipeline import staged_pipeline
+
+    if settings.MODEL_ADMIN_ENABLED and not settings.MODEL_ADMIN_TOKEN:
+        # 管理接口可加载任意允许的模型版本, 不允许无口令开放
+        raise RuntimeError("MODEL_ADMIN_ENABLED=true 时必须设置 MODEL_ADMIN_TOKEN")
+    if settings.PROFILING_ENABLED and not settings.PROFILING_TOKEN:
+        # 剖析接口可读取任意 minio_key 并占用推理资源
+        raise RuntimeError("PROFILING_ENABLED=true 时必须设置 PROFILING_TOKEN")
+    init_db()
+    if settings.PRELOAD_MODELS:
+        await asyncio.to_thread(preload_models)
+    listeners = []
+    if settings.PROFILE_CACHE_LISTEN:
+        listeners.append(asyncio.create_task(listen_profile_changes()))
+    if settings.EVENTS_LISTEN:
+        listeners.append(asyncio.create_task(listen_progress_events()))
+    if settings.MODEL_IDLE_UNLOAD_SECONDS > 0:
+        listeners.append(asyncio.create_task(models.registry.run_idle_reaper()))
+    await staged_pipeline.start()
+    await worker_pool.start()
+    yield
+    # 执行中的任务放回队列, 由重启后的进程或其他实例继续
+    await worker_pool.stop()
+    await staged_pipeline.stop()
+    for listener in listeners:
+        listener.cancel()
+
+
+app = FastAPI(title="VoiceBridge AI Agent", lifespan=lifespan)
 
 # 注册路由
 app.include_router(router, prefix="/api/agent")
@@ -13,6 +67,18 @@ def health_check():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus 抓取端点, 执行中/排队中的任务数在抓取时刷新"""
+    metrics.in_flight.set(admission.in_flight)
+    try:
+        metrics.queue_depth.set(await admission.queued())
+    except Exception as e:
+        print(f"[Metrics] 查询队列长度失败: {e}")
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,152 @@
+"""
+Pre-fork 多进程部署: 主进程加载一次模型, fork 出的 worker 以写时复制共享权重页
+uvicorn --workers 用 spawn 启动子进程, 每个 worker 各自加载 Whisper/CosyVoice, 内存随 worker 数成倍增长;
+这里改为:
+1. 主进程导入 app、加载模型 (不运行推理, 不启动 torch 线程池), 监听端口
+2. gc.collect() + gc.freeze(): 已有对象移入永久代, worker 里的 GC 不再改写它们的对象头,
+   避免共享页因垃圾回收被逐页复制
+3. fork N 个 worker, 共用同一个监听 socket, 各自运行 uvicorn (事件循环、数据库连接池、
+   流水线与任务 worker 池都在 fork 之后创建)
+4. 主进程只负责监督: worker 异常退出时重新 fork; SIGTERM/SIGINT 转发给 worker 并等待退出
+
+注意:
+- 每个 worker 有独立的准入控制、进程内画像缓存与 Prometheus 指标 (/metrics 只反映被抓取的 worker)
+- JOB_BROKER=memory 时各 worker 的队列互相独立, 多 worker 部署请用 postgres
+- worker 的 torch 线程数默认按 CPU 核数均分 (PREFORK_TORCH_THREADS), 避免 N 个进程互相抢核
+
+用法 (在 ai_agent 目录):
+    python prefork.py --workers 4 --port 8000
+    SERVER_WORKERS=4 python prefork.py
+内存测量见 tests/scripts/measure_prefork_memory.py
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+from core.config import settings
+
+# worker 启动后短时间内连续退出, 视为配置/代码错误, 不再无限重启
+MIN_WORKER_UPTIME = 5.0
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _torch_threads(workers: int) -> int:
+    if settings.PREFORK_TORCH_THREADS > 0:
+        return settings.PREFORK_TORCH_THREADS
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _run_worker(app, sock: socket.socket, workers: int, log_level: str):
+    """fork 后的子进程: 恢复默认信号处理, 运行 uvicorn, 不返回"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(_torch_threads(workers))
+    config = uvicorn.Config(app, log_level=log_level, timeout_graceful_shutdown=30)
+    server = uvicorn.Server(config)
+    code = 0
+    try:
+        server.run(sockets=[sock])
+    except BaseException:
+        code = 1
+    os._exit(code)
+
+
+def serve(host: str, port: int, workers: int, preload: bool, log_level: str):
+    from main import app, preload_models
+
+    if preload:
+        started = time.perf_counter()
+        preload_models()
+        print(f"[Prefork] 模型已在主进程加载 ({time.perf_counter() - started:.1f}s)")
+
+    sock = _bind(host, port)
+    # 主进程之后不再分配长期对象, 冻结后 worker 的 GC 不触碰这些共享对象
+    gc.collect()
+    gc.freeze()
+
+    children: dict[int, float] = {}
+    stopping = False
+
+    def spawn():
+        # 未刷出的输出缓冲会被复制到子进程里重复打印
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(app, sock, workers, log_level)
+        children[pid] = time.monotonic()
+        print(f"[Prefork] 启动 worker pid={pid}")
+
+    def on_signal(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    for _ in range(workers):
+        spawn()
+    print(f"[Prefork] 主进程 pid={os.getpid()} 监听 {host}:{port}, {workers} 个 worker")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        code = os.waitstatus_to_exitcode(status)
+        print(f"[Prefork] worker pid={pid} 退出 (code={code})")
+        if time.monotonic() - started < MIN_WORKER_UPTIME:
+            print("[Prefork] worker 启动后立即退出, 停止服务")
+            on_signal(signal.SIGTERM, None)
+            continue
+        spawn()
+
+    sock.close()
+    print("[Prefork] 已停止")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pre-fork 多进程启动 agent")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS)
+    parser.add_argument(
+        "--no-preload",
+        action="store_true",
+        help="主进程不加载模型 (对照实验: 各 worker 首次请求时自行加载)",
+    )
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    serve(
+        args.host, args.port, max(1, args.workers), not args.no_preload, args.log_level
+    )
+
+
+if __name__ == "__main__":
+    main()
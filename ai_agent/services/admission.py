@@ -0,0 +1,104 @@
+"""
+准入控制与背压
+- 执行槽位: 同时在流水线中的记录数上限 (所有入口共用); 各阶段内的 CPU 并发由阶段 worker 池限制
+- 排队上限: 队列过长时 /process 直接返回 429 + Retry-After, 让 Go agent_client 退避
+- 流式同步接口不进队列, 没有空闲执行槽位时同样返回 429 + Retry-After
+- worker 池未就绪 (启动中/退出中) 或队列不可用时返回 503 + Retry-After
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+from core.config import settings
+from services import job_queue
+
+
+class AdmissionController:
+    """单进程内的准入控制器"""
+
+    def __init__(
+        self,
+        max_in_flight: int = settings.ADMISSION_MAX_IN_FLIGHT,
+        max_queued: int = settings.ADMISSION_MAX_QUEUED,
+        retry_after: int = settings.ADMISSION_RETRY_AFTER,
+        depth_ttl: float = settings.ADMISSION_DEPTH_TTL,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.retry_after = retry_after
+        self.depth_ttl = depth_ttl
+        self.in_flight = 0
+        self.rejected = {429: 0, 503: 0}
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._queued = 0
+        self._queued_at = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        """占用一个执行槽位, 槽位满时排队等待 (worker 池使用)"""
+        async with self._slots:
+            self.in_flight += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+
+    def has_free_slot(self) -> bool:
+        return not self._slots.locked()
+
+    def require_free_slot(self):
+        """同步 (流式) 接口不排队: 没有空闲执行槽位时直接 429"""
+        if not self.has_free_slot():
+            self._reject(429, f"执行槽位已满 ({self.in_flight}/{self.max_in_flight})")
+
+    async def queued(self) -> int:
+        """队列长度, 缓存 depth_ttl 秒, 避免每个请求都 COUNT 一次"""
+        if time.monotonic() - self._queued_at > self.depth_ttl:
+            self._queued = await job_queue.broker.depth()
+            self._queued_at = time.monotonic()
+        return self._queued
+
+    def _reject(self, status_code: int, reason: str):
+        self.rejected[status_code] += 1
+        raise HTTPException(
+            status_code=status_code,
+            detail=reason,
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    async def admit(self, count: int = 1):
+        """/process 入队前调用, 饱和时抛出 429/503; 批量提交时 count 为整批条数"""
+        if not job_queue.worker_pool.running:
+            self._reject(503, "任务 worker 未就绪")
+        try:
+            queued = await self.queued()
+        except Exception as e:
+            print(f"[Admission] 查询队列长度失败: {e}")
+            self._reject(503, "任务队列不可用")
+        if queued + count > self.max_queued:
+            self._reject(
+                429, f"排队任务已达上限 ({queued}+{count}/{self.max_queued})"
+            )
+        # 缓存窗口内的突发请求也计入, 避免一秒内冲破上限
+        self._queued += count
+
+    async def stats(self) -> dict:
+        try:
+            queued = await self.queued()
+        except Exception:
+            queued = None
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": queued,
+            "max_queued": self.max_queued,
+            "workers": job_queue.worker_pool.workers,
+            "workers_running": job_queue.worker_pool.running,
+            "rejected": dict(self.rejected),
+        }
+
+
+admission = AdmissionController()
@@ -0,0 +1,202 @@
+"""
+处理进度事件
+- EventBus: 进程内发布/订阅, 按 record_id 分发; 保留每条记录最近一个事件, 晚到的订阅者先收到它
+- progress_notify: 生成 (channel, payload), 由状态更新语句在 RETURNING 里顺带 pg_notify
+  (频道 voice_record_progress), 提交时送达, 不额外增加数据库往返;
+  Go 后端可以 LISTEN 代替轮询 voice_records.status
+- listen_progress_events: 多实例部署时把其他进程发出的 NOTIFY 转发到本进程的 EventBus
+- sse_stream: /records/{record_id}/events 的 SSE 生成器
+
+事件: asr_started / asr_done (raw_text) / llm_done (refined_text, decision ...) /
+      tts_ready (tts_url) / completed / error
+"""
+
+import asyncio
+import json
+import os
+import socket
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from core.config import settings
+from core.pg_listen import listen
+
+PROGRESS_CHANNEL = "voice_record_progress"
+TERMINAL_EVENTS = frozenset({"completed", "error"})
+# 与 Go 端 calculateProgress 保持一致
+STATUS_PROGRESS = {
+    "uploaded": 10,
+    "processing_asr": 30,
+    "processing_llm": 60,
+    "processing_tts": 80,
+    "completed": 100,
+}
+
+_ORIGIN = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _reset_origin():
+    # prefork.py 的 worker 由 fork 产生, 各自需要独立的 origin, 否则会忽略彼此的通知
+    global _ORIGIN
+    _ORIGIN = f"{socket.gethostname()}:{os.getpid()}"
+
+
+os.register_at_fork(after_in_child=_reset_origin)
+
+
+class EventBus:
+    """进程内事件总线, 只在事件循环线程中使用"""
+
+    def __init__(self, queue_size: int = 64, history_size: int = 1024):
+        self.queue_size = queue_size
+        self.history_size = history_size
+        self._subscribers: dict[int, set[asyncio.Queue]] = {}
+        self._last: OrderedDict[int, dict] = OrderedDict()
+        self.published = 0
+        self.dropped = 0
+
+    def publish(
+        self, record_id: int, event: str, status: str | None = None, **data
+    ) -> dict:
+        message = {
+            "record_id": record_id,
+            "event": event,
+            "status": status,
+            "progress": STATUS_PROGRESS.get(status),
+            "ts": time.time(),
+            **data,
+        }
+        self.published += 1
+        self._last[record_id] = message
+        self._last.move_to_end(record_id)
+        while len(self._last) > self.history_size:
+            self._last.popitem(last=False)
+        for queue in self._subscribers.get(record_id, ()):
+            if queue.full():
+                # 慢订阅者丢弃最旧的事件, 不阻塞流水线
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(message)
+        return message
+
+    def subscribe(self, record_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(record_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, record_id: int, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(record_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[record_id]
+
+    def last(self, record_id: int) -> dict | None:
+        return self._last.get(record_id)
+
+    def forget(self, record_id: int):
+        """记录重新提交时丢弃上一轮的最近事件, 否则新订阅者会先收到旧的终态事件并直接结束"""
+        self._last.pop(record_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "records_subscribed": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+bus = EventBus()
+
+
+def progress_notify(record_id: int, event: str, status: str) -> tuple | None:
+    """
+    状态更新语句的 notify 参数; payload 只含状态, 不含文本, 避开 NOTIFY 的 8000 字节上限
+    """
+    if not settings.EVENTS_NOTIFY:
+        return None
+    payload = json.dumps(
+        {"record_id": record_id, "event": event, "status": status, "origin": _ORIGIN}
+    )
+    return PROGRESS_CHANNEL, payload
+
+
+def _on_progress_notify(connection, pid, channel, payload):
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        return
+    # 本进程的事件已经直接发布过
+    if message.get("origin") == _ORIGIN:
+        return
+    bus.publish(message["record_id"], message["event"], message.get("status"))
+
+
+async def listen_progress_events():
+    """订阅其他实例发出的进度通知, 转发到本进程的 EventBus"""
+    await listen(PROGRESS_CHANNEL, _on_progress_notify, name="Events")
+
+
+async def _snapshot(record_id: int) -> dict | None:
+    """订阅前没有事件时, 从数据库读一次当前状态"""
+    from core.database import VoiceRecord, async_session_scope
+
+    async with async_session_scope() as db:
+        status = (
+            await db.execute(
+                select(VoiceRecord.status).where(VoiceRecord.id == record_id)
+            )
+        ).scalar_one_or_none()
+    if status is None:
+        return None
+    event = {"completed": "completed", "error": "error"}.get(status, "status")
+    return {
+        "record_id": record_id,
+        "event": event,
+        "status": status,
+        "progress": STATUS_PROGRESS.get(status),
+        "ts": time.time(),
+    }
+
+
+def _format(message: dict) -> str:
+    return (
+        f"event: {message['event']}\n"
+        f"data: {json.dumps(message, ensure_ascii=False)}\n\n"
+    )
+
+
+async def sse_stream(record_id: int, is_disconnected):
+    """
+    先推当前状态 (最近事件或数据库快照), 再推后续事件, 终态事件后结束
+    空闲时每 EVENTS_HEARTBEAT 秒发一行注释保活, 并检查客户端是否断开
+    """
+    queue = bus.subscribe(record_id)
+    try:
+        current = bus.last(record_id) or await _snapshot(record_id)
+        if current is None:
+            yield _format(
+                {"record_id": record_id, "event": "error", "msg": "Record not found"}
+            )
+            return
+        yield _format(current)
+        if current["event"] in TERMINAL_EVENTS:
+            return
+        while True:
+            try:
+                message = await asyncio.wait_for(
+                    queue.get(), settings.EVENTS_HEARTBEAT
+                )
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    return
+                yield ": ping\n\n"
+                continue
+            yield _format(message)
+            if message["event"] in TERMINAL_EVENTS:
+                return
+    finally:
+        bus.unsubscribe(record_id, queue)
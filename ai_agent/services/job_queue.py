@@ -0,0 +1,904 @@
+"""
+持久化任务队列 + worker 池, 替代 FastAPI BackgroundTasks
+- PostgresJobBroker: agent_jobs 表, SELECT ... FOR UPDATE SKIP LOCKED 抢任务, 多进程/多实例安全
+- InMemoryJobBroker: 进程内实现, 语义相同但不持久化, 供开发和压测使用
+- JobWorkerPool: 每个进程 N 个 asyncio worker, 可见性超时 + 续租, 失败指数退避重试,
+  启动时回收崩溃遗留的任务; 定期把最后一次执行时崩溃 (租约过期且重试次数用尽) 的任务标记为 failed
+- 优先级: interactive > retry > batch, 按 sort_at (到期时间 + 等级 * 老化秒数) 抢任务,
+  同一用户同时执行的任务数有上限, 一个设备的突发不会占满所有 worker
+- 批量提交: 一条 INSERT 写入整批任务, 共用 batch_id, 可一次查询整批进度
+- 去重: 同一 (record_id, sha256(minio_key)) 只能有一个未结束的任务, 重复提交挂到已有任务上;
+  记录已 completed 且音频未变时直接返回, 不再入队
+"""
+
+import asyncio
+import hashlib
+import itertools
+import os
+import socket
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, or_, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from core.config import settings
+from core.database import (
+    ACTIVE_JOB_STATUSES,
+    ACTIVE_JOB_WHERE,
+    AgentJob,
+    AsyncSessionLocal,
+    async_session_scope,
+    build_bulk_status_update,
+    get_record_states_async,
+    get_user_profiles_async,
+    update_record_status_async,
+    update_records_status_async,
+)
+from services import events
+
+
+@dataclass
+class Job:
+    """从队列中取出的任务"""
+
+    id: int
+    record_id: int
+    user_id: int
+    minio_key: str
+    attempts: int = 0
+    max_attempts: int = 3
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    locked_by: str | None = None
+    priority: int = 0
+    deduplicated: bool = False  # 入队时命中了已有的未结束任务
+    traceparent: str | None = None  # 入队请求的 trace 上下文, 执行时接上
+
+
+def minio_key_hash(minio_key: str) -> str:
+    return hashlib.sha256(minio_key.encode()).hexdigest()
+
+
+# 优先级类别 -> 等级, 等级越小越先执行
+PRIORITIES = {"interactive": 0, "retry": 1, "batch": 2}
+RETRY_PRIORITY = PRIORITIES["retry"]
+
+
+def priority_rank(priority: str) -> int:
+    if priority not in PRIORITIES:
+        raise ValueError(f"未知的优先级: {priority}")
+    return PRIORITIES[priority]
+
+
+def sort_at(available_at: datetime, priority: int) -> datetime:
+    """排序时间: 低优先级任务相当于晚 priority * JOB_PRIORITY_AGING 秒到期"""
+    return available_at + timedelta(seconds=priority * settings.JOB_PRIORITY_AGING)
+
+
+def summarize_batch(batch_id: str, rows) -> dict | None:
+    """rows 为 (record_id, status, last_error), 汇总成批次进度"""
+    if not rows:
+        return None
+    counts = Counter(status for _, status, _ in rows)
+    return {
+        "batch_id": batch_id,
+        "total": len(rows),
+        "finished": counts["done"] + counts["failed"] == len(rows),
+        "counts": {s: counts[s] for s in ("queued", "running", "done", "failed")},
+        "failed": [
+            {"record_id": record_id, "error": error}
+            for record_id, status, error in rows
+            if status == "failed"
+        ],
+    }
+
+
+def build_job_insert(dialect_name: str, rows: list[dict]):
+    """
+    多行 INSERT ... ON CONFLICT DO NOTHING RETURNING, 冲突目标为部分唯一索引
+    uq_agent_jobs_active_record; Postgres 为线上路径, SQLite 供离线脚本/压测使用
+    """
+    dialect_insert = sqlite.insert if dialect_name == "sqlite" else postgresql.insert
+    return (
+        dialect_insert(AgentJob)
+        .values(rows)
+        .on_conflict_do_nothing(
+            index_elements=[AgentJob.record_id, AgentJob.minio_key_hash],
+            # 与索引定义用同一段字面量谓词, Postgres 才能推断出冲突目标
+            index_where=ACTIVE_JOB_WHERE,
+        )
+        .returning(AgentJob)
+    )
+
+
+EXPIRED_ERROR = "可见性超时且重试次数已用尽"
+
+
+def retry_delay(attempts: int) -> float:
+    """第 attempts 次失败后的退避秒数: base, 2*base, 4*base ..."""
+    return settings.JOB_RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0)
+
+
+class JobBroker:
+    """任务队列接口, 所有实现语义一致"""
+
+    async def enqueue(
+        self,
+        record_id: int,
+        user_id: int,
+        minio_key: str,
+        priority: int = 0,
+        traceparent: str | None = None,
+    ) -> Job:
+        """入队, 返回新任务; 已有相同的未结束任务时返回该任务 (deduplicated=True)"""
+        # 冲突任务恰好在插入与查询之间结束时会返回空列表, 再插入一次即可
+        for _ in range(2):
+            jobs = await self.enqueue_many(
+                [(record_id, user_id, minio_key)], priority, traceparent=traceparent
+            )
+            if jobs:
+                return jobs[0]
+        raise RuntimeError(f"记录 {record_id} 入队失败")
+
+    async def enqueue_many(
+        self,
+        items: list[tuple[int, int, str]],
+        priority: int,
+        batch_id: str | None = None,
+        traceparent: str | None = None,
+        mark_status: str | None = None,
+    ) -> list[Job]:
+        """
+        整批入队, items 为 (record_id, user_id, minio_key), 返回的任务与 items 顺序一致
+        traceparent 为入队请求的 trace 上下文, 整批共用
+        与未结束任务重复的条目不新建, 返回已有任务 (deduplicated=True)
+        mark_status 非空时, 新建了任务的记录更新为该状态, 与插入任务在同一事务里;
+        挂到已有任务上的记录不改动 (其任务可能已在 LLM/TTS 阶段)
+        """
+        raise NotImplementedError
+
+    async def batch_progress(self, batch_id: str) -> dict | None:
+        """批次进度: 各状态任务数与失败明细, 批次不存在时返回 None"""
+        raise NotImplementedError
+
+    async def claim(self, worker_id: str, limit: int = 1) -> list[Job]:
+        """
+        抢占可执行任务: queued 且到期, 或 running 但租约已过期 (worker 崩溃)
+        按 sort_at 排序, 跳过执行中任务数已达 JOB_MAX_RUNNING_PER_USER 的用户
+        """
+        raise NotImplementedError
+
+    async def complete(self, job: Job):
+        raise NotImplementedError
+
+    async def fail(self, job: Job, error: str):
+        """失败: 未达上限则退避后重新入队, 否则标记 failed"""
+        raise NotImplementedError
+
+    async def extend_lease(self, job: Job):
+        """续租, 长任务执行期间周期调用, 防止被其他 worker 当作崩溃任务抢走"""
+        raise NotImplementedError
+
+    async def release(self, job: Job):
+        """优雅退出时把执行中的任务放回队列, 不计入重试次数"""
+        raise NotImplementedError
+
+    async def expire(self) -> list[int]:
+        """
+        租约过期且重试次数已用尽的 running 任务 (最后一次执行时 worker 崩溃) 标记为 failed,
+        返回这些任务的 record_id; claim 不会再抢这类任务, 不处理会一直占着去重索引
+        """
+        raise NotImplementedError
+
+    async def recover(self) -> int:
+        """启动时把租约过期、仍可重试的 running 任务放回队列, 返回处理条数"""
+        raise NotImplementedError
+
+    async def depth(self) -> int:
+        """排队中的任务数"""
+        raise NotImplementedError
+
+
+class PostgresJobBroker(JobBroker):
+    """基于 agent_jobs 表的持久化队列"""
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self._session_factory = session_factory
+
+    @staticmethod
+    def _to_job(row) -> Job:
+        return Job(
+            id=row.id,
+            record_id=row.record_id,
+            user_id=row.user_id,
+            minio_key=row.minio_key,
+            attempts=row.attempts,
+            max_attempts=row.max_attempts,
+            created_at=row.created_at,
+            locked_by=row.locked_by,
+            priority=row.priority,
+            traceparent=row.traceparent,
+        )
+
+    async def enqueue_many(
+        self,
+        items: list[tuple[int, int, str]],
+        priority: int,
+        batch_id: str | None = None,
+        traceparent: str | None = None,
+        mark_status: str | None = None,
+    ) -> list[Job]:
+        now = datetime.utcnow()
+        rows = [
+            {
+                "record_id": record_id,
+                "user_id": user_id,
+                "minio_key": minio_key,
+                "minio_key_hash": minio_key_hash(minio_key),
+                "status": "queued",
+                "attempts": 0,
+                "max_attempts": settings.JOB_MAX_ATTEMPTS,
+                "available_at": now,
+                "priority": priority,
+                "sort_at": sort_at(now, priority),
+                "batch_id": batch_id,
+                "traceparent": traceparent,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for record_id, user_id, minio_key in items
+        ]
+        keys = [(row["record_id"], row["minio_key_hash"]) for row in rows]
+        async with self._session_factory() as db:
+            # 已过期且不会再被抢的任务先结束掉, 否则新提交会挂到这个永远不会完成的任务上
+            await db.execute(
+                self._expire_stmt(
+                    now, tuple_(AgentJob.record_id, AgentJob.minio_key_hash).in_(keys)
+                )
+            )
+            stmt = build_job_insert(db.get_bind().dialect.name, rows)
+            jobs = {
+                (job.record_id, job.minio_key_hash): self._to_job(job)
+                for job in (await db.scalars(stmt)).all()
+            }
+            if mark_status is not None and jobs:
+                await db.execute(
+                    build_bulk_status_update(
+                        [job.record_id for job in jobs.values()], mark_status
+                    )
+                )
+            duplicates = [key for key in keys if key not in jobs]
+            if duplicates:
+                existing = await db.scalars(
+                    select(AgentJob).where(
+                        AgentJob.status.in_(ACTIVE_JOB_STATUSES),
+                        tuple_(AgentJob.record_id, AgentJob.minio_key_hash).in_(
+                            duplicates
+                        ),
+                    )
+                )
+                for job in existing:
+                    duplicate = self._to_job(job)
+                    duplicate.deduplicated = True
+                    jobs[(job.record_id, job.minio_key_hash)] = duplicate
+            await db.commit()
+        # 冲突的任务恰好在两条语句之间结束时查不到, 这类条目丢弃, 由调用方重试
+        return [jobs[key] for key in keys if key in jobs]
+
+    async def batch_progress(self, batch_id: str) -> dict | None:
+        async with self._session_factory() as db:
+            rows = (
+                await db.execute(
+                    select(AgentJob.record_id, AgentJob.status, AgentJob.last_error)
+                    .where(AgentJob.batch_id == batch_id)
+                    .order_by(AgentJob.id)
+                )
+            ).all()
+        return summarize_batch(batch_id, rows)
+
+    async def claim(self, worker_id: str, limit: int = 1) -> list[Job]:
+        now = datetime.utcnow()
+        conditions = [
+            or_(
+                and_(AgentJob.status == "queued", AgentJob.available_at <= now),
+                and_(AgentJob.status == "running", AgentJob.locked_until < now),
+            ),
+            AgentJob.attempts < AgentJob.max_attempts,
+        ]
+        if settings.JOB_MAX_RUNNING_PER_USER > 0:
+            # 并发抢任务时可能短暂超出上限 1-2 个, 不加锁换吞吐
+            busy_users = (
+                select(AgentJob.user_id)
+                .where(AgentJob.status == "running", AgentJob.locked_until >= now)
+                .group_by(AgentJob.user_id)
+                .having(func.count() >= settings.JOB_MAX_RUNNING_PER_USER)
+            )
+            conditions.append(AgentJob.user_id.not_in(busy_users))
+        claimable = (
+            select(AgentJob.id)
+            .where(*conditions)
+            .order_by(AgentJob.sort_at, AgentJob.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        stmt = (
+            update(AgentJob)
+            .where(AgentJob.id.in_(claimable.scalar_subquery()))
+            .values(
+                status="running",
+                attempts=AgentJob.attempts + 1,
+                locked_until=now + timedelta(seconds=settings.JOB_VISIBILITY_TIMEOUT),
+                locked_by=worker_id,
+                updated_at=now,
+            )
+            .returning(AgentJob)
+            .execution_options(synchronize_session=False)
+        )
+        async with self._session_factory() as db:
+            rows = (await db.scalars(stmt)).all()
+            await db.commit()
+            return [self._to_job(row) for row in rows]
+
+    async def _update_owned(self, job: Job, **values):
+        """只更新仍由该 worker 持有的任务, 租约被接管后的迟到写入直接丢弃"""
+        values["updated_at"] = datetime.utcnow()
+        stmt = (
+            update(AgentJob)
+            .where(AgentJob.id == job.id, AgentJob.locked_by == job.locked_by)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        async with self._session_factory() as db:
+            await db.execute(stmt)
+            await db.commit()
+
+    async def complete(self, job: Job):
+        await self._update_owned(job, status="done", locked_until=None)
+
+    async def fail(self, job: Job, error: str):
+        if job.attempts >= job.max_attempts:
+            await self._update_owned(
+                job, status="failed", locked_until=None, last_error=error
+            )
+            return
+        # 自动重试降到 retry 等级, 反复失败的任务不挡新的交互任务
+        available_at = datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts))
+        priority = max(job.priority, RETRY_PRIORITY)
+        await self._update_owned(
+            job,
+            status="queued",
+            locked_until=None,
+            last_error=error,
+            available_at=available_at,
+            priority=priority,
+            sort_at=sort_at(available_at, priority),
+        )
+
+    async def extend_lease(self, job: Job):
+        await self._update_owned(
+            job,
+            locked_until=datetime.utcnow()
+            + timedelta(seconds=settings.JOB_VISIBILITY_TIMEOUT),
+        )
+
+    async def release(self, job: Job):
+        await self._update_owned(
+            job,
+            status="queued",
+            locked_until=None,
+            attempts=AgentJob.attempts - 1,
+            available_at=datetime.utcnow(),
+        )
+
+    @staticmethod
+    def _expire_stmt(now: datetime, *conditions):
+        return (
+            update(AgentJob)
+            .where(
+                AgentJob.status == "running",
+                AgentJob.locked_until < now,
+                AgentJob.attempts >= AgentJob.max_attempts,
+                *conditions,
+            )
+            .values(
+                status="failed",
+                locked_until=None,
+                last_error=EXPIRED_ERROR,
+                updated_at=now,
+            )
+            .returning(AgentJob.record_id)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def expire(self) -> list[int]:
+        async with self._session_factory() as db:
+            record_ids = list(
+                (await db.scalars(self._expire_stmt(datetime.utcnow()))).all()
+            )
+            await db.commit()
+        return record_ids
+
+    async def recover(self) -> int:
+        now = datetime.utcnow()
+        async with self._session_factory() as db:
+            requeued = await db.execute(
+                update(AgentJob)
+                .where(
+                    AgentJob.status == "running",
+                    AgentJob.locked_until < now,
+                    AgentJob.attempts < AgentJob.max_attempts,
+                )
+                .values(
+                    status="queued",
+                    locked_until=None,
+                    available_at=now,
+                    updated_at=now,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        return requeued.rowcount
+
+    async def depth(self) -> int:
+        async with self._session_factory() as db:
+            result = await db.execute(
+                select(func.count()).where(AgentJob.status == "queued")
+            )
+            return result.scalar_one()
+
+
+class InMemoryJobBroker(JobBroker):
+    """进程内队列, 与 PostgresJobBroker 语义一致, 进程退出即丢失"""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._jobs: dict[int, dict] = {}
+
+    @staticmethod
+    def _to_job(entry: dict) -> Job:
+        return Job(
+            id=entry["id"],
+            record_id=entry["record_id"],
+            user_id=entry["user_id"],
+            minio_key=entry["minio_key"],
+            attempts=entry["attempts"],
+            max_attempts=entry["max_attempts"],
+            created_at=entry["created_at"],
+            locked_by=entry["locked_by"],
+            priority=entry["priority"],
+            traceparent=entry["traceparent"],
+        )
+
+    async def enqueue_many(
+        self,
+        items: list[tuple[int, int, str]],
+        priority: int,
+        batch_id: str | None = None,
+        traceparent: str | None = None,
+        mark_status: str | None = None,
+    ) -> list[Job]:
+        now = datetime.utcnow()
+        self._expire(now)
+        active = {
+            (e["record_id"], e["minio_key_hash"]): e
+            for e in self._jobs.values()
+            if e["status"] in ACTIVE_JOB_STATUSES
+        }
+        jobs = []
+        for record_id, user_id, minio_key in items:
+            key = (record_id, minio_key_hash(minio_key))
+            if key in active:
+                job = self._to_job(active[key])
+                job.deduplicated = True
+                jobs.append(job)
+                continue
+            entry = {
+                "id": next(self._ids),
+                "record_id": record_id,
+                "user_id": user_id,
+                "minio_key": minio_key,
+                "minio_key_hash": key[1],
+                "status": "queued",
+                "attempts": 0,
+                "max_attempts": settings.JOB_MAX_ATTEMPTS,
+                "available_at": now,
+                "priority": priority,
+                "sort_at": sort_at(now, priority),
+                "batch_id": batch_id,
+                "traceparent": traceparent,
+                "locked_until": None,
+                "locked_by": None,
+                "last_error": None,
+                "created_at": now,
+            }
+            self._jobs[entry["id"]] = entry
+            active[key] = entry
+            jobs.append(self._to_job(entry))
+        created = [job.record_id for job in jobs if not job.deduplicated]
+        if mark_status is not None and created:
+            # 进程内队列没有事务可共用, 入队成功后再更新记录状态
+            async with async_session_scope() as db:
+                await update_records_status_async(db, created, mark_status)
+        return jobs
+
+    async def batch_progress(self, batch_id: str) -> dict | None:
+        rows = [
+            (e["record_id"], e["status"], e["last_error"])
+            for e in self._jobs.values()
+            if e["batch_id"] == batch_id
+        ]
+        return summarize_batch(batch_id, rows)
+
+    async def claim(self, worker_id: str, limit: int = 1) -> list[Job]:
+        now = datetime.utcnow()
+        running = Counter(
+            e["user_id"]
+            for e in self._jobs.values()
+            if e["status"] == "running" and e["locked_until"] >= now
+        )
+        cap = settings.JOB_MAX_RUNNING_PER_USER
+        candidates = sorted(
+            (
+                e
+                for e in self._jobs.values()
+                if e["attempts"] < e["max_attempts"]
+                and (
+                    (e["status"] == "queued" and e["available_at"] <= now)
+                    or (e["status"] == "running" and e["locked_until"] < now)
+                )
+                and not (cap > 0 and running[e["user_id"]] >= cap)
+            ),
+            key=lambda e: (e["sort_at"], e["id"]),
+        )[:limit]
+        for entry in candidates:
+            entry.update(
+                status="running",
+                attempts=entry["attempts"] + 1,
+                locked_until=now + timedelta(seconds=settings.JOB_VISIBILITY_TIMEOUT),
+                locked_by=worker_id,
+            )
+        return [self._to_job(e) for e in candidates]
+
+    def _owned(self, job: Job) -> dict | None:
+        entry = self._jobs.get(job.id)
+        if entry is None or entry["locked_by"] != job.locked_by:
+            return None
+        return entry
+
+    async def complete(self, job: Job):
+        # 完成的任务不再需要, 直接移除, 避免长时间运行后内存增长; 批次任务保留用于查询进度
+        entry = self._owned(job)
+        if entry is None:
+            return
+        if entry["batch_id"] is None:
+            del self._jobs[job.id]
+        else:
+            entry.update(status="done", locked_until=None)
+
+    async def fail(self, job: Job, error: str):
+        entry = self._owned(job)
+        if entry is None:
+            return
+        if job.attempts >= job.max_attempts:
+            entry.update(status="failed", locked_until=None, last_error=error)
+            return
+        available_at = datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts))
+        priority = max(job.priority, RETRY_PRIORITY)
+        entry.update(
+            status="queued",
+            locked_until=None,
+            last_error=error,
+            available_at=available_at,
+            priority=priority,
+            sort_at=sort_at(available_at, priority),
+        )
+
+    async def extend_lease(self, job: Job):
+        entry = self._owned(job)
+        if entry is not None:
+            entry["locked_until"] = datetime.utcnow() + timedelta(
+                seconds=settings.JOB_VISIBILITY_TIMEOUT
+            )
+
+    async def release(self, job: Job):
+        entry = self._owned(job)
+        if entry is not None:
+            entry.update(
+                status="queued",
+                locked_until=None,
+                attempts=entry["attempts"] - 1,
+                available_at=datetime.utcnow(),
+            )
+
+    def _expire(self, now: datetime) -> list[int]:
+        expired = [
+            e
+            for e in self._jobs.values()
+            if e["status"] == "running"
+            and e["locked_until"] < now
+            and e["attempts"] >= e["max_attempts"]
+        ]
+        for entry in expired:
+            entry.update(status="failed", locked_until=None, last_error=EXPIRED_ERROR)
+        return [e["record_id"] for e in expired]
+
+    async def expire(self) -> list[int]:
+        return self._expire(datetime.utcnow())
+
+    async def recover(self) -> int:
+        # 进程内队列随进程消失, 没有需要回收的任务
+        return 0
+
+    async def depth(self) -> int:
+        return sum(1 for e in self._jobs.values() if e["status"] == "queued")
+
+
+def create_broker(kind: str | None = None) -> JobBroker:
+    """按 Settings.JOB_BROKER 创建队列实现"""
+    kind = (kind or settings.JOB_BROKER).lower()
+    if kind == "memory":
+        return InMemoryJobBroker()
+    if kind == "postgres":
+        return PostgresJobBroker()
+    raise ValueError(f"未知的 JOB_BROKER: {kind}")
+
+
+class JobWorkerPool:
+    """每个进程 N 个 asyncio worker, 从 broker 抢任务执行"""
+
+    def __init__(
+        self,
+        broker: JobBroker,
+        handler,
+        workers: int = settings.JOB_WORKERS,
+        poll_interval: float = settings.JOB_POLL_INTERVAL,
+        visibility_timeout: float = settings.JOB_VISIBILITY_TIMEOUT,
+        on_expired=None,
+    ):
+        self.broker = broker
+        self.handler = handler  # async def handler(job: Job)
+        # async def on_expired(record_ids: list[int]), 过期任务被标记为 failed 后调用
+        self.on_expired = on_expired
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.in_flight = 0
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def notify(self):
+        """本进程有新任务入队, 唤醒空闲 worker, 不用等下一次轮询"""
+        self._wakeup.set()
+
+    async def start(self):
+        await self._expire()
+        recovered = await self.broker.recover()
+        if recovered:
+            print(f"[JobQueue] 启动回收 {recovered} 个租约过期的任务")
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks = [
+            asyncio.create_task(self._run(f"{prefix}:{i}")) for i in range(self.workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._sweep()))
+        print(f"[JobQueue] 已启动 {self.workers} 个 worker")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        print("[JobQueue] worker 已停止")
+
+    async def _run(self, worker_id: str):
+        while True:
+            try:
+                jobs = await self.broker.claim(worker_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[JobQueue] {worker_id} 抢任务失败: {e}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            if not jobs:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            for job in jobs:
+                await self._execute(job)
+
+    async def _expire(self):
+        record_ids = await self.broker.expire()
+        if not record_ids:
+            return
+        print(f"[JobQueue] {len(record_ids)} 个任务租约过期且重试次数已用尽, 标记为 failed")
+        if self.on_expired is not None:
+            await self.on_expired(record_ids)
+
+    async def _sweep(self):
+        """定期结束租约过期且重试次数已用尽的任务 (可能来自其他实例), 周期与续租相同"""
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            try:
+                await self._expire()
+            except Exception as e:
+                print(f"[JobQueue] 清理过期任务失败: {e}")
+
+    async def _execute(self, job: Job):
+        keep_alive = asyncio.create_task(self._keep_alive(job))
+        self.in_flight += 1
+        try:
+            await self.handler(job)
+        except asyncio.CancelledError:
+            await asyncio.shield(self.broker.release(job))
+            raise
+        except Exception as e:
+            print(
+                f"[JobQueue] 任务 {job.id} (record {job.record_id}) "
+                f"第 {job.attempts}/{job.max_attempts} 次执行失败: {e}"
+            )
+            await self.broker.fail(job, str(e))
+        else:
+            await self.broker.complete(job)
+        finally:
+            keep_alive.cancel()
+            self.in_flight -= 1
+
+    async def _keep_alive(self, job: Job):
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            try:
+                await self.broker.extend_lease(job)
+            except Exception as e:
+                print(f"[JobQueue] 任务 {job.id} 续租失败: {e}")
+
+
+async def _run_pipeline_job(job: Job):
+    # 延迟导入, 避免 job_queue 与 pipeline/admission 互相依赖
+    from services.admission import admission
+    from services.pipeline import process_voice_record
+
+    async with admission.slot():
+        # 自入队起算 (含等执行槽位); 重试的任务包含此前几次的执行与退避时间
+        queue_wait = (datetime.utcnow() - job.created_at).total_seconds()
+        await process_voice_record(
+            job.record_id,
+            job.minio_key,
+            job.user_id,
+            priority=job.priority,
+            queue_wait=max(queue_wait, 0.0),
+            traceparent=job.traceparent,
+        )
+
+
+async def _fail_expired_records(record_ids: list[int]):
+    """任务在最后一次执行中途崩溃, 流水线没来得及写错误状态, 在这里补上"""
+    async with async_session_scope() as db:
+        for record_id in record_ids:
+            await update_record_status_async(
+                db,
+                record_id,
+                "error",
+                notify=events.progress_notify(record_id, "error", "error"),
+                reason=EXPIRED_ERROR,
+            )
+    for record_id in record_ids:
+        events.bus.publish(record_id, "error", "error", reason=EXPIRED_ERROR)
+
+
+broker = create_broker()
+worker_pool = JobWorkerPool(broker, _run_pipeline_job, on_expired=_fail_expired_records)
+
+
+def _already_completed(state: tuple | None, minio_key: str) -> bool:
+    """记录已完成且提交的音频与记录上的一致, 重复提交直接返回"""
+    return state is not None and state == ("completed", minio_key)
+
+
+async def submit(
+    record_id: int,
+    user_id: int,
+    minio_key: str,
+    priority: str = "interactive",
+    traceparent: str | None = None,
+) -> Job | None:
+    """
+    入队并唤醒本进程的 worker
+    记录已 completed 时返回 None; 已有未结束的任务时返回该任务 (deduplicated=True)
+    traceparent 随任务持久化, worker 执行时作为 trace 的父 span
+    """
+    async with async_session_scope() as db:
+        states = await get_record_states_async(db, [record_id])
+    if _already_completed(states.get(record_id), minio_key):
+        print(f"[JobQueue] 记录 {record_id} 已完成, 忽略重复提交")
+        return None
+    job = await broker.enqueue(
+        record_id, user_id, minio_key, priority_rank(priority), traceparent
+    )
+    if job.deduplicated:
+        print(f"[JobQueue] 记录 {record_id} 已有任务 {job.id} 在处理, 重复提交挂到该任务")
+    else:
+        events.bus.forget(record_id)
+        worker_pool.notify()
+    return job
+
+
+@dataclass
+class BatchSubmission:
+    """批量提交的结果"""
+
+    batch_id: str
+    jobs: list[Job]  # 含 deduplicated=True 的已有任务 (不计入本批次进度)
+    skipped: list[int]  # 记录不存在
+    completed: list[int]  # 记录已完成, 未入队
+    failed: list[int] = field(default_factory=list)  # 重试后仍未入队, 记录状态未改动
+
+
+async def submit_batch(
+    items: list[tuple[int, int, str]],
+    priority: str = "batch",
+    traceparent: str | None = None,
+) -> BatchSubmission:
+    """
+    批量入队 (items 为 (record_id, user_id, minio_key))
+    1. 一次 IN 查询读取记录状态: 不存在的跳过, 已完成的直接返回
+    2. 一次 IN 查询预取所有用户画像到缓存, 流水线 LLM 阶段直接命中
+    3. 一条 INSERT 写入整批任务, 共用 batch_id; 与未结束任务重复的挂到已有任务上
+    4. 同一事务里一条 UPDATE 把新建了任务的记录标记为 processing_asr, Go 的 RetryWorker
+       不会再重复提交; 入队失败时事务回滚, 记录状态不变, 仍由 RetryWorker 兜底
+    """
+    submission = BatchSubmission(uuid.uuid4().hex, [], [], [])
+    async with async_session_scope() as db:
+        states = await get_record_states_async(
+            db, [record_id for record_id, _, _ in items]
+        )
+        pending = []
+        for item in items:
+            record_id, _, minio_key = item
+            if record_id not in states:
+                submission.skipped.append(record_id)
+            elif _already_completed(states[record_id], minio_key):
+                submission.completed.append(record_id)
+            else:
+                pending.append(item)
+        if not pending:
+            return submission
+        await get_user_profiles_async(db, [user_id for _, user_id, _ in pending])
+    # 冲突任务恰好在插入与查询之间结束时条目会被丢弃, 与 enqueue 一样对这些条目再提交一次
+    for _ in range(2):
+        queued = {job.record_id for job in submission.jobs}
+        missing = [item for item in pending if item[0] not in queued]
+        if not missing:
+            break
+        submission.jobs += await broker.enqueue_many(
+            missing,
+            priority_rank(priority),
+            submission.batch_id,
+            traceparent,
+            mark_status="processing_asr",
+        )
+    queued = {job.record_id for job in submission.jobs}
+    submission.failed = [
+        record_id for record_id, _, _ in pending if record_id not in queued
+    ]
+    if submission.failed:
+        print(f"[JobQueue] 批次 {submission.batch_id} 中记录 {submission.failed} 入队失败")
+    for job in submission.jobs:
+        if not job.deduplicated:
+            events.bus.forget(job.record_id)
+    worker_pool.notify()
+    print(
+        f"[JobQueue] 批次 {submission.batch_id} 已入队 "
+        f"{sum(not job.deduplicated for job in submission.jobs)} 个任务"
+    )
+    return submission
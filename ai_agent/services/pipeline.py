@@ -1,18 +1,235 @@
 import os
-import json
 import tempfile
+import time
 import asyncio
+from dataclasses import dataclass, field
 
-from core import asr_whisper, llm_reasoning, tts_cosy, storage
+from core import asr_whisper, llm_reasoning, metrics, tracing, tts_cosy, storage
+from core.config import settings
 from core.database import (
-    SessionLocal,
-    update_record_status,
-    get_user_profile,
-    save_analysis_result,
+    async_session_scope,
+    update_record_status_async,
+    get_user_profile_async,
+    finish_record_async,
+    save_record_timing_async,
 )
+from services import events
+from services.stages import Stage, StagedPipeline
 
 
-async def process_voice_record(record_id: int, minio_key: str, user_id: int) -> dict:
+@dataclass
+class RecordContext:
+    """一条语音记录在各阶段之间传递的中间结果"""
+
+    record_id: int
+    minio_key: str
+    user_id: int
+    temp_files: list = field(default_factory=list)  # 记录临时文件, 最后清理
+    raw_text: str = ""
+    user_profile: object = None
+    refined_text: str = ""
+    confidence: float = 0
+    decision: str = "reject"
+    reason: str = ""
+    response_text: str = ""
+    # 分阶段耗时 (秒), 处理结束后写入 agent_record_timings
+    timings: dict = field(default_factory=dict)
+    # 本条记录的根 span; 阶段在各自 worker 任务中执行, 需显式挂到它下面
+    span: tracing.Span | None = None
+
+
+async def asr_stage(ctx: RecordContext) -> None:
+    """1-4: 状态 processing_asr, 读取画像 -> 下载音频 -> ASR, 状态 processing_llm"""
+    # 每个数据库操作使用独立的短事务会话, 不在 ASR/LLM/TTS 期间占用连接池
+    # 状态变更都在同一条 UPDATE 里顺带 pg_notify, 提交后再发布到进程内 EventBus
+    # 画像在 ASR 之前读取: ASR_MODE=routed 时按用户病情选择模型
+    async with async_session_scope() as db:
+        ctx.user_profile = await get_user_profile_async(db, ctx.user_id)
+        await update_record_status_async(
+            db,
+            ctx.record_id,
+            "processing_asr",
+            notify=events.progress_notify(ctx.record_id, "asr_started", "processing_asr"),
+        )
+    events.bus.publish(ctx.record_id, "asr_started", "processing_asr")
+    print(f"[Pipeline] 开始处理记录 {ctx.record_id}")
+
+    # 从 MinIO 下载音频
+    local_audio_path = await asyncio.to_thread(storage.download_file, ctx.minio_key)
+    ctx.temp_files.append(local_audio_path)
+
+    # 执行 ASR (使用线程池避免阻塞主循环)
+    print(f"[Pipeline] 执行 ASR...")
+    ctx.raw_text = await asyncio.to_thread(
+        asr_whisper.transcribe, local_audio_path, ctx.user_profile.condition
+    )
+    print(f"[Pipeline] ASR 结果: {ctx.raw_text}")
+
+    # 更新状态, 准备 LLM
+    async with async_session_scope() as db:
+        await update_record_status_async(
+            db,
+            ctx.record_id,
+            "processing_llm",
+            notify=events.progress_notify(ctx.record_id, "asr_done", "processing_llm"),
+            raw_text=ctx.raw_text,
+        )
+    events.bus.publish(
+        ctx.record_id, "asr_done", "processing_llm", raw_text=ctx.raw_text
+    )
+
+
+async def llm_stage(ctx: RecordContext) -> None:
+    """5-6: LLM 推理 -> 状态 processing_tts"""
+    # infer_intent 是同步 HTTP 调用 (含重试), 放到线程池, 等待期间不占事件循环
+    print(f"[Pipeline] 执行 LLM 推理...")
+    llm_result = await asyncio.to_thread(
+        llm_reasoning.infer_intent, ctx.raw_text, ctx.user_profile
+    )
+    print(f"[Pipeline] LLM 结果: {llm_result}")
+
+    ctx.refined_text = llm_result.get("refined_text", ctx.raw_text)
+    ctx.confidence = llm_result.get("confidence", 0)
+    ctx.decision = llm_result.get("decision", "reject")
+    ctx.reason = llm_result.get("reason", "")
+    ctx.response_text = llm_result.get("response_text", ctx.refined_text)
+
+    # 更新状态, 准备 TTS
+    async with async_session_scope() as db:
+        await update_record_status_async(
+            db,
+            ctx.record_id,
+            "processing_tts",
+            notify=events.progress_notify(ctx.record_id, "llm_done", "processing_tts"),
+            refined_text=ctx.refined_text,
+            confidence=str(ctx.confidence),
+            decision=ctx.decision,
+            reason=ctx.reason,
+        )
+    events.bus.publish(
+        ctx.record_id,
+        "llm_done",
+        "processing_tts",
+        refined_text=ctx.refined_text,
+        response_text=ctx.response_text,
+        confidence=ctx.confidence,
+        decision=ctx.decision,
+    )
+
+
+async def tts_stage(ctx: RecordContext) -> dict:
+    """7-9: TTS 合成 -> 上传 MinIO -> 保存分析结果, 状态 completed (同一事务)"""
+    # 执行 TTS (所有决策类型都生成语音响应)
+    print(f"[Pipeline] 执行 TTS (response_text: {ctx.response_text[:50]}...)...")
+    temp_dir = tempfile.mkdtemp()
+    tts_local_path = await tts_cosy.tts_edge(ctx.response_text, temp_dir)
+    ctx.temp_files.append(tts_local_path)
+
+    # 上传 TTS 到 MinIO
+    tts_object_name = f"tts/{ctx.record_id}_{os.path.basename(tts_local_path)}"
+    tts_url = await asyncio.to_thread(
+        storage.upload_file, tts_local_path, tts_object_name
+    )
+    print(f"[Pipeline] TTS 上传完成: {tts_url}")
+    events.bus.publish(ctx.record_id, "tts_ready", "processing_tts", tts_url=tts_url)
+
+    async with async_session_scope() as db:
+        await finish_record_async(
+            db,
+            ctx.record_id,
+            notify=events.progress_notify(ctx.record_id, "completed", "completed"),
+            asr_text=ctx.raw_text,
+            refined_text=ctx.refined_text,
+            response_text=ctx.response_text,
+            confidence=float(ctx.confidence),
+            decision=ctx.decision,
+            tts_url=tts_url,
+        )
+    print(f"[Pipeline] 记录 {ctx.record_id} 处理完成!")
+
+    result = {
+        "record_id": ctx.record_id,
+        "status": "completed",
+        "raw_text": ctx.raw_text,
+        "refined_text": ctx.refined_text,
+        "confidence": ctx.confidence,
+        "decision": ctx.decision,
+        "reason": ctx.reason,
+        "tts_url": tts_url,
+    }
+    events.bus.publish(
+        ctx.record_id,
+        "completed",
+        "completed",
+        asr_text=ctx.raw_text,
+        refined_text=ctx.refined_text,
+        response_text=ctx.response_text,
+        decision=ctx.decision,
+        tts_url=tts_url,
+    )
+    return result
+
+
+def _instrumented(handler):
+    """
+    阶段执行期间绑定该记录的 timings 与 span: core 模块里的耗时 (下载/ASR/LLM/TTS/上传/DB)
+    记到这条记录上, 各自的 span 挂在该阶段的 span 下
+    """
+
+    async def run(ctx: RecordContext):
+        with metrics.record_timings(ctx.timings), tracing.span(
+            handler.__name__, parent=ctx.span
+        ):
+            return await handler(ctx)
+
+    return run
+
+
+# ASR/TTS 占 CPU, 池子小; LLM 只是等网络, 池子大一些
+staged_pipeline = StagedPipeline(
+    [
+        Stage(
+            "asr",
+            _instrumented(asr_stage),
+            settings.PIPELINE_ASR_WORKERS,
+            settings.PIPELINE_QUEUE_SIZE,
+        ),
+        Stage(
+            "llm",
+            _instrumented(llm_stage),
+            settings.PIPELINE_LLM_WORKERS,
+            settings.PIPELINE_QUEUE_SIZE,
+        ),
+        Stage(
+            "tts",
+            _instrumented(tts_stage),
+            settings.PIPELINE_TTS_WORKERS,
+            settings.PIPELINE_QUEUE_SIZE,
+        ),
+    ],
+    aging_seconds=settings.JOB_PRIORITY_AGING,
+)
+
+
+async def _save_timings(ctx: RecordContext, status: str):
+    """写入本次处理的分阶段耗时; 失败只打印, 不影响处理结果"""
+    try:
+        async with async_session_scope() as db:
+            await save_record_timing_async(
+                db, ctx.record_id, ctx.user_id, status, ctx.timings
+            )
+    except Exception as e:
+        print(f"[Pipeline] 保存记录 {ctx.record_id} 耗时失败: {e}")
+
+
+async def process_voice_record(
+    record_id: int,
+    minio_key: str,
+    user_id: int,
+    priority: int = 0,
+    queue_wait: float = 0.0,
+    traceparent: str | None = None,
+) -> dict:
     """
     处理语音流程
     流程:
@@ -24,98 +241,49 @@ async def process_voice_record(record_id: int, minio_key: str, user_id: int) ->
     6. 更新状态为 processing_tts
     7. 执行 TTS 合成 (CosyVoice)
     8. 上传 TTS 音频到 MinIO
-    9. 更新状态为 completed, 保存所有结果
+    9. 保存分析结果并更新状态为 completed (同一事务)
+
+    1-4 / 5-6 / 7-9 分别属于 asr / llm / tts 阶段; 流水线已启动时提交到各阶段的
+    worker 池, 不同记录的阶段互相重叠; 未启动时 (脚本直接调用) 在当前协程里顺序执行
 
     Args:
         record_id: 语音记录 ID
         minio_key: MinIO 中的音频文件 key
         user_id: 用户 ID
+        priority: 优先级等级 (0=interactive, 1=retry, 2=batch), 决定在各阶段队列中的出队顺序
+        queue_wait: 在任务队列中已等待的秒数, 计入本次处理的 queue_wait 耗时
+        traceparent: 上游 (Go agent_client) 的 W3C traceparent, 本次处理的 trace 接在其下
 
     Returns:
         处理结果字典
     """
-    db = SessionLocal()
-    temp_files = []  # 记录临时文件, 最后清理
-
-    try:
-        # 更新状态
-        update_record_status(db, record_id, "processing_asr")
-        print(f"[Pipeline] 开始处理记录 {record_id}")
-
-        # 从 MinIO 下载音频
-        local_audio_path = storage.download_file(minio_key)
-        temp_files.append(local_audio_path)
-
-        # 执行 ASR (使用线程池避免阻塞主循环)
-        print(f"[Pipeline] 执行 ASR...")
-        raw_text = await asyncio.to_thread(asr_whisper.transcribe, local_audio_path)
-        print(f"[Pipeline] ASR 结果: {raw_text}")
-
-        # 更新状态, 准备 LLM
-        update_record_status(db, record_id, "processing_llm", raw_text=raw_text)
-
-        # 获取用户画像, 执行 LLM 推理
-        print(f"[Pipeline] 执行 LLM 推理...")
-        user_profile = get_user_profile(db, user_id)
-        llm_result = llm_reasoning.infer_intent(raw_text, user_profile)
-        print(f"[Pipeline] LLM 结果: {llm_result}")
-
-        refined_text = llm_result.get("refined_text", raw_text)
-        confidence = llm_result.get("confidence", 0)
-        decision = llm_result.get("decision", "reject")
-        reason = llm_result.get("reason", "")
-        response_text = llm_result.get("response_text", refined_text)  # 获取响应文本
-
-        # 更新状态, 准备 TTS
-        update_record_status(
-            db,
-            record_id,
-            "processing_tts",
-            refined_text=refined_text,
-            confidence=str(confidence),
-            decision=decision,
-            reason=reason,
+    with tracing.start_trace(
+        "process_voice_record",
+        traceparent,
+        record_id=record_id,
+        user_id=user_id,
+        priority=priority,
+    ) as root:
+        ctx = RecordContext(
+            record_id=record_id, minio_key=minio_key, user_id=user_id, span=root
         )
+        ctx.timings["queue_wait"] = queue_wait
+        return await _process(ctx, priority)
 
-        # 执行 TTS (所有决策类型都生成语音响应)
-        print(f"[Pipeline] 执行 TTS (response_text: {response_text[:50]}...)...")
-        temp_dir = tempfile.mkdtemp()
-        tts_local_path = await tts_cosy.tts_edge(
-            response_text, temp_dir
-        )  # 使用 response_text
-        temp_files.append(tts_local_path)
-
-        # 上传 TTS 到 MinIO
-        tts_object_name = f"tts/{record_id}_{os.path.basename(tts_local_path)}"
-        tts_url = storage.upload_file(tts_local_path, tts_object_name)
-        print(f"[Pipeline] TTS 上传完成: {tts_url}")
-
-        # 保存分析结果
-        save_analysis_result(
-            db=db,
-            voice_record_id=record_id,
-            asr_text=raw_text,
-            refined_text=refined_text,
-            response_text=response_text,  # 新增 response_text
-            confidence=float(confidence),
-            decision=decision,
-            tts_audio_url=tts_url,
-        )
 
-        # 完成, 更新最终状态
-        update_record_status(db, record_id, "completed", tts_url=tts_url)
-        print(f"[Pipeline] 记录 {record_id} 处理完成!")
-
-        return {
-            "record_id": record_id,
-            "status": "completed",
-            "raw_text": raw_text,
-            "refined_text": refined_text,
-            "confidence": confidence,
-            "decision": decision,
-            "reason": reason,
-            "tts_url": tts_url,
-        }
+async def _process(ctx: RecordContext, priority: int) -> dict:
+    record_id = ctx.record_id
+    started = time.perf_counter()
+
+    try:
+        if staged_pipeline.running:
+            result = await staged_pipeline.submit(ctx, priority=priority)
+        else:
+            result = await staged_pipeline.run_inline(ctx)
+        ctx.timings["total"] = time.perf_counter() - started
+        tracing.set_attribute("audio_duration", ctx.timings.get("audio_duration"))
+        await _save_timings(ctx, "completed")
+        return result
 
     except Exception as e:
         # 出错时更新状态
@@ -125,16 +293,25 @@ async def process_voice_record(record_id: int, minio_key: str, user_id: int) ->
         traceback.print_exc()
 
         try:
-            # 回滚事务，避免 PendingRollbackError
-            db.rollback()
-            update_record_status(db, record_id, "error", reason=str(e))
+            # 新开短事务写错误状态, 出错阶段的会话已在 session_scope 中回滚
+            async with async_session_scope() as db:
+                await update_record_status_async(
+                    db,
+                    record_id,
+                    "error",
+                    notify=events.progress_notify(record_id, "error", "error"),
+                    reason=str(e),
+                )
         except Exception as db_error:
             print(f"[Pipeline] 更新错误状态失败: {db_error}")
+        events.bus.publish(record_id, "error", "error", reason=str(e))
+        ctx.timings["total"] = time.perf_counter() - started
+        await _save_timings(ctx, "error")
         raise
 
     finally:
         # 清理临时文件
-        for temp_file in temp_files:
+        for temp_file in ctx.temp_files:
             try:
                 if os.path.exists(temp_file):
                     os.remove(temp_file)
@@ -145,4 +322,3 @@ async def process_voice_record(record_id: int, minio_key: str, user_id: int) ->
                         os.rmdir(parent_dir)
             except Exception:
                 pass
-        db.close()
@@ -0,0 +1,183 @@
+"""
+进程内性能剖析 (管理接口使用, 默认关闭, PROFILING_ENABLED 打开)
+- sample(): 采样剖析, 按固定间隔读取所有 Python 线程的调用栈, 输出 flamegraph.pl /
+  speedscope 可直接读取的折叠栈 (每行 "线程;外层;...;内层 次数")
+  wall: 所有线程都计数, 能看到等锁、等网络、等数据库的时间
+  cpu: 只计正在 CPU 上运行的线程 (/proc/self/task/<tid>/stat 状态为 R, 仅 Linux);
+       Whisper/CosyVoice 在 C 扩展里释放 GIL 计算时同样计入
+- torch_profile(): 用 torch.profiler 记录一次 ASR 或 TTS 推理的算子耗时
+- 同一时间只允许一个剖析任务, 时长和采样间隔都有上下限, 可以常开在生产环境
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from core.config import settings
+
+MAX_STACK_DEPTH = 128
+MIN_INTERVAL = 0.005
+
+
+class ProfilerBusy(Exception):
+    """已有剖析任务在运行"""
+
+
+_lock = threading.Lock()
+
+
+def busy() -> bool:
+    return _lock.locked()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    # 按函数聚合 (首行号), 同一函数内不同行合并到一个节点
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _collapse(frame, root: str) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(root.replace(";", ":"))
+    return ";".join(reversed(labels))
+
+
+def _running_tasks() -> set[int]:
+    """状态为 R (运行中/可运行) 的内核线程 id"""
+    running = set()
+    for tid in os.listdir("/proc/self/task"):
+        try:
+            with open(f"/proc/self/task/{tid}/stat") as f:
+                data = f.read()
+        except OSError:
+            continue  # 线程在读取过程中退出
+        # 第二个字段 (comm) 可能含空格, 状态在最后一个 ')' 之后
+        if data[data.rindex(")") + 2] == "R":
+            running.add(int(tid))
+    return running
+
+
+def cpu_mode_supported() -> bool:
+    return os.path.isdir("/proc/self/task")
+
+
+def sample(seconds: float, interval: float, mode: str = "wall") -> tuple[str, dict]:
+    """
+    在当前线程里采样 seconds 秒 (调用方用 asyncio.to_thread 执行)
+
+    Returns:
+        (折叠栈文本, 元信息: 采样次数/实际时长/计数的栈数)
+    """
+    if not _lock.acquire(blocking=False):
+        raise ProfilerBusy("已有剖析任务在运行")
+    try:
+        seconds = min(max(seconds, 0.1), settings.PROFILING_MAX_SECONDS)
+        interval = max(interval, MIN_INTERVAL)
+        own = threading.get_ident()
+        counts: Counter[str] = Counter()
+        samples = 0
+        started = time.monotonic()
+        deadline = started + seconds
+        next_at = started
+        while time.monotonic() < deadline:
+            threads = {t.ident: t for t in threading.enumerate()}
+            running = _running_tasks() if mode == "cpu" else None
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                thread = threads.get(ident)
+                if running is not None and (
+                    thread is None or thread.native_id not in running
+                ):
+                    continue
+                name = thread.name if thread is not None else f"thread-{ident}"
+                counts[_collapse(frame, name)] += 1
+            samples += 1
+            next_at += interval
+            time.sleep(max(0.0, next_at - time.monotonic()))
+        folded = "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
+        return folded + "\n", {
+            "mode": mode,
+            "samples": samples,
+            "interval_ms": round(interval * 1000, 2),
+            "duration_s": round(time.monotonic() - started, 3),
+            "stacks": len(counts),
+        }
+    finally:
+        _lock.release()
+
+
+def torch_profile(
+    target: str, source: str, row_limit: int = 30, trace: bool = False
+) -> dict:
+    """
+    用 torch.profiler 记录一次推理 (在当前线程里执行, 调用方用 asyncio.to_thread)
+
+    Args:
+        target: "asr" (source 为本地音频路径) 或 "tts" (source 为要合成的文本)
+        row_limit: 算子耗时表的行数
+        trace: 是否导出 chrome trace; 文件由调用方在使用后删除
+
+    Returns:
+        {"table": 按 self CPU 时间排序的算子表, "trace_file": chrome trace 路径 (trace=True), ...}
+    """
+    import torch
+    from torch.profiler import ProfilerActivity, profile
+
+    from core import asr_whisper, tts_cosy
+
+    if target == "asr":
+        asr_whisper.get_model()  # 模型加载不计入剖析
+
+        def run():
+            return asr_whisper.transcribe(source)
+
+    else:
+        tts = tts_cosy.get_tts_service()
+        inference = tts._ensure_loaded()
+        speaker = tts._detect_language(source)
+
+        def run():
+            return sum(1 for _ in inference.inference_sft(source, speaker))
+
+    if not _lock.acquire(blocking=False):
+        raise ProfilerBusy("已有剖析任务在运行")
+    try:
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        started = time.perf_counter()
+        with profile(activities=activities, record_shapes=True) as prof:
+            output = run()
+        elapsed = time.perf_counter() - started
+    finally:
+        _lock.release()
+
+    result = {
+        "target": target,
+        "elapsed_s": round(elapsed, 3),
+        "output": output if target == "asr" else f"{output} chunks",
+        "table": prof.key_averages().table(
+            sort_by="self_cpu_time_total", row_limit=row_limit
+        ),
+    }
+    if trace:
+        # trace 可达数百 MB, 文件名带随机后缀, 同一秒内的两次剖析不会互相覆盖
+        trace_dir = settings.PROFILING_DIR or tempfile.gettempdir()
+        os.makedirs(trace_dir, exist_ok=True)
+        fd, trace_file = tempfile.mkstemp(
+            prefix=f"torch_{target}_{time.strftime('%Y%m%d_%H%M%S')}_",
+            suffix=".json",
+            dir=trace_dir,
+        )
+        os.close(fd)
+        prof.export_chrome_trace(trace_file)
+        result["trace_file"] = trace_file
+    return result
@@ -0,0 +1,191 @@
+"""
+分阶段流水线执行器
+- 每个阶段一个有界 asyncio.Queue + 独立大小的 worker 池
+- 记录 N+1 的 ASR 可以与记录 N 的 LLM、记录 N-1 的 TTS 同时进行
+- 下游队列满时上游 worker 阻塞在 put 上, 背压逐级传回提交方
+- 统计每个阶段的利用率 (busy / workers * 运行时长)、排队延迟、被下游阻塞的时间
+- 阶段队列按 入队时间 + 优先级 * 老化秒数 出队, 交互任务先占用 Whisper/CosyVoice
+- 条目带 timings 字典时, 在各阶段队列中的等待时间累加到 timings["queue_wait"]
+"""
+
+import asyncio
+import itertools
+import time
+from dataclasses import dataclass, field
+
+
+@dataclass(eq=False)
+class _Envelope:
+    """在阶段队列之间传递的条目"""
+
+    item: object
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    priority: int = 0
+    cancelled: bool = False
+
+
+class Stage:
+    """流水线中的一个阶段: handler(item) 在 workers 个 worker 中执行"""
+
+    def __init__(self, name: str, handler, workers: int, queue_size: int):
+        self.name = name
+        self.handler = handler  # async def handler(item) -> 结果 (仅最后一个阶段的结果会返回)
+        self.workers = workers
+        self.queue_size = queue_size
+        # 元素为 (排序键, 序号, _Envelope)
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue(maxsize=queue_size)
+        self.busy = 0
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def reset_stats(self):
+        self.processed = self.failed = 0
+        self.busy_seconds = self.blocked_seconds = 0.0
+        self.wait_seconds = self.max_wait_seconds = 0.0
+
+    def stats(self, elapsed: float) -> dict:
+        capacity = self.workers * elapsed
+        done = self.processed + self.failed
+        return {
+            "workers": self.workers,
+            "busy": self.busy,
+            "queued": self.queue.qsize(),
+            "queue_size": self.queue_size,
+            "processed": self.processed,
+            "failed": self.failed,
+            "utilization": round(self.busy_seconds / capacity, 4) if capacity else 0.0,
+            "blocked_ratio": (
+                round(self.blocked_seconds / capacity, 4) if capacity else 0.0
+            ),
+            "avg_queue_delay_ms": (
+                round(self.wait_seconds / done * 1000, 2) if done else 0.0
+            ),
+            "max_queue_delay_ms": round(self.max_wait_seconds * 1000, 2),
+        }
+
+
+class StagedPipeline:
+    """按顺序串联多个 Stage, submit() 等待条目走完所有阶段"""
+
+    def __init__(self, stages: list[Stage], aging_seconds: float = 0.0):
+        self.stages = stages
+        self.aging_seconds = aging_seconds
+        self._seq = itertools.count()
+        self._tasks: list[asyncio.Task] = []
+        self._started_at = time.perf_counter()
+        self._pending: set[_Envelope] = set()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        self._started_at = time.perf_counter()
+        for stage in self.stages:
+            stage.reset_stats()
+        self._tasks = [
+            asyncio.create_task(self._run(index))
+            for index, stage in enumerate(self.stages)
+            for _ in range(stage.workers)
+        ]
+        sizes = ", ".join(f"{s.name}={s.workers}" for s in self.stages)
+        print(f"[Stages] 流水线已启动 ({sizes})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # 尚未走完的条目通知提交方取消
+        for envelope in list(self._pending):
+            envelope.future.cancel()
+        self._pending.clear()
+        for stage in self.stages:
+            while not stage.queue.empty():
+                stage.queue.get_nowait()
+        print("[Stages] 流水线已停止")
+
+    async def _put(self, stage: Stage, envelope: _Envelope):
+        envelope.enqueued_at = time.perf_counter()
+        key = envelope.enqueued_at + envelope.priority * self.aging_seconds
+        await stage.queue.put((key, next(self._seq), envelope))
+
+    async def submit(self, item, priority: int = 0):
+        """
+        提交条目并等待其走完所有阶段; 第一个阶段队列满时在此等待
+        priority 越小越先出队, 每差一级相当于晚入队 aging_seconds 秒
+        """
+        envelope = _Envelope(
+            item, asyncio.get_running_loop().create_future(), priority=priority
+        )
+        self._pending.add(envelope)
+        try:
+            await self._put(self.stages[0], envelope)
+            return await envelope.future
+        except asyncio.CancelledError:
+            # 提交方被取消 (如 worker 池退出), 后续阶段不再处理该条目
+            envelope.cancelled = True
+            raise
+        finally:
+            self._pending.discard(envelope)
+
+    async def run_inline(self, item):
+        """不经过队列, 在当前协程里顺序执行所有阶段 (流水线未启动时使用)"""
+        result = None
+        for stage in self.stages:
+            result = await stage.handler(item)
+        return result
+
+    async def _run(self, index: int):
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            _, _, envelope = await stage.queue.get()
+            if envelope.cancelled or envelope.future.done():
+                continue
+
+            started = time.perf_counter()
+            wait = started - envelope.enqueued_at
+            stage.wait_seconds += wait
+            stage.max_wait_seconds = max(stage.max_wait_seconds, wait)
+            timings = getattr(envelope.item, "timings", None)
+            if timings is not None:
+                timings["queue_wait"] = timings.get("queue_wait", 0.0) + wait
+
+            stage.busy += 1
+            try:
+                result = await stage.handler(envelope.item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                stage.failed += 1
+                if not envelope.future.done():
+                    envelope.future.set_exception(e)
+                continue
+            finally:
+                stage.busy -= 1
+                stage.busy_seconds += time.perf_counter() - started
+            stage.processed += 1
+
+            if next_stage is None:
+                if not envelope.future.done():
+                    envelope.future.set_result(result)
+                continue
+
+            blocked_from = time.perf_counter()
+            await self._put(next_stage, envelope)
+            stage.blocked_seconds += time.perf_counter() - blocked_from
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self._started_at
+        return {
+            "running": self.running,
+            "in_pipeline": len(self._pending),
+            "uptime_s": round(elapsed, 1),
+            "stages": {stage.name: stage.stats(elapsed) for stage in self.stages},
+        }
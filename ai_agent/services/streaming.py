@@ -0,0 +1,247 @@
+"""
+流式同步处理: 一个请求上传音频, 同一个响应里依次返回 ASR 文本、LLM 决策与 TTS 音频
+- 响应为 NDJSON (每行一个 JSON 事件): asr -> llm -> tts_audio (base64 分片, seq 递增) -> done
+  出错时以 error 事件结束
+- 原始音频上传 MinIO 与 ASR 并行, TTS 上传与数据库写入在后台任务里完成, 不占响应时间
+- 后台任务不依赖响应: 客户端中途断开时, 已算出的结果照样落库; 结果未算出时原始音频仍会
+  上传, 记录保持 uploaded, 由 Go 重试 worker 走 /process 重新处理
+"""
+
+import asyncio
+import base64
+import json
+import os
+import shutil
+import tempfile
+import traceback
+
+from core import asr_whisper, llm_reasoning, tts_cosy, storage
+from core.config import settings
+from core.database import (
+    async_session_scope,
+    build_status_update,
+    finish_record_async,
+    get_user_profile_async,
+    update_record_status_async,
+)
+from services import events
+from services.admission import admission
+
+MEDIA_TYPE = "application/x-ndjson"
+
+# 后台落库任务, 持有引用避免被垃圾回收
+_background: set[asyncio.Task] = set()
+
+
+class AudioTooLarge(Exception):
+    """上传的音频超过 STREAM_MAX_AUDIO_BYTES"""
+
+
+async def save_upload(chunks, suffix: str = ".wav") -> str:
+    """
+    把分块到达的音频写入临时目录, 返回文件路径
+    chunks 为异步迭代器 (UploadFile 分块读取或 request.stream()); 超过上限抛 AudioTooLarge,
+    空音频抛 ValueError
+    """
+    temp_dir = tempfile.mkdtemp(prefix="stream_")
+    path = os.path.join(temp_dir, f"input{suffix}")
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > settings.STREAM_MAX_AUDIO_BYTES:
+                    raise AudioTooLarge(
+                        f"音频超过上限 {settings.STREAM_MAX_AUDIO_BYTES} 字节"
+                    )
+                f.write(chunk)
+        if size == 0:
+            raise ValueError("音频为空")
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    return path
+
+
+async def iter_upload(upload, chunk_size: int = 64 * 1024):
+    """按块读取 multipart 中的 UploadFile"""
+    while chunk := await upload.read(chunk_size):
+        yield chunk
+
+
+def _line(event: str, **data) -> bytes:
+    return (json.dumps({"event": event, **data}, ensure_ascii=False) + "\n").encode()
+
+
+async def _load_profile(user_id: int):
+    async with async_session_scope() as db:
+        return await get_user_profile_async(db, user_id)
+
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def stream_process(audio_path: str, record_id: int, user_id: int, minio_key: str):
+    """
+    NDJSON 事件生成器, audio_path 所在的临时目录由本函数 (及其后台任务) 负责清理
+
+    Args:
+        audio_path: save_upload 写出的音频文件
+        record_id: Go 后端已创建的语音记录 ID
+        user_id: 用户 ID
+        minio_key: 原始音频在 MinIO 中的 key (与 /process 的 minio_key 相同含义)
+    """
+    temp_dir = os.path.dirname(audio_path)
+    upload = asyncio.create_task(
+        asyncio.to_thread(storage.upload_file, audio_path, minio_key)
+    )
+    handed_off = False
+    reason = None
+    try:
+        # 计算部分占用执行槽位 (与 worker 池共用), 回传音频前释放, 慢客户端不占槽位
+        async with admission.slot():
+            # 画像读取 (多数命中缓存) 与 ASR 并行; routed 模式按病情选模型, 需先等画像
+            profile = asyncio.create_task(_load_profile(user_id))
+            try:
+                condition = None
+                if settings.ASR_MODE == "routed":
+                    condition = (await profile).condition
+                raw_text = await asyncio.to_thread(
+                    asr_whisper.transcribe, audio_path, condition
+                )
+            except BaseException:
+                profile.cancel()
+                raise
+            yield _line("asr", record_id=record_id, text=raw_text)
+
+            llm_result = await asyncio.to_thread(
+                llm_reasoning.infer_intent, raw_text, await profile
+            )
+            refined_text = llm_result.get("refined_text", raw_text)
+            analysis = {
+                "raw_text": raw_text,
+                "refined_text": refined_text,
+                "confidence": llm_result.get("confidence", 0),
+                "decision": llm_result.get("decision", "reject"),
+                "reason": llm_result.get("reason", ""),
+                "response_text": llm_result.get("response_text", refined_text),
+            }
+            yield _line(
+                "llm",
+                record_id=record_id,
+                refined_text=analysis["refined_text"],
+                response_text=analysis["response_text"],
+                confidence=analysis["confidence"],
+                decision=analysis["decision"],
+                reason=analysis["reason"],
+            )
+
+            tts_path = await tts_cosy.tts_edge(analysis["response_text"], temp_dir)
+            with open(tts_path, "rb") as f:
+                audio = f.read()
+
+        # 结果已齐, 落库交给后台, 之后临时目录归后台任务清理
+        _spawn(_persist(record_id, upload, temp_dir, analysis, tts_path))
+        handed_off = True
+
+        chunk_size = settings.STREAM_CHUNK_BYTES
+        for seq, offset in enumerate(range(0, len(audio), chunk_size)):
+            chunk = audio[offset : offset + chunk_size]
+            yield _line("tts_audio", seq=seq, data=base64.b64encode(chunk).decode())
+        yield _line(
+            "done",
+            record_id=record_id,
+            status="completed",
+            audio_format=os.path.splitext(tts_path)[1].lstrip("."),
+            audio_bytes=len(audio),
+        )
+
+    except Exception as e:
+        print(f"[Stream] 记录 {record_id} 处理失败: {e}")
+        traceback.print_exc()
+        reason = str(e)
+        yield _line("error", record_id=record_id, msg=reason)
+
+    finally:
+        if not handed_off:
+            # 处理失败写 error 状态; 客户端断开 (reason 为空) 只等上传完成后清理
+            _spawn(_persist(record_id, upload, temp_dir, reason=reason))
+
+
+async def _persist(
+    record_id: int,
+    upload: asyncio.Task,
+    temp_dir: str,
+    analysis: dict | None = None,
+    tts_path: str | None = None,
+    reason: str | None = None,
+):
+    """
+    后台落库: 等原始音频上传完成 -> 上传 TTS -> 同一事务写入记录字段、分析结果与 completed 状态
+    落库失败时记录保持原状态, 原始音频已在 MinIO, 由 Go 重试 worker 重新处理
+    """
+    try:
+        try:
+            await upload
+        except Exception as e:
+            # 原始音频不在 MinIO, 无法重试, 直接标记错误
+            print(f"[Stream] 记录 {record_id} 原始音频上传失败: {e}")
+            analysis, reason = None, f"音频上传失败: {e}"
+
+        if analysis is not None:
+            tts_url = await asyncio.to_thread(
+                storage.upload_file,
+                tts_path,
+                f"tts/{record_id}_{os.path.basename(tts_path)}",
+            )
+            async with async_session_scope() as db:
+                # 流式入口没有中间状态, 识别结果与完成状态在同一事务里写入
+                await db.execute(
+                    build_status_update(
+                        record_id,
+                        "processing_tts",
+                        raw_text=analysis["raw_text"],
+                        refined_text=analysis["refined_text"],
+                        confidence=str(analysis["confidence"]),
+                        decision=analysis["decision"],
+                        reason=analysis["reason"],
+                    )
+                )
+                await finish_record_async(
+                    db,
+                    record_id,
+                    notify=events.progress_notify(record_id, "completed", "completed"),
+                    asr_text=analysis["raw_text"],
+                    refined_text=analysis["refined_text"],
+                    response_text=analysis["response_text"],
+                    confidence=float(analysis["confidence"]),
+                    decision=analysis["decision"],
+                    tts_url=tts_url,
+                )
+            events.bus.publish(
+                record_id,
+                "completed",
+                "completed",
+                asr_text=analysis["raw_text"],
+                refined_text=analysis["refined_text"],
+                response_text=analysis["response_text"],
+                decision=analysis["decision"],
+                tts_url=tts_url,
+            )
+        elif reason is not None:
+            async with async_session_scope() as db:
+                await update_record_status_async(
+                    db,
+                    record_id,
+                    "error",
+                    notify=events.progress_notify(record_id, "error", "error"),
+                    reason=reason,
+                )
+            events.bus.publish(record_id, "error", "error", reason=reason)
+    except Exception as e:
+        print(f"[Stream] 记录 {record_id} 结果落库失败: {e}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
@@ -2,6 +2,7 @@ package repository
 
 import (
 	"errors"
+	"strconv"
 	"voicebridge/internal/app/model"
 
 	"gorm.io/gorm"
@@ -35,8 +36,18 @@ func (r *UserRepo) FindByUsername(username string) (*model.User, error) {
 	}
 	return &user, nil
 }
+
+// UserProfileChannel 用户画像变更通知频道, AI Agent 通过 LISTEN 失效画像缓存
+const UserProfileChannel = "user_profile_changed"
+
+// Update 更新用户, 并在同一事务内 NOTIFY, 提交后 AI Agent 才会收到
 func (r *UserRepo) Update(user *model.User, update map[string]interface{}) error {
-	return r.db.Model(user).Updates(update).Error
+	return r.db.Transaction(func(tx *gorm.DB) error {
+		if err := tx.Model(user).Updates(update).Error; err != nil {
+			return err
+		}
+		return tx.Exec("SELECT pg_notify(?, ?)", UserProfileChannel, strconv.FormatUint(uint64(user.ID), 10)).Error
+	})
 }
 
 // FindByID 根据ID查询用户
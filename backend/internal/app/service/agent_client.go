@@ -1,7 +1,11 @@
 package service
 
 import (
+	"crypto/rand"
+	"encoding/hex"
 	"fmt"
+	"net/http"
+	"strconv"
 	"time"
 
 	"voicebridge/internal/pkg/config"
@@ -29,8 +33,19 @@ func NewAgentClient(cfg *config.Config, updater StatusUpdater) *AgentClient {
 		SetRetryWaitTime(1 * time.Second).    // 重试间隔 1 秒
 		SetRetryMaxWaitTime(5 * time.Second). // 最大重试间隔 5 秒
 		AddRetryCondition(func(r *resty.Response, err error) bool {
-			// 网络错误或 5xx 服务端错误时重试
-			return err != nil || r.StatusCode() >= 500
+			// 网络错误、5xx 服务端错误或 Agent 限流 (429) 时重试
+			return err != nil || r.StatusCode() >= 500 || r.StatusCode() == http.StatusTooManyRequests
+		}).
+		SetRetryAfter(func(_ *resty.Client, r *resty.Response) (time.Duration, error) {
+			// Agent 饱和时返回 429/503 + Retry-After, 按其建议退避 (上限为 RetryMaxWaitTime)
+			// 返回 0 时 resty 使用默认的指数退避
+			if r == nil {
+				return 0, nil
+			}
+			if secs, err := strconv.Atoi(r.Header().Get("Retry-After")); err == nil && secs > 0 {
+				return time.Duration(secs) * time.Second, nil
+			}
+			return 0, nil
 		})
 
 	return &AgentClient{
@@ -40,17 +55,41 @@ func NewAgentClient(cfg *config.Config, updater StatusUpdater) *AgentClient {
 	}
 }
 
+// 任务优先级，AI Agent 按 interactive > retry > batch 调度 (低优先级排队久了会老化提升)
+const (
+	PriorityInteractive = "interactive"
+	PriorityRetry       = "retry"
+	PriorityBatch       = "batch"
+)
+
+// newTraceparent 生成 W3C traceparent (00-<trace_id>-<span_id>-01)
+// 随请求头发给 AI Agent, Agent 的处理链路 span 以此为父，日志中的 trace_id 可与之对应
+func newTraceparent() (traceparent, traceID string) {
+	var b [24]byte
+	if _, err := rand.Read(b[:]); err != nil {
+		return "", ""
+	}
+	traceID = hex.EncodeToString(b[:16])
+	return fmt.Sprintf("00-%s-%s-01", traceID, hex.EncodeToString(b[16:])), traceID
+}
+
 // ProcessRequest 发送给 Python 的请求体
 type AgentProcessRequest struct {
 	RecordID    uint   `json:"record_id"`
 	UserID      uint   `json:"user_id"`
 	MinioBucket string `json:"minio_bucket"`
 	MinioKey    string `json:"minio_key"`
+	Priority    string `json:"priority,omitempty"`
 }
 
-// NotifyAgent 异步调用 AI Agent
+// NotifyAgent 异步调用 AI Agent (interactive 优先级)
 // 上传成功后立即返回，不阻塞用户请求
 func (c *AgentClient) NotifyAgent(recordID uint, userID uint, bucket, key string) {
+	c.NotifyAgentWithPriority(recordID, userID, bucket, key, PriorityInteractive)
+}
+
+// NotifyAgentWithPriority 异步调用 AI Agent，指定任务优先级
+func (c *AgentClient) NotifyAgentWithPriority(recordID uint, userID uint, bucket, key, priority string) {
 	// 启动 goroutine 异步发送
 	go func() {
 		url := fmt.Sprintf("%s/api/agent/process", c.cfg.Ai.ServiceUrl)
@@ -59,16 +98,21 @@ func (c *AgentClient) NotifyAgent(recordID uint, userID uint, bucket, key string
 			UserID:      userID,
 			MinioBucket: bucket,
 			MinioKey:    key,
+			Priority:    priority,
 		}
+		traceparent, traceID := newTraceparent()
 
 		logger.Log.Info("通知 AI Agent 开始处理",
 			zap.Uint("record_id", recordID),
 			zap.String("url", url),
+			zap.String("priority", priority),
+			zap.String("trace_id", traceID),
 		)
 
 		resp, err := c.client.R().
 			SetHeader("Content-Type", "application/json").
 			SetHeader("Authorization", "Bearer "+c.cfg.Ai.LLMApiKey).
+			SetHeader("traceparent", traceparent).
 			SetBody(reqBody).
 			Post(url)
 
@@ -97,6 +141,54 @@ func (c *AgentClient) NotifyAgent(recordID uint, userID uint, bucket, key string
 	}()
 }
 
+// AgentBatchItem 批量请求中的一条记录
+type AgentBatchItem struct {
+	RecordID uint   `json:"record_id"`
+	UserID   uint   `json:"user_id"`
+	MinioKey string `json:"minio_key"`
+}
+
+// AgentBatchRequest 批量处理请求体
+type AgentBatchRequest struct {
+	Items    []AgentBatchItem `json:"items"`
+	Priority string           `json:"priority,omitempty"`
+}
+
+// AgentBatchResponse 批量处理响应，进度通过 GET /api/agent/batches/{batch_id} 查询
+type AgentBatchResponse struct {
+	BatchID  string `json:"batch_id"`
+	Accepted int    `json:"accepted"`
+	Skipped  []uint `json:"skipped"`
+}
+
+// NotifyAgentBatch 一次请求提交多条记录 (同步调用)
+func (c *AgentClient) NotifyAgentBatch(items []AgentBatchItem, priority string) (*AgentBatchResponse, error) {
+	url := fmt.Sprintf("%s/api/agent/process/batch", c.cfg.Ai.ServiceUrl)
+	result := &AgentBatchResponse{}
+	traceparent, traceID := newTraceparent()
+	logger.Log.Info("批量通知 AI Agent",
+		zap.Int("count", len(items)),
+		zap.String("priority", priority),
+		zap.String("trace_id", traceID),
+	)
+
+	resp, err := c.client.R().
+		SetHeader("Content-Type", "application/json").
+		SetHeader("Authorization", "Bearer "+c.cfg.Ai.LLMApiKey).
+		SetHeader("traceparent", traceparent).
+		SetBody(AgentBatchRequest{Items: items, Priority: priority}).
+		SetResult(result).
+		Post(url)
+
+	if err != nil {
+		return nil, fmt.Errorf("批量调用 AI Agent 失败: %w", err)
+	}
+	if resp.IsError() {
+		return nil, fmt.Errorf("AI Agent 返回错误: status=%d, body=%s", resp.StatusCode(), string(resp.Body()))
+	}
+	return result, nil
+}
+
 // NotifyAgentSync 同步调用 ，用于需要等待结果的场景
 func (c *AgentClient) NotifyAgentSync(recordID uint, userID uint, bucket, key string) error {
 	url := fmt.Sprintf("%s/api/agent/process", c.cfg.Ai.ServiceUrl)
@@ -106,10 +198,16 @@ func (c *AgentClient) NotifyAgentSync(recordID uint, userID uint, bucket, key st
 		MinioBucket: bucket,
 		MinioKey:    key,
 	}
+	traceparent, traceID := newTraceparent()
+	logger.Log.Info("同步通知 AI Agent",
+		zap.Uint("record_id", recordID),
+		zap.String("trace_id", traceID),
+	)
 
 	resp, err := c.client.R().
 		SetHeader("Content-Type", "application/json").
 		SetHeader("Authorization", "Bearer "+c.cfg.Ai.LLMApiKey).
+		SetHeader("traceparent", traceparent).
 		SetBody(reqBody).
 		Post(url)
 
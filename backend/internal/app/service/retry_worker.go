@@ -89,7 +89,8 @@ func (w *RetryWorker) retryUploadedTasks() {
 		zap.Int("count", len(records)),
 	)
 
-	// 逐个重试
+	// 逐个标记，然后一次批量请求提交给 AI Agent
+	items := make([]AgentBatchItem, 0, len(records))
 	for _, record := range records {
 		// 将状态临时标记为 processing_asr，避免重复处理
 		updateErr := w.db.Table("voice_records").
@@ -104,20 +105,39 @@ func (w *RetryWorker) retryUploadedTasks() {
 			continue
 		}
 
-		logger.Log.Info("重试调用 AI Agent",
-			zap.Uint("record_id", record.ID),
-			zap.Uint("user_id", record.UserID),
-		)
+		items = append(items, AgentBatchItem{
+			RecordID: record.ID,
+			UserID:   record.UserID,
+			MinioKey: record.MinioKey,
+		})
+	}
 
-		// 使用异步通知，不阻塞
-		w.agentClient.NotifyAgent(
-			record.ID,
-			record.UserID,
-			w.cfg.Minio.BucketName,
-			record.MinioKey,
-		)
+	if len(items) == 0 {
+		return
+	}
 
-		// 每个任务之间间隔 2 秒，避免短时间大量请求
-		time.Sleep(2 * time.Second)
+	// retry 优先级，不抢占新上传的实时录音；Agent 饱和时由 client 按 Retry-After 退避
+	result, err := w.agentClient.NotifyAgentBatch(items, PriorityRetry)
+	if err != nil {
+		logger.Log.Warn("批量重试调用 AI Agent 失败 - 任务恢复 uploaded 状态，下次扫描重试",
+			zap.Int("count", len(items)),
+			zap.Error(err),
+		)
+		ids := make([]uint, len(items))
+		for i, item := range items {
+			ids[i] = item.RecordID
+		}
+		if revertErr := w.db.Table("voice_records").
+			Where("id IN ? AND status = ?", ids, "processing_asr").
+			Update("status", "uploaded").Error; revertErr != nil {
+			logger.Log.Error("恢复任务状态失败", zap.Error(revertErr))
+		}
+		return
 	}
+
+	logger.Log.Info("批量重试已提交 AI Agent",
+		zap.String("batch_id", result.BatchID),
+		zap.Int("accepted", result.Accepted),
+		zap.Any("skipped", result.Skipped),
+	)
 }
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+统计单条语音记录在流水线中产生的数据库往返次数
+用 SQLite 内存库重放 pipeline 的数据库调用序列, 不需要 Postgres/MinIO/模型
+- before: 旧实现 (状态更新为 SELECT + ORM 修改 + commit, 分析结果先 SELECT 再 INSERT + refresh,
+  整条记录共用一个会话), 函数体照搬自改动前的 core/database.py / services/pipeline.py
+- after: 当前实现
+两者并排输出; after 的往返次数不少于 before 时以非零状态退出
+
+用法 (在仓库根目录):
+    python tests/scripts/bench_db_roundtrips.py
+"""
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+AGENT_DIR = Path(__file__).resolve().parents[2] / "ai_agent"
+sys.path.insert(0, str(AGENT_DIR))
+
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from core.database import (  # noqa: E402
+    AnalysisResult,
+    Base,
+    User,
+    VoiceRecord,
+    update_record_status,
+    get_user_profile,
+    finish_record,
+)
+
+
+class RoundTripCounter:
+    """通过 engine 事件统计 BEGIN / SQL 语句 / COMMIT 次数"""
+
+    def __init__(self, engine):
+        self.begins = 0
+        self.statements = 0
+        self.commits = 0
+        event.listen(engine, "begin", self._on_begin)
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine, "commit", self._on_commit)
+
+    def _on_begin(self, conn):
+        self.begins += 1
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+
+    def _on_commit(self, conn):
+        self.commits += 1
+
+    def reset(self):
+        self.begins = self.statements = self.commits = 0
+
+    @property
+    def total(self) -> int:
+        # psycopg2 下 BEGIN 和 COMMIT 各自都是一次往返
+        return self.begins + self.statements + self.commits
+
+
+# ---------------------------------------------------------------- 旧实现 (对照)
+
+
+def legacy_update_record_status(db, record_id: int, status: str, **kwargs):
+    """改动前的 update_record_status: 先 SELECT 整行, 改 ORM 属性后 commit"""
+    record = db.query(VoiceRecord).filter(VoiceRecord.id == record_id).first()
+    if record:
+        record.status = status
+        record.updated_at = datetime.utcnow()
+        for key, value in kwargs.items():
+            if hasattr(record, key):
+                setattr(record, key, value)
+        db.commit()
+        return record
+    return None
+
+
+def legacy_get_user_profile(db, user_id: int) -> dict:
+    """改动前的 get_user_profile: 每次查询 users, 没有缓存"""
+    user = db.query(User).filter(User.id == user_id).first()
+    if user:
+        return {
+            "name": user.name or user.username,
+            "common_needs": user.common_needs.split(",") if user.common_needs else [],
+        }
+    return {}
+
+
+def legacy_save_analysis_result(db, voice_record_id: int, **fields):
+    """改动前的 save_analysis_result: 先 SELECT 是否已存在, 再 INSERT/UPDATE, commit 后 refresh"""
+    result = (
+        db.query(AnalysisResult)
+        .filter(AnalysisResult.voice_record_id == voice_record_id)
+        .first()
+    )
+    if result:
+        for key, value in fields.items():
+            setattr(result, key, value)
+    else:
+        result = AnalysisResult(voice_record_id=voice_record_id, **fields)
+        db.add(result)
+    db.commit()
+    db.refresh(result)
+    return result
+
+
+def replay_legacy_pipeline(session_factory, record_id: int, user_id: int):
+    """按改动前 services/pipeline.py 的顺序重放 (整条记录共用一个会话)"""
+    with session_factory() as db:
+        legacy_update_record_status(db, record_id, "processing_asr")
+        legacy_update_record_status(db, record_id, "processing_llm", raw_text="水 喝")
+        legacy_get_user_profile(db, user_id)
+        legacy_update_record_status(
+            db,
+            record_id,
+            "processing_tts",
+            refined_text="我想喝水",
+            confidence="0.92",
+            decision="accept",
+            reason="bench",
+        )
+        legacy_save_analysis_result(
+            db,
+            record_id,
+            asr_text="水 喝",
+            refined_text="我想喝水",
+            response_text="好的，我想喝水",
+            confidence=0.92,
+            decision="accept",
+            tts_audio_url="/minio-api/voicebridge/tts/bench.wav",
+        )
+        legacy_update_record_status(
+            db, record_id, "completed", tts_url="/minio-api/voicebridge/tts/bench.wav"
+        )
+
+
+# ---------------------------------------------------------------- 当前实现
+
+
+def replay_pipeline(session_factory, record_id: int, user_id: int):
+    """按 services/pipeline.py 的顺序重放一条记录的数据库调用 (每个阶段一个短会话)"""
+    with session_factory() as db:
+        update_record_status(db, record_id, "processing_asr")
+    with session_factory() as db:
+        get_user_profile(db, user_id)
+        update_record_status(db, record_id, "processing_llm", raw_text="水 喝")
+    with session_factory() as db:
+        update_record_status(
+            db,
+            record_id,
+            "processing_tts",
+            refined_text="我想喝水",
+            confidence="0.92",
+            decision="accept",
+            reason="bench",
+        )
+    with session_factory() as db:
+        finish_record(
+            db,
+            record_id,
+            asr_text="水 喝",
+            refined_text="我想喝水",
+            response_text="好的，我想喝水",
+            confidence=0.92,
+            decision="accept",
+            tts_url="/minio-api/voicebridge/tts/bench.wav",
+        )
+
+
+def main():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    records = 10
+    with session_factory() as db:
+        db.add(User(id=1, username="bench", password="x", common_needs="喝水,吃药"))
+        # 两种实现各用一组新记录, 分析结果都走首次写入的路径
+        for i in range(1, 2 * records + 1):
+            db.add(VoiceRecord(id=i, user_id=1, minio_bucket="b", minio_key=f"k{i}"))
+        db.commit()
+
+    counter = RoundTripCounter(engine)
+    results = {}
+    for label, replay, first_id in (
+        ("before", replay_legacy_pipeline, 1),
+        ("after", replay_pipeline, records + 1),
+    ):
+        counter.reset()
+        for record_id in range(first_id, first_id + records):
+            replay(session_factory, record_id, 1)
+        results[label] = {
+            "BEGIN": counter.begins / records,
+            "语句": counter.statements / records,
+            "COMMIT": counter.commits / records,
+            "往返合计": counter.total / records,
+        }
+
+    print("=" * 60)
+    print(f"记录数: {records} (每条记录的平均值)")
+    print(f"{'':10}{'before':>10}{'after':>10}")
+    for key in results["before"]:
+        print(f"{key:10}{results['before'][key]:>10.1f}{results['after'][key]:>10.1f}")
+    print("=" * 60)
+    if results["after"]["往返合计"] >= results["before"]["往返合计"]:
+        sys.exit("当前实现的往返次数没有少于旧实现")
+
+
+if __name__ == "__main__":
+    main()
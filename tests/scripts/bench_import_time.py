@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+agent 启动导入耗时基准 (python -X importtime), 带回归预算
+- 在子进程里多次执行 `import main` (冷启动, 每次新进程), 取总导入耗时的中位数
+- 按顶层包汇总自身耗时 (self), 列出最慢的包, 便于定位新增的重依赖
+- 检查导入 main 之后没有加载 ML 库与 MinIO 客户端 (torch / whisper / cosyvoice ...):
+  它们只应在首次推理/首次访问存储时导入
+
+超出 --budget-ms 或加载了禁止的模块时退出码为 1, 可以放进 CI
+
+用法 (在仓库根目录):
+    python tests/scripts/bench_import_time.py
+    python tests/scripts/bench_import_time.py --runs 7 --budget-ms 1200 --top 15
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from collections import Counter
+from pathlib import Path
+
+AGENT_DIR = Path(__file__).resolve().parents[2] / "ai_agent"
+
+# 导入 main 时不应加载的模块 (顶层包名)
+FORBIDDEN = (
+    "torch",
+    "torchaudio",
+    "whisper",
+    "cosyvoice",
+    "modelscope",
+    "numpy",
+    "minio",
+    "requests",
+)
+
+
+def run_importtime(module: str) -> tuple[int, Counter]:
+    """返回 (module 的累计导入耗时 us, 顶层包 -> 自身耗时 us)"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=AGENT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"import {module} 失败:\n{proc.stderr[-2000:]}")
+    total = 0
+    by_package: Counter = Counter()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        name = name.strip()
+        by_package[name.split(".")[0]] += int(self_us)
+        if name == module:
+            total = int(cumulative_us)
+    return total, by_package
+
+
+def loaded_modules(module: str) -> set[str]:
+    proc = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import json, sys, {module}; print(json.dumps(sorted(sys.modules)))",
+        ],
+        cwd=AGENT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return {name.split(".")[0] for name in json.loads(proc.stdout.splitlines()[-1])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="agent 启动导入耗时基准")
+    parser.add_argument("--module", default="main", help="要导入的模块")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--budget-ms", type=float, default=1500, help="总导入耗时中位数上限"
+    )
+    parser.add_argument("--top", type=int, default=10, help="列出最慢的顶层包个数")
+    args = parser.parse_args()
+
+    # 第一次运行预热磁盘缓存与 __pycache__, 不计入
+    run_importtime(args.module)
+    totals = []
+    packages: Counter = Counter()
+    for _ in range(args.runs):
+        total, by_package = run_importtime(args.module)
+        totals.append(total)
+        packages.update(by_package)
+
+    median_ms = statistics.median(totals) / 1000
+    forbidden = sorted(set(FORBIDDEN) & loaded_modules(args.module))
+    report = {
+        "module": args.module,
+        "runs": args.runs,
+        "total_ms": {
+            "median": round(median_ms, 1),
+            "min": round(min(totals) / 1000, 1),
+            "max": round(max(totals) / 1000, 1),
+        },
+        "budget_ms": args.budget_ms,
+        "top_packages_ms": {
+            name: round(us / args.runs / 1000, 1)
+            for name, us in packages.most_common(args.top)
+        },
+        "forbidden_loaded": forbidden,
+        "ok": median_ms <= args.budget_ms and not forbidden,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if not report["ok"]:
+        if forbidden:
+            print(f"[失败] 导入 {args.module} 时加载了: {', '.join(forbidden)}")
+        if median_ms > args.budget_ms:
+            print(f"[失败] 导入耗时 {median_ms:.1f}ms 超出预算 {args.budget_ms}ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+模型冷启动对比: 原始 checkpoint 整体读入 vs MODEL_MMAP_DIR 内存映射
+每次在新的子进程里加载一个模型 (先导入 torch/whisper, 导入耗时不计入), 记录:
+- load_s: 加载耗时; first_call_s: 首次推理耗时 (映射模式下权重页在这里才被读入)
+- rss / anon / file (MB): 加载后与首次推理后的常驻内存, 匿名页为进程私有,
+  文件页 (映射的权重) 可被同一节点的其他进程共享
+--drop-caches 在每次运行前清空页缓存 (需要 root), 测真正的冷启动; 否则为热页缓存下的结果
+
+用法 (在仓库根目录, 先用 ai_agent/convert_weights.py 转换权重):
+    MODEL_MMAP_DIR=/app/models/mmap python tests/scripts/bench_model_cold_start.py \\
+        --target whisper --audio sample.wav --repeat 3
+    MODEL_MMAP_DIR=/app/models/mmap python tests/scripts/bench_model_cold_start.py \\
+        --target cosyvoice --drop-caches
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+AGENT_DIR = Path(__file__).resolve().parents[2] / "ai_agent"
+
+
+def child(target: str, audio: str, text: str):
+    """子进程: 加载一次并输出一行 JSON"""
+    sys.path.insert(0, str(AGENT_DIR))
+    os.chdir(AGENT_DIR)
+    import torch  # noqa: F401  导入耗时不计入
+
+    from core import weights
+
+    result = {"mmap": bool(os.environ.get("MODEL_MMAP_DIR"))}
+    if target == "whisper":
+        import whisper  # noqa: F401
+
+        from core import asr_whisper
+
+        started = time.perf_counter()
+        asr_whisper.get_model()
+        result["load_s"] = time.perf_counter() - started
+        result["after_load"] = weights.memory_stats()
+        if audio:
+            started = time.perf_counter()
+            asr_whisper.transcribe(audio)
+            result["first_call_s"] = time.perf_counter() - started
+    else:
+        from core import tts_cosy
+
+        tts = tts_cosy.get_tts_service()
+        started = time.perf_counter()
+        inference = tts._ensure_loaded()
+        result["load_s"] = time.perf_counter() - started
+        result["after_load"] = weights.memory_stats()
+        if text:
+            started = time.perf_counter()
+            for _ in inference.inference_sft(text, tts._detect_language(text)):
+                pass
+            result["first_call_s"] = time.perf_counter() - started
+    result["after_first_call"] = weights.memory_stats()
+    print(json.dumps(result))
+
+
+def drop_caches():
+    os.sync()
+    with open("/proc/sys/vm/drop_caches", "w") as f:
+        f.write("3\n")
+
+
+def run_once(target: str, mmap_dir: str, args) -> dict:
+    env = dict(os.environ, MODEL_MMAP_DIR=mmap_dir)
+    if args.drop_caches:
+        drop_caches()
+    proc = subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            "--child",
+            "--target",
+            target,
+            "--audio",
+            args.audio,
+            "--text",
+            args.text,
+        ],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"子进程失败:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def summarize(runs: list[dict]) -> dict:
+    def median(getter):
+        values = [getter(r) for r in runs]
+        values = [v for v in values if v is not None]
+        return round(statistics.median(values), 3) if values else None
+
+    summary = {
+        "runs": len(runs),
+        "load_s": median(lambda r: r["load_s"]),
+        "first_call_s": median(lambda r: r.get("first_call_s")),
+    }
+    for phase in ("after_load", "after_first_call"):
+        summary[phase] = {
+            key: median(lambda r, key=key: r[phase].get(key))
+            for key in ("VmRSS", "RssAnon", "RssFile")
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型冷启动对比 (原始 vs mmap)")
+    parser.add_argument("--target", choices=["whisper", "cosyvoice"], default="whisper")
+    parser.add_argument("--audio", default="", help="whisper 首次推理用的音频")
+    parser.add_argument("--text", default="", help="cosyvoice 首次推理用的文本")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--drop-caches", action="store_true")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.target, args.audio, args.text)
+        return
+
+    mmap_dir = os.environ.get("MODEL_MMAP_DIR", "")
+    if not mmap_dir:
+        sys.exit("请设置 MODEL_MMAP_DIR (convert_weights.py 的输出目录)")
+    report = {"target": args.target, "drop_caches": args.drop_caches}
+    for label, directory in (("original", ""), ("mmap", mmap_dir)):
+        runs = [run_once(args.target, directory, args) for _ in range(args.repeat)]
+        report[label] = summarize(runs)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
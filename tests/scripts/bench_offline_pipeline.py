@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+离线端到端基准: 在进程内跑真实的 process_voice_record (分阶段流水线), 外部依赖换成本地替身
+- MinIO: STORAGE_BACKEND=local (临时目录, 硬链接读写) 或 --storage memory
+- Postgres: 默认 SQLite (aiosqlite) 临时库; --db-url 可指向本机/嵌入式 Postgres
+- LLM: 本进程内起一个 OpenAI 兼容的假服务 (/v1/chat/completions), 延迟可配置
+- ASR/TTS: 默认加载真实的 Whisper/CosyVoice; --asr fake / --tts fake 用 sleep 替身
+  (只测流水线、数据库与存储开销, 不需要模型)
+
+样本来自 ai_agent/data/demo/*.json 的 patient_profile (写入 users 表);
+同目录下有 <sample_id>.wav 时作为输入音频, 没有时生成一段 --audio-seconds 秒的正弦波
+每个并发级别 (--concurrency) 用 N 个客户端协程闭环提交 --records 条记录, 输出 JSON:
+吞吐量、端到端延迟、各阶段 p50/p95/p99 (来自 agent_record_timings)、峰值 RSS
+
+用法 (在仓库根目录):
+    python tests/scripts/bench_offline_pipeline.py --asr fake --tts fake \\
+        --concurrency 1,2,4,8 --records 40 --llm-ms 300
+    python tests/scripts/bench_offline_pipeline.py --concurrency 1,4 --records 12 \\
+        --warmup 2 --output bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+AGENT_DIR = Path(__file__).resolve().parents[2] / "ai_agent"
+sys.path.insert(0, str(AGENT_DIR))
+
+DEMO_DIR = AGENT_DIR / "data" / "demo"
+SAMPLE_RATE = 16000
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(values: list, scale: float = 1000.0) -> dict:
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 0.50) * scale, 3),
+        "p95": round(percentile(values, 0.95) * scale, 3),
+        "p99": round(percentile(values, 0.99) * scale, 3),
+        "max": round(values[-1] * scale, 3),
+    }
+
+
+# ---------------------------------------------------------------- 样本
+
+
+def write_tone(path: str, seconds: float):
+    """16kHz 单声道 16bit 正弦波, 代替缺失的演示音频"""
+    frames = int(seconds * SAMPLE_RATE)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(
+            b"".join(
+                struct.pack("<h", int(8000 * math.sin(2 * math.pi * 440 * i / SAMPLE_RATE)))
+                for i in range(frames)
+            )
+        )
+
+
+def wav_seconds(path: str) -> float | None:
+    try:
+        with wave.open(path, "rb") as f:
+            return f.getnframes() / f.getframerate()
+    except (wave.Error, EOFError, OSError):
+        return None
+
+
+def load_samples(args, work_dir: str) -> list[dict]:
+    samples = []
+    for file in sorted(DEMO_DIR.glob("*.json")):
+        data = json.loads(file.read_text(encoding="utf-8"))
+        sample_id = data.get("sample_id") or file.stem
+        audio = DEMO_DIR / f"{sample_id}.wav"
+        generated = not audio.exists()
+        if generated:
+            audio = Path(work_dir) / f"{sample_id}.wav"
+            write_tone(str(audio), args.audio_seconds)
+        profile = data.get("metadata", {}).get("patient_profile", {})
+        samples.append(
+            {
+                "sample_id": sample_id,
+                "audio": str(audio),
+                "generated_audio": generated,
+                "audio_seconds": wav_seconds(str(audio)),
+                "profile": profile,
+                # fake ASR 的输出: 取画像里的第一个常见需求
+                "text": (profile.get("common_needs") or ["我想喝水"])[0],
+            }
+        )
+    if not samples:
+        raise SystemExit(f"{DEMO_DIR} 下没有演示样本")
+    return samples
+
+
+# ---------------------------------------------------------------- 替身
+
+
+def start_fake_llm(latency_ms: float, error_rate: float) -> ThreadingHTTPServer:
+    """OpenAI 兼容的假 LLM: 把 ASR 文本原样作为 refined_text, decision=accept"""
+    import random
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(latency_ms / 1000)
+            if random.random() < error_rate:
+                self.send_response(503)
+                self.end_headers()
+                return
+            text = body["messages"][-1]["content"].removeprefix("ASR文本: ")
+            content = json.dumps(
+                {
+                    "refined_text": text,
+                    "confidence": 0.9,
+                    "decision": "accept",
+                    "reason": "offline bench",
+                },
+                ensure_ascii=False,
+            )
+            data = json.dumps(
+                {"choices": [{"message": {"role": "assistant", "content": content}}]}
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def install_fake_asr(args, texts: dict[str, str]):
+    """替换 asr_whisper.transcribe: 线程里 sleep, 仍按真实路径记录 asr 耗时与音频时长"""
+    from core import asr_whisper, metrics
+
+    def transcribe(file_path: str, condition: str | None = None) -> str:
+        with metrics.timed("asr", model="fake"):
+            duration = wav_seconds(file_path)
+            metrics.set_record_value("audio_duration", duration)
+            time.sleep(args.asr_ms / 1000)
+        return texts.get(Path(file_path).stem, "我想喝水")
+
+    asr_whisper.transcribe = transcribe
+
+
+def install_fake_tts(args, template: str):
+    """替换 tts_cosy.tts_edge: 线程里 sleep 后写出一段固定音频"""
+    from core import metrics, tts_cosy
+
+    async def tts_edge(text: str, output_dir: str) -> str:
+        os.makedirs(output_dir, exist_ok=True)
+        output_path = os.path.join(output_dir, f"tts_{time.time_ns()}.wav")
+        with metrics.timed("tts", model="fake"):
+            await asyncio.to_thread(time.sleep, args.tts_ms / 1000)
+            shutil.copyfile(template, output_path)
+        return output_path
+
+    tts_cosy.tts_edge = tts_edge
+
+
+# ---------------------------------------------------------------- 内存
+
+
+class RssSampler:
+    """后台线程按间隔读取 VmRSS, 记录 with 块内的峰值 (MB)"""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+
+    @staticmethod
+    def current_mb() -> float:
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        # 非 Linux: 退化为进程生命周期内的峰值
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current_mb())
+
+    def __enter__(self):
+        self.peak = self.current_mb()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current_mb())
+
+
+# ---------------------------------------------------------------- 执行
+
+
+async def setup_database(db_url: str, samples: list[dict]):
+    from sqlalchemy import delete
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from core import database
+    from core.database import Base, User
+
+    engine = create_async_engine(db_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    database.AsyncSessionLocal.configure(bind=engine)
+
+    async with database.async_session_scope() as db:
+        user_ids = [index + 1 for index in range(len(samples))]
+        await db.execute(delete(User).where(User.id.in_(user_ids)))
+        for user_id, sample in zip(user_ids, samples):
+            profile = sample["profile"]
+            sample["user_id"] = user_id
+            db.add(
+                User(
+                    id=user_id,
+                    username=f"bench_{sample['sample_id']}",
+                    password="bench",
+                    name=profile.get("name"),
+                    age=profile.get("age"),
+                    condition=profile.get("condition"),
+                    habits=profile.get("habits"),
+                    common_needs=",".join(profile.get("common_needs") or []),
+                )
+            )
+    return engine
+
+
+async def create_records(samples: list[dict], count: int, first_id: int) -> list:
+    from core import database
+    from core.database import VoiceRecord
+    from core.storage import BUCKET_NAME
+
+    records = []
+    async with database.async_session_scope() as db:
+        for i in range(count):
+            sample = samples[i % len(samples)]
+            record_id = first_id + i
+            minio_key = f"bench/{sample['sample_id']}.wav"
+            db.add(
+                VoiceRecord(
+                    id=record_id,
+                    user_id=sample["user_id"],
+                    minio_bucket=BUCKET_NAME,
+                    minio_key=minio_key,
+                    status="uploaded",
+                )
+            )
+            records.append((record_id, minio_key, sample["user_id"]))
+    return records
+
+
+async def run_level(concurrency: int, records: list) -> dict:
+    """concurrency 个客户端闭环提交, 每条记录完成后再取下一条"""
+    from services.pipeline import process_voice_record
+
+    pending = list(reversed(records))
+    latencies, errors = [], []
+
+    async def client():
+        while pending:
+            record_id, minio_key, user_id = pending.pop()
+            started = time.perf_counter()
+            try:
+                await process_voice_record(record_id, minio_key, user_id)
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(f"{record_id}: {e}")
+
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "records": len(records),
+        "completed": len(latencies),
+        "errors": errors[:10],
+        "error_count": len(errors),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": summarize(latencies),
+        "peak_rss_mb": round(rss.peak, 1),
+    }
+
+
+async def stage_stats(record_ids: list[int]) -> dict:
+    """从 agent_record_timings 读出这批记录的分阶段耗时"""
+    from sqlalchemy import select
+
+    from core import database
+    from core.database import TIMING_FIELDS, RecordTiming
+
+    async with database.async_session_scope() as db:
+        rows = (
+            await db.execute(
+                select(RecordTiming).where(RecordTiming.record_id.in_(record_ids))
+            )
+        ).scalars().all()
+    stats = {}
+    for name in (*TIMING_FIELDS, "llm_attempts"):
+        values = [getattr(row, name) for row in rows]
+        # rtf / llm_attempts / audio_duration 不是毫秒, 原样输出
+        scale = 1.0 if name in ("rtf", "llm_attempts", "audio_duration") else 1000.0
+        summary = summarize(values, scale)
+        if summary["count"]:
+            stats[name] = summary
+    return stats
+
+
+async def main(args):
+    from core import storage
+    from core.config import settings
+    from services.pipeline import staged_pipeline
+
+    work_dir = tempfile.mkdtemp(prefix="bench_offline_")
+    samples = load_samples(args, work_dir)
+
+    # 存储替身: 把样本音频放进本地 (或内存) 存储
+    settings.STORAGE_BACKEND = args.storage
+    settings.STORAGE_LOCAL_DIR = os.path.join(work_dir, "objects")
+    for sample in samples:
+        storage.upload_file(sample["audio"], f"bench/{sample['sample_id']}.wav")
+
+    llm_server = start_fake_llm(args.llm_ms, args.llm_error_rate)
+    settings.AI_AGENT_LLM_API_URL = (
+        f"http://127.0.0.1:{llm_server.server_address[1]}/v1/chat/completions"
+    )
+    settings.AI_AGENT_LLM_API_KEY = "bench"
+    # SQLite 没有 pg_notify
+    settings.EVENTS_NOTIFY = args.db_url.startswith("postgresql")
+
+    if args.asr == "fake":
+        install_fake_asr(args, {s["sample_id"]: s["text"] for s in samples})
+    if args.tts == "fake":
+        install_fake_tts(args, samples[0]["audio"])
+
+    db_url = args.db_url or f"sqlite+aiosqlite:///{os.path.join(work_dir, 'bench.db')}"
+    engine = await setup_database(db_url, samples)
+
+    report = {
+        "config": {
+            "db_url": db_url.split("@")[-1],
+            "asr": args.asr if args.asr == "fake" else f"whisper:{settings.WHISPER_MODEL}",
+            "tts": args.tts if args.tts == "fake" else "cosyvoice",
+            "asr_ms": args.asr_ms if args.asr == "fake" else None,
+            "tts_ms": args.tts_ms if args.tts == "fake" else None,
+            "storage": args.storage,
+            "llm_ms": args.llm_ms,
+            "llm_error_rate": args.llm_error_rate,
+            "records_per_level": args.records,
+            "pipeline_workers": {
+                "asr": settings.PIPELINE_ASR_WORKERS,
+                "llm": settings.PIPELINE_LLM_WORKERS,
+                "tts": settings.PIPELINE_TTS_WORKERS,
+            },
+            "samples": [
+                {
+                    "sample_id": s["sample_id"],
+                    "audio_seconds": s["audio_seconds"],
+                    "generated_audio": s["generated_audio"],
+                }
+                for s in samples
+            ],
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "levels": [],
+    }
+
+    await staged_pipeline.start()
+    next_id = args.first_record_id
+    try:
+        if args.warmup:
+            # 模型加载、连接建立等一次性开销不计入统计
+            warmup = await create_records(samples, args.warmup, next_id)
+            next_id += args.warmup
+            started = time.perf_counter()
+            await run_level(1, warmup)
+            report["warmup_s"] = round(time.perf_counter() - started, 3)
+
+        for concurrency in args.concurrency:
+            records = await create_records(samples, args.records, next_id)
+            next_id += args.records
+            level = await run_level(concurrency, records)
+            level["stages_ms"] = await stage_stats([r[0] for r in records])
+            report["levels"].append(level)
+            print(
+                f"[Bench] 并发 {concurrency}: {level['throughput_rps']} 条/s, "
+                f"p95 {level['latency_ms'].get('p95')}ms, "
+                f"峰值 RSS {level['peak_rss_mb']}MB",
+                file=sys.stderr,
+            )
+    finally:
+        await staged_pipeline.stop()
+        llm_server.shutdown()
+        await engine.dispose()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report["max_rss_mb"] = round(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        / (1024 * 1024 if sys.platform == "darwin" else 1024),
+        1,
+    )
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--concurrency",
+        type=lambda s: [int(x) for x in s.split(",")],
+        default=[1, 2, 4, 8],
+        help="逗号分隔的并发级别",
+    )
+    parser.add_argument("--records", type=int, default=24, help="每个并发级别的记录数")
+    parser.add_argument("--warmup", type=int, default=1, help="预热记录数 (不计入统计)")
+    parser.add_argument("--asr", choices=["whisper", "fake"], default="whisper")
+    parser.add_argument("--tts", choices=["cosyvoice", "fake"], default="cosyvoice")
+    parser.add_argument("--storage", choices=["local", "memory"], default="local")
+    parser.add_argument("--asr-ms", type=float, default=300, help="fake ASR 耗时")
+    parser.add_argument("--tts-ms", type=float, default=300, help="fake TTS 耗时")
+    parser.add_argument("--llm-ms", type=float, default=500, help="假 LLM 服务的响应延迟")
+    parser.add_argument(
+        "--llm-error-rate", type=float, default=0.0, help="假 LLM 返回 503 的比例"
+    )
+    parser.add_argument(
+        "--audio-seconds", type=float, default=3.0, help="缺少演示音频时生成的时长"
+    )
+    parser.add_argument(
+        "--db-url",
+        default="",
+        help="异步数据库 URL, 默认临时 SQLite; 如 postgresql+asyncpg://u:p@localhost/bench",
+    )
+    parser.add_argument("--first-record-id", type=int, default=900000)
+    parser.add_argument("--output", default="", help="同时把 JSON 报告写入文件")
+    parser.add_argument("--keep", action="store_true", help="保留临时目录 (对象/数据库)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
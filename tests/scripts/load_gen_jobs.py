@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+任务队列突发负载生成器
+- inproc 模式: 在进程内用真实的 broker + JobWorkerPool, handler 用可配置耗时的假任务,
+  统计吞吐量与 入队->完成 延迟 p50/p95/p99 (按优先级类别分开统计)
+  --batch-ratio 混入 batch 任务, --noisy-ratio 让一部分任务来自同一个用户 (测公平性)
+- http 模式: 向运行中的 agent 突发提交 /api/agent/process, 统计接收延迟和状态码分布
+
+用法 (在仓库根目录):
+    python tests/scripts/load_gen_jobs.py --burst 500 --workers 8 --service-ms 50
+    python tests/scripts/load_gen_jobs.py --burst 300 --batch-ratio 0.7 --noisy-ratio 0.5
+    python tests/scripts/load_gen_jobs.py --broker postgres \\
+        --db-url sqlite+aiosqlite:////tmp/jobs.db --burst 200
+    python tests/scripts/load_gen_jobs.py --mode http --url http://localhost:8000 --burst 200
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+AGENT_DIR = Path(__file__).resolve().parents[2] / "ai_agent"
+sys.path.insert(0, str(AGENT_DIR))
+
+
+NOISY_USER = 999
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def report(title: str, latencies: list, elapsed: float, extra: dict | None = None):
+    latencies = sorted(latencies)
+    print("=" * 60)
+    print(title)
+    print(f"完成数: {len(latencies)}  总耗时: {elapsed:.2f}s")
+    print(f"吞吐量: {len(latencies) / elapsed:.1f} 条/s")
+    print(
+        f"延迟: p50={percentile(latencies, 0.50) * 1000:.1f}ms "
+        f"p95={percentile(latencies, 0.95) * 1000:.1f}ms "
+        f"p99={percentile(latencies, 0.99) * 1000:.1f}ms "
+        f"max={latencies[-1] * 1000 if latencies else 0:.1f}ms"
+    )
+    for key, value in (extra or {}).items():
+        print(f"{key}: {value}")
+    print("=" * 60)
+
+
+async def run_inproc(args):
+    from sqlalchemy import create_engine
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    from core.config import settings
+    from core.database import AGENT_TABLES, Base
+    from services import job_queue
+
+    settings.JOB_RETRY_BASE_DELAY = args.retry_delay
+    settings.JOB_PRIORITY_AGING = args.aging
+    settings.JOB_MAX_RUNNING_PER_USER = args.per_user_cap
+
+    if args.broker == "memory":
+        broker = job_queue.InMemoryJobBroker()
+    else:
+        db_url = args.db_url or settings.ASYNC_DATABASE_URL
+        if db_url.startswith("sqlite"):
+            sync_url = db_url.replace("+aiosqlite", "")
+            Base.metadata.create_all(create_engine(sync_url), tables=AGENT_TABLES)
+        broker = job_queue.PostgresJobBroker(
+            async_sessionmaker(create_async_engine(db_url), expire_on_commit=False)
+        )
+
+    enqueued_at: dict[int, float] = {}
+    latencies: dict[str, list[float]] = {"interactive": [], "batch": []}
+    noisy_latencies: list[float] = []
+    failures = Counter()
+    all_done = asyncio.Event()
+    finished = Counter()
+
+    def finish():
+        # 成功或重试次数用尽都算处理结束
+        finished["n"] += 1
+        if finished["n"] >= args.burst:
+            all_done.set()
+
+    async def handler(job):
+        service = args.service_ms / 1000 * random.uniform(0.5, 1.5)
+        if args.cpu_bound:
+            # 模拟 Whisper/CosyVoice 这类占用线程池的 CPU 任务
+            await asyncio.to_thread(time.sleep, service)
+        else:
+            await asyncio.sleep(service)
+        if random.random() < args.fail_rate:
+            failures[job.attempts] += 1
+            if job.attempts >= job.max_attempts:
+                finish()
+            raise RuntimeError("模拟失败")
+        latency = time.perf_counter() - enqueued_at[job.id]
+        latencies["batch" if job.priority else "interactive"].append(latency)
+        if job.user_id == NOISY_USER:
+            noisy_latencies.append(latency)
+        finish()
+
+    pool = job_queue.JobWorkerPool(
+        broker, handler, workers=args.workers, poll_interval=0.05
+    )
+    await pool.start()
+
+    start = time.perf_counter()
+    for i in range(args.burst):
+        user_id = NOISY_USER if random.random() < args.noisy_ratio else i % 20
+        priority = job_queue.priority_rank(
+            "batch" if random.random() < args.batch_ratio else "interactive"
+        )
+        job = await broker.enqueue(100000 + i, user_id, f"loadgen/{i}.wav", priority)
+        enqueued_at[job.id] = time.perf_counter()
+        pool.notify()
+
+    try:
+        await asyncio.wait_for(all_done.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        print(f"[警告] {args.timeout}s 内未全部完成")
+    elapsed = time.perf_counter() - start
+    await pool.stop()
+
+    title = (
+        f"inproc | broker={args.broker} workers={args.workers} burst={args.burst} "
+        f"service≈{args.service_ms}ms aging={args.aging}s cap={args.per_user_cap}"
+    )
+    report(
+        title,
+        latencies["interactive"] + latencies["batch"],
+        elapsed,
+        {"失败次数(按第几次尝试)": dict(failures), "剩余排队": await broker.depth()},
+    )
+    for name, values in latencies.items():
+        if values:
+            report(f"  {name}", values, elapsed)
+    if noisy_latencies:
+        report(f"  noisy user {NOISY_USER}", noisy_latencies, elapsed)
+
+
+def run_http(args):
+    import requests
+
+    def post(i: int):
+        start = time.perf_counter()
+        try:
+            resp = requests.post(
+                f"{args.url}/api/agent/process",
+                json={
+                    "record_id": 100000 + i,
+                    "user_id": i % 20,
+                    "minio_key": f"loadgen/{i}.wav",
+                },
+                timeout=30,
+            )
+            code = resp.status_code
+        except requests.RequestException as e:
+            code = type(e).__name__
+        return time.perf_counter() - start, code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(post, range(args.burst)))
+    elapsed = time.perf_counter() - start
+
+    report(
+        f"http | {args.url} burst={args.burst} concurrency={args.concurrency}",
+        [latency for latency, _ in results],
+        elapsed,
+        {"状态码": dict(Counter(code for _, code in results))},
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="任务队列突发负载生成器")
+    parser.add_argument("--mode", choices=["inproc", "http"], default="inproc")
+    parser.add_argument("--burst", type=int, default=200, help="突发任务数")
+    parser.add_argument("--broker", choices=["memory", "postgres"], default="memory")
+    parser.add_argument("--db-url", default="", help="postgres broker 的异步连接 URL")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--service-ms", type=float, default=50, help="单任务平均耗时")
+    parser.add_argument("--cpu-bound", action="store_true", help="任务放到线程池执行")
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--retry-delay", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--batch-ratio", type=float, default=0.0, help="batch 任务占比")
+    parser.add_argument(
+        "--noisy-ratio", type=float, default=0.0, help="来自同一用户的任务占比"
+    )
+    parser.add_argument("--aging", type=float, default=30, help="优先级老化秒数")
+    parser.add_argument(
+        "--per-user-cap", type=int, default=2, help="每用户并发上限, 0 不限"
+    )
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.mode == "http":
+        run_http(args)
+    else:
+        asyncio.run(run_inproc(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+事件循环延迟压测: 同步数据库调用 vs 异步数据库调用
+模拟 N 条记录并发跑流水线的数据库调用序列 (ASR/LLM/TTS 用 asyncio.sleep 代替),
+同时用一个探针协程每 10ms 醒一次, 统计它实际醒来比预期晚多少 (事件循环延迟)
+
+用法 (在仓库根目录, 默认连接 .env 中的 Postgres):
+    python tests/scripts/load_test_event_loop_lag.py --records 50
+    # 本地无 Postgres 时可用 SQLite 走通流程
+    python tests/scripts/load_test_event_loop_lag.py \\
+        --sync-url sqlite:////tmp/lag.db --async-url sqlite+aiosqlite:////tmp/lag.db
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+AGENT_DIR = Path(__file__).resolve().parents[2] / "ai_agent"
+sys.path.insert(0, str(AGENT_DIR))
+
+from sqlalchemy import create_engine, delete  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from core.config import settings  # noqa: E402
+from core.database import (  # noqa: E402
+    AnalysisResult,
+    Base,
+    update_record_status,
+    get_user_profile,
+    finish_record,
+    update_record_status_async,
+    get_user_profile_async,
+    finish_record_async,
+)
+
+PROBE_INTERVAL = 0.01  # 探针间隔 10ms
+STAGE_SLEEP = 0.05  # 模拟 ASR/LLM/TTS 每阶段耗时 (await, 不阻塞循环)
+
+ANALYSIS = dict(
+    asr_text="水 喝",
+    refined_text="我想喝水",
+    response_text="好的，我想喝水",
+    confidence=0.92,
+    decision="accept",
+    tts_url="/minio-api/voicebridge/tts/loadtest.wav",
+)
+
+
+async def probe(samples: list, stop: asyncio.Event):
+    """事件循环延迟探针"""
+    while not stop.is_set():
+        expected = time.perf_counter() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+async def record_sync(session_factory, record_id: int, user_id: int):
+    """旧路径: 在事件循环里直接调用同步数据库函数"""
+    with session_factory() as db:
+        update_record_status(db, record_id, "processing_asr")
+    await asyncio.sleep(STAGE_SLEEP)
+    with session_factory() as db:
+        get_user_profile(db, user_id)
+        update_record_status(db, record_id, "processing_llm", raw_text="水 喝")
+    await asyncio.sleep(STAGE_SLEEP)
+    with session_factory() as db:
+        update_record_status(db, record_id, "processing_tts", decision="accept")
+    await asyncio.sleep(STAGE_SLEEP)
+    with session_factory() as db:
+        finish_record(db, record_id, **ANALYSIS)
+
+
+async def record_async(session_factory, record_id: int, user_id: int):
+    """新路径: 异步引擎"""
+    async with session_factory() as db:
+        await update_record_status_async(db, record_id, "processing_asr")
+    await asyncio.sleep(STAGE_SLEEP)
+    async with session_factory() as db:
+        await get_user_profile_async(db, user_id)
+        await update_record_status_async(
+            db, record_id, "processing_llm", raw_text="水 喝"
+        )
+    await asyncio.sleep(STAGE_SLEEP)
+    async with session_factory() as db:
+        await update_record_status_async(
+            db, record_id, "processing_tts", decision="accept"
+        )
+    await asyncio.sleep(STAGE_SLEEP)
+    async with session_factory() as db:
+        await finish_record_async(db, record_id, **ANALYSIS)
+
+
+async def run(mode: str, session_factory, records: int) -> dict:
+    samples: list[float] = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(samples, stop))
+    worker = record_sync if mode == "sync" else record_async
+
+    start = time.perf_counter()
+    # 使用负数 record_id, 不会命中真实记录, 结束后清理 analysis_results
+    await asyncio.gather(
+        *(worker(session_factory, -i, -1) for i in range(1, records + 1))
+    )
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await probe_task
+    samples.sort()
+    return {
+        "mode": mode,
+        "elapsed_s": round(elapsed, 3),
+        "lag_p50_ms": round(statistics.median(samples) * 1000, 2),
+        "lag_p99_ms": round(samples[int(len(samples) * 0.99) - 1] * 1000, 2),
+        "lag_max_ms": round(samples[-1] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="事件循环延迟压测")
+    parser.add_argument("--records", type=int, default=50, help="并发记录数")
+    parser.add_argument("--sync-url", default=settings.DATABASE_URL)
+    parser.add_argument("--async-url", default=settings.ASYNC_DATABASE_URL)
+    args = parser.parse_args()
+
+    sync_engine = create_engine(args.sync_url, pool_size=args.records)
+    if sync_engine.dialect.name == "sqlite":
+        Base.metadata.create_all(sync_engine)
+    async_engine = create_async_engine(args.async_url, pool_size=args.records)
+
+    results = [
+        asyncio.run(run("sync", sessionmaker(bind=sync_engine), args.records)),
+        asyncio.run(run("async", async_sessionmaker(async_engine), args.records)),
+    ]
+
+    with sessionmaker(bind=sync_engine)() as db:
+        db.execute(delete(AnalysisResult).where(AnalysisResult.voice_record_id < 0))
+        db.commit()
+
+    print("=" * 60)
+    print(f"并发记录数: {args.records}")
+    for r in results:
+        print(
+            f"{r['mode']:>5}: 总耗时 {r['elapsed_s']}s | 事件循环延迟 "
+            f"p50={r['lag_p50_ms']}ms p99={r['lag_p99_ms']}ms max={r['lag_max_ms']}ms"
+        )
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+分阶段流水线压测: 顺序执行 vs 分阶段 worker 池
+ASR/TTS 用线程池里的 time.sleep 模拟 (占用线程, 类似 Whisper/CosyVoice),
+LLM 用 asyncio.sleep 模拟 (只等网络); 输出吞吐量、端到端延迟和各阶段利用率/排队延迟
+
+用法 (在仓库根目录, 不需要数据库和模型):
+    python tests/scripts/load_test_staged_pipeline.py --records 40 \\
+        --asr-ms 200 --llm-ms 600 --tts-ms 200
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+AGENT_DIR = Path(__file__).resolve().parents[2] / "ai_agent"
+sys.path.insert(0, str(AGENT_DIR))
+
+from services.stages import Stage, StagedPipeline  # noqa: E402
+
+# CPU 阶段共享一把锁, 模拟单核上 ASR 与 TTS 互相抢占 (--cpu-lock)
+CPU_LOCK = threading.Lock()
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, int(round(p * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def make_handlers(args):
+    def cpu_work(seconds: float):
+        if args.cpu_lock:
+            with CPU_LOCK:
+                time.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    async def asr(item):
+        await asyncio.to_thread(cpu_work, args.asr_ms / 1000)
+
+    async def llm(item):
+        await asyncio.sleep(args.llm_ms / 1000)
+
+    async def tts(item):
+        await asyncio.to_thread(cpu_work, args.tts_ms / 1000)
+        return item
+
+    return asr, llm, tts
+
+
+async def run(mode: str, args) -> dict:
+    asr, llm, tts = make_handlers(args)
+    pipeline = StagedPipeline(
+        [
+            Stage("asr", asr, args.asr_workers, args.queue_size),
+            Stage("llm", llm, args.llm_workers, args.queue_size),
+            Stage("tts", tts, args.tts_workers, args.queue_size),
+        ]
+    )
+    if mode == "staged":
+        await pipeline.start()
+        concurrency = args.in_flight
+    else:
+        # 旧路径: 每个 job worker 顺序跑完一条记录的三个阶段
+        concurrency = args.sequential_workers
+
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with slots:
+            start = time.perf_counter()
+            if mode == "staged":
+                await pipeline.submit(i)
+            else:
+                await pipeline.run_inline(i)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.records)))
+    elapsed = time.perf_counter() - start
+    stats = pipeline.stats()
+    if mode == "staged":
+        await pipeline.stop()
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_per_s": round(args.records / elapsed, 2),
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "stages": stats["stages"] if mode == "staged" else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分阶段流水线压测")
+    parser.add_argument("--records", type=int, default=40)
+    parser.add_argument("--asr-ms", type=float, default=200)
+    parser.add_argument("--llm-ms", type=float, default=600)
+    parser.add_argument("--tts-ms", type=float, default=200)
+    parser.add_argument("--asr-workers", type=int, default=1)
+    parser.add_argument("--llm-workers", type=int, default=4)
+    parser.add_argument("--tts-workers", type=int, default=1)
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--in-flight", type=int, default=4, help="流水线中的记录数上限")
+    parser.add_argument(
+        "--sequential-workers", type=int, default=2, help="顺序模式的并发记录数"
+    )
+    parser.add_argument("--cpu-lock", action="store_true", help="ASR/TTS 共用一个 CPU")
+    args = parser.parse_args()
+
+    for mode in ("sequential", "staged"):
+        result = asyncio.run(run(mode, args))
+        stages = result.pop("stages")
+        print(json.dumps(result, ensure_ascii=False))
+        for name, stage in (stages or {}).items():
+            print(f"  {name}: {json.dumps(stage, ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
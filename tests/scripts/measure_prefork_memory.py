@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+多 worker 部署的内存测量: prefork.py (主进程加载模型, fork 共享) vs uvicorn --workers (各自加载)
+对每个 worker 数启动一次服务, /health 可用并等待 --settle 秒后读取进程树中每个进程的
+/proc/<pid>/smaps_rollup (仅 Linux):
+- rss: 常驻内存, 共享页在每个进程里都算一次, 直接相加会高估
+- pss: 共享页按共享进程数均摊, 所有进程 PSS 之和即整组进程实际占用的物理内存
+- private: 进程独占的页 (写时复制后被改写的页也在这里)
+
+两种模式都在启动时加载模型 (uvicorn 模式设置 PRELOAD_MODELS=true), 结果可直接对比
+
+用法 (在仓库根目录, 需要模型可用):
+    python tests/scripts/measure_prefork_memory.py --workers 1,2,4,8
+    python tests/scripts/measure_prefork_memory.py --mode uvicorn --workers 1,2,4
+    python tests/scripts/measure_prefork_memory.py --workers 2 --no-preload  # 不加载模型, 只测框架
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+AGENT_DIR = Path(__file__).resolve().parents[2] / "ai_agent"
+
+
+def descendants(pid: int) -> list[int]:
+    result = []
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except FileNotFoundError:
+        return result
+    for tid in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                children = [int(c) for c in f.read().split()]
+        except FileNotFoundError:
+            continue
+        for child in children:
+            result.append(child)
+            result.extend(descendants(child))
+    return result
+
+
+def smaps_rollup(pid: int) -> dict:
+    """单位 MB"""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": round(fields.get("Rss", 0), 1),
+        "pss": round(fields.get("Pss", 0), 1),
+        "shared": round(
+            fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0), 1
+        ),
+        "private": round(
+            fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0), 1
+        ),
+    }
+
+
+def wait_healthy(url: str, proc: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"服务提前退出 (code={proc.returncode})")
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                if resp.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"{timeout}s 内 {url} 未就绪")
+
+
+def measure(mode: str, workers: int, args) -> dict:
+    env = dict(os.environ)
+    if mode == "prefork":
+        cmd = [
+            sys.executable,
+            "prefork.py",
+            "--workers",
+            str(workers),
+            "--port",
+            str(args.port),
+        ]
+        if args.no_preload:
+            cmd.append("--no-preload")
+        env["PRELOAD_MODELS"] = "false"
+    else:
+        cmd = [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--port",
+            str(args.port),
+            "--workers",
+            str(workers),
+        ]
+        env["PRELOAD_MODELS"] = "false" if args.no_preload else "true"
+
+    log = open(args.log, "ab") if args.log else subprocess.DEVNULL
+    proc = subprocess.Popen(cmd, cwd=AGENT_DIR, env=env, stdout=log, stderr=log)
+    try:
+        wait_healthy(f"http://127.0.0.1:{args.port}/health", proc, args.timeout)
+        time.sleep(args.settle)
+        children = descendants(proc.pid)
+        processes = {}
+        for pid in [proc.pid, *children]:
+            try:
+                processes[pid] = smaps_rollup(pid)
+            except (FileNotFoundError, ProcessLookupError):
+                continue
+        return {
+            "mode": mode,
+            "workers": workers,
+            "processes": processes,
+            "total_rss_mb": round(sum(p["rss"] for p in processes.values()), 1),
+            "total_pss_mb": round(sum(p["pss"] for p in processes.values()), 1),
+            # uvicorn 单 worker 时没有子进程, 主进程即 worker
+            "max_worker_rss_mb": max(
+                (
+                    processes[pid]["rss"]
+                    for pid in children or [proc.pid]
+                    if pid in processes
+                ),
+                default=0.0,
+            ),
+        }
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        if log is not subprocess.DEVNULL:
+            log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多 worker 部署内存测量")
+    parser.add_argument(
+        "--workers",
+        type=lambda s: [int(x) for x in s.split(",")],
+        default=[1, 2, 4, 8],
+    )
+    parser.add_argument(
+        "--mode", choices=["prefork", "uvicorn", "both"], default="both"
+    )
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--settle", type=float, default=5, help="就绪后等待的秒数")
+    parser.add_argument("--timeout", type=float, default=600, help="等待就绪的上限")
+    parser.add_argument("--no-preload", action="store_true", help="不加载模型")
+    parser.add_argument("--log", default="", help="服务输出追加到该文件")
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    modes = ["prefork", "uvicorn"] if args.mode == "both" else [args.mode]
+    results = []
+    for mode in modes:
+        for workers in args.workers:
+            result = measure(mode, workers, args)
+            results.append(result)
+            print(
+                f"[Memory] {mode} x{workers}: PSS 合计 {result['total_pss_mb']}MB, "
+                f"RSS 合计 {result['total_rss_mb']}MB, "
+                f"单 worker RSS {result['max_worker_rss_mb']}MB",
+                file=sys.stderr,
+            )
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
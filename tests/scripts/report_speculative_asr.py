@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+两档推测式 ASR 报告 (ASR_MODE=speculative): 在 demo 数据集上估算混合延迟与升级比例
+每个片段分别用小模型 (ASR_FAST_MODEL) 与大模型 (ASR_ACCURATE_MODEL) 各解码一次, 由此推出三种策略:
+- fast: 只用小模型
+- accurate: 只用大模型 (对照)
+- speculative: 先用小模型, 未通过 asr_whisper.is_confident 时再用大模型, 耗时为两者之和
+输出每种策略的每片段延迟 (mean / p50 / p95)、升级比例; 有 .cha 转写时另算字符错误率 (CER),
+没有时以大模型输出为参照计算 speculative 与 fast 的一致程度
+
+片段: 样本 JSON 中带时间戳的话语 (--speaker 过滤说话人, 如 PAR); 没有时间戳时整段音频作为一个片段
+门限可用 ASR_ESCALATE_LOGPROB / ASR_ESCALATE_NO_SPEECH 环境变量或 --logprob / --no-speech 调整
+
+用法 (在仓库根目录, 需要 whisper、ffmpeg 与 demo 音频):
+    python tests/scripts/report_speculative_asr.py --fast base --accurate small --speaker PAR
+    python tests/scripts/report_speculative_asr.py --video-dir data_pipeline/assets/video --output report.json
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+AGENT_DIR = ROOT / "ai_agent"
+
+SAMPLE_RATE = 16000
+
+# CHAT 转写里的标注: [...] 注释、&-uh 之类的填充词、xxx 不可辨识词、@ 后缀
+CHAT_ANNOTATION = re.compile(r"\[[^\]]*\]|&\S+|\b(?:xxx|yyy|www)\b|@\S+|\(\.+\)")
+NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize(text: str) -> str:
+    text = CHAT_ANNOTATION.sub(" ", text.lower())
+    return NON_WORD.sub("", text).replace("_", "")
+
+
+def edit_distance(a: str, b: str) -> int:
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(
+                min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            )
+        previous = current
+    return previous[-1]
+
+
+def cer(hypotheses: list[str], references: list[str]) -> float | None:
+    """字符错误率 (英文去掉空格后按字符计), 参照为空的片段不计"""
+    errors = chars = 0
+    for hypothesis, reference in zip(hypotheses, references):
+        reference = normalize(reference)
+        if not reference:
+            continue
+        errors += edit_distance(normalize(hypothesis), reference)
+        chars += len(reference)
+    return round(errors / chars, 4) if chars else None
+
+
+def load_clips(args) -> list[dict]:
+    """[{sample_id, start_ms, audio, reference}], audio 为 16kHz float32 数组"""
+    import whisper
+
+    from data_pipeline.loaders import DemoLoader
+
+    loader = DemoLoader(args.data_dir, video_dir=args.video_dir or None)
+    clips = []
+    for sample in loader:
+        audio = whisper.load_audio(str(sample.audio_path))
+        timed = [
+            u
+            for u in sample.transcript
+            if u.get("start_ms") is not None
+            and u.get("end_ms") is not None
+            and (not args.speaker or u.get("speaker") == args.speaker)
+            and u["end_ms"] - u["start_ms"] >= args.min_ms
+        ]
+        if not timed:
+            clips.append(
+                {
+                    "sample_id": sample.sample_id,
+                    "start_ms": 0,
+                    "audio": audio,
+                    "reference": None,
+                }
+            )
+            continue
+        for utterance in timed:
+            start = utterance["start_ms"] * SAMPLE_RATE // 1000
+            end = utterance["end_ms"] * SAMPLE_RATE // 1000
+            clips.append(
+                {
+                    "sample_id": sample.sample_id,
+                    "start_ms": utterance["start_ms"],
+                    "audio": audio[start:end],
+                    "reference": utterance.get("text", ""),
+                }
+            )
+    return clips[: args.max_clips] if args.max_clips else clips
+
+
+def decode(model, audio) -> tuple[dict, float]:
+    started = time.perf_counter()
+    result = model.transcribe(audio, fp16=False)
+    return result, time.perf_counter() - started
+
+
+def latency(values: list[float]) -> dict:
+    ordered = sorted(values)
+    return {
+        "mean_s": round(statistics.fmean(ordered), 3),
+        "p50_s": round(ordered[len(ordered) // 2], 3),
+        "p95_s": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "total_s": round(sum(ordered), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="两档推测式 ASR 报告")
+    parser.add_argument("--data-dir", default=str(AGENT_DIR / "data" / "demo"))
+    parser.add_argument("--video-dir", default="", help="缺少 WAV 时从这里转码 MP4")
+    parser.add_argument("--fast", default="", help="小模型, 默认 ASR_FAST_MODEL")
+    parser.add_argument("--accurate", default="", help="大模型, 默认 ASR_ACCURATE_MODEL")
+    parser.add_argument("--speaker", default="", help="只取该说话人的话语, 如 PAR")
+    parser.add_argument("--min-ms", type=int, default=300, help="忽略更短的话语")
+    parser.add_argument("--max-clips", type=int, default=0)
+    parser.add_argument("--logprob", type=float, default=None)
+    parser.add_argument("--no-speech", type=float, default=None)
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    # 门限在导入 config 之前写入环境变量
+    if args.logprob is not None:
+        os.environ["ASR_ESCALATE_LOGPROB"] = str(args.logprob)
+    if args.no_speech is not None:
+        os.environ["ASR_ESCALATE_NO_SPEECH"] = str(args.no_speech)
+    sys.path[:0] = [str(AGENT_DIR), str(ROOT)]
+    from core import asr_whisper
+    from core.config import settings
+
+    fast_name = args.fast or settings.ASR_FAST_MODEL
+    accurate_name = args.accurate or settings.ASR_ACCURATE_MODEL
+    clips = load_clips(args)
+    if not clips:
+        sys.exit(f"{args.data_dir} 下没有可用的音频 (可用 --video-dir 从 MP4 转码)")
+
+    fast = asr_whisper._load(fast_name)
+    accurate = asr_whisper._load(accurate_name)
+    # 预热: 首次推理的初始化开销不计入
+    decode(fast, clips[0]["audio"])
+    decode(accurate, clips[0]["audio"])
+
+    rows = []
+    for index, clip in enumerate(clips, 1):
+        fast_result, fast_s = decode(fast, clip["audio"])
+        accurate_result, accurate_s = decode(accurate, clip["audio"])
+        escalated = not asr_whisper.is_confident(fast_result)
+        rows.append(
+            {
+                "sample_id": clip["sample_id"],
+                "start_ms": clip["start_ms"],
+                "audio_s": round(len(clip["audio"]) / SAMPLE_RATE, 2),
+                "fast_s": fast_s,
+                "accurate_s": accurate_s,
+                "escalated": escalated,
+                "confidence": asr_whisper.confidence(fast_result),
+                "reference": clip["reference"],
+                "fast_text": fast_result["text"].strip(),
+                "accurate_text": accurate_result["text"].strip(),
+            }
+        )
+        print(
+            f"[{index}/{len(clips)}] {clip['sample_id']}@{clip['start_ms']}ms "
+            f"fast {fast_s:.2f}s accurate {accurate_s:.2f}s "
+            f"{'升级' if escalated else '通过'}",
+            file=sys.stderr,
+        )
+
+    def speculative_text(row):
+        return row["accurate_text"] if row["escalated"] else row["fast_text"]
+
+    strategies = {
+        "fast": ([r["fast_s"] for r in rows], [r["fast_text"] for r in rows]),
+        "accurate": (
+            [r["accurate_s"] for r in rows],
+            [r["accurate_text"] for r in rows],
+        ),
+        "speculative": (
+            [r["fast_s"] + (r["accurate_s"] if r["escalated"] else 0) for r in rows],
+            [speculative_text(r) for r in rows],
+        ),
+    }
+    with_reference = [r for r in rows if r["reference"]]
+    accurate_texts = [r["accurate_text"] for r in rows]
+    report = {
+        "fast_model": fast_name,
+        "accurate_model": accurate_name,
+        "thresholds": {
+            "logprob": settings.ASR_ESCALATE_LOGPROB,
+            "no_speech": settings.ASR_ESCALATE_NO_SPEECH,
+        },
+        "clips": len(rows),
+        "audio_s": round(sum(r["audio_s"] for r in rows), 1),
+        "escalated_fraction": round(sum(r["escalated"] for r in rows) / len(rows), 3),
+        "strategies": {},
+    }
+    for name, (latencies, texts) in strategies.items():
+        report["strategies"][name] = {
+            "latency": latency(latencies),
+            # 以大模型输出为参照的差异 (accurate 自身为 0)
+            "cer_vs_accurate": cer(texts, accurate_texts),
+        }
+        if with_reference:
+            references = [r["reference"] or "" for r in rows]
+            report["strategies"][name]["cer_vs_reference"] = cer(texts, references)
+    accurate_mean = report["strategies"]["accurate"]["latency"]["mean_s"]
+    if accurate_mean:
+        report["speculative_speedup_vs_accurate"] = round(
+            accurate_mean / report["strategies"]["speculative"]["latency"]["mean_s"], 2
+        )
+    report["rows"] = [
+        {**r, "fast_s": round(r["fast_s"], 3), "accurate_s": round(r["accurate_s"], 3)}
+        for r in rows
+    ]
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+任务队列: 最后一次执行时 worker 崩溃 (租约过期且重试次数已用尽) 的任务
+- claim 不会再抢这类任务, 它一直停在 running, 占着去重索引 uq_agent_jobs_active_record
+- 检查: 重复提交不会挂到这个任务上, 而是结束它并新建任务
+- 检查: JobWorkerPool 的定期清理把它标记为 failed, 并通过 on_expired 回调交出 record_id
+
+用法 (在仓库根目录):
+    python tests/scripts/test_job_expiry.py
+    python tests/scripts/test_job_expiry.py --broker postgres --db-url sqlite+aiosqlite:////tmp/expiry.db
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+AGENT_DIR = Path(__file__).resolve().parents[2] / "ai_agent"
+sys.path.insert(0, str(AGENT_DIR))
+
+
+def create_broker(args):
+    from sqlalchemy import create_engine
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    from core.config import settings
+    from core.database import AGENT_TABLES, Base
+    from services import job_queue
+
+    if args.broker == "memory":
+        return job_queue.InMemoryJobBroker()
+    db_url = args.db_url or settings.ASYNC_DATABASE_URL
+    if db_url.startswith("sqlite"):
+        sync_url = db_url.replace("+aiosqlite", "")
+        engine = create_engine(sync_url)
+        Base.metadata.drop_all(engine, tables=AGENT_TABLES)
+        Base.metadata.create_all(engine, tables=AGENT_TABLES)
+    return job_queue.PostgresJobBroker(
+        async_sessionmaker(create_async_engine(db_url), expire_on_commit=False)
+    )
+
+
+async def crash_last_attempt(broker, job):
+    """模拟 worker 在最后一次执行中途崩溃: 重试次数用尽, 租约已过期"""
+    from sqlalchemy import update
+
+    from core.database import AgentJob
+
+    past = datetime.utcnow() - timedelta(seconds=1)
+    if hasattr(broker, "_jobs"):
+        broker._jobs[job.id].update(
+            attempts=job.max_attempts, locked_until=past, locked_by="crashed"
+        )
+        return
+    async with broker._session_factory() as db:
+        await db.execute(
+            update(AgentJob)
+            .where(AgentJob.id == job.id)
+            .values(attempts=job.max_attempts, locked_until=past, locked_by="crashed")
+        )
+        await db.commit()
+
+
+async def run(args) -> list[str]:
+    from services import job_queue
+
+    broker = create_broker(args)
+    failures = []
+
+    # 1. 去重: 僵死任务不能挡住重复提交
+    job = await broker.enqueue(1, 1, "expiry/1.wav")
+    claimed = await broker.claim("worker-a")
+    if [j.id for j in claimed] != [job.id]:
+        failures.append(f"应抢到任务 {job.id}, 实际 {[j.id for j in claimed]}")
+    await crash_last_attempt(broker, job)
+    if await broker.claim("worker-b"):
+        failures.append("重试次数已用尽的任务不应再被抢")
+    again = await broker.enqueue(1, 1, "expiry/1.wav")
+    if again.deduplicated or again.id == job.id:
+        failures.append(f"重复提交挂到了僵死任务 {job.id} 上")
+    claimed = await broker.claim("worker-c")
+    if [j.id for j in claimed] != [again.id]:
+        failures.append(f"新任务 {again.id} 应可被抢, 实际 {[j.id for j in claimed]}")
+
+    # 2. 定期清理: 标记为 failed 并回调 record_id
+    zombie = await broker.enqueue(2, 2, "expiry/2.wav")
+    await broker.claim("worker-d")
+    await crash_last_attempt(broker, zombie)
+    expired = []
+
+    async def on_expired(record_ids):
+        expired.extend(record_ids)
+
+    pool = job_queue.JobWorkerPool(
+        broker, lambda job: asyncio.sleep(0), workers=0, on_expired=on_expired
+    )
+    await pool._expire()
+    if expired != [2]:
+        failures.append(f"on_expired 应收到 [2], 实际 {expired}")
+    if await broker.expire():
+        failures.append("已标记为 failed 的任务不应再次过期")
+    fresh = await broker.enqueue(2, 2, "expiry/2.wav")
+    if fresh.deduplicated:
+        failures.append("清理后重复提交仍被去重")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="过期且重试用尽的任务不阻塞去重")
+    parser.add_argument("--broker", choices=["memory", "postgres"], default="memory")
+    parser.add_argument("--db-url", default="", help="postgres broker 的异步连接 URL")
+    args = parser.parse_args()
+    os.chdir(AGENT_DIR)
+
+    failures = asyncio.run(run(args))
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"✅ broker={args.broker}: 过期任务被结束, 去重不受影响")
+
+
+if __name__ == "__main__":
+    main()